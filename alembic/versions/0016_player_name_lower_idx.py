@@ -0,0 +1,31 @@
+"""Add lower(player_name) index for player search.
+
+Revision ID: 0016_player_name_lower_idx
+Revises: 0015_clan_rank_snap
+Create Date: 2026-10-17 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0016_player_name_lower_idx"
+down_revision = "0015_clan_rank_snap"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_player_participation_lower_name",
+        "player_participation",
+        [sa.text("lower(player_name)")],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_player_participation_lower_name",
+        table_name="player_participation",
+    )
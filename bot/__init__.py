@@ -1,5 +1,17 @@
 """Bot package initialization."""
 
-from bot.handlers import router, moderation_router
+from bot.handlers import (
+    command_router,
+    moderation_router,
+    modlog_flush_task,
+    router,
+    shutdown_chart_executor,
+)
 
-__all__ = ["router", "moderation_router"]
+__all__ = [
+    "router",
+    "moderation_router",
+    "command_router",
+    "modlog_flush_task",
+    "shutdown_chart_executor",
+]
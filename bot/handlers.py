@@ -1,13 +1,21 @@
 ﻿"""Telegram bot command handlers using aiogram v3."""
 
 import asyncio
+import functools
 import inspect
+import itertools
 import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
 
 from aiogram import Bot, F, Router
 from aiogram.enums import ChatMemberStatus, ChatType, MessageEntityType
-from aiogram.filters import BaseFilter, Command
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.filters import BaseFilter, Command, CommandObject
 from aiogram.types import (
     CallbackQuery,
     ChatMemberUpdated,
@@ -53,27 +61,27 @@ from config import (
     WARN_RESET_AFTER_MUTE,
     WELCOME_RULES_MESSAGE_LINK,
 )
-from i18n import DEFAULT_LANG, t
+from i18n import DEFAULT_LANG, get_formatter, t
 from cr_api import ClashRoyaleAPIError, get_api_client
 from db import (
     count_pending_applications,
     create_fresh_captcha_challenge,
     create_application,
     delete_verified_user,
-    delete_user_link,
-    delete_user_link_request,
+    delete_user_link_and_request,
     expire_active_challenges,
     get_chat_settings,
     get_app_state,
+    get_app_state_and_link_request,
     get_application_by_id,
     get_captcha_question,
+    get_captcha_status,
     get_current_member_tags,
     get_current_members_snapshot,
     get_enabled_clan_chats,
     get_user_language,
     get_first_seen_time,
     get_last_rejected_time_for_user,
-    get_latest_challenge,
     get_pending_application_for_user,
     get_or_create_pending_challenge,
     get_pending_challenge,
@@ -87,8 +95,7 @@ from db import (
     schedule_unmute_notification,
     mark_challenge_expired,
     mark_challenge_failed,
-    mark_challenge_passed,
-    mark_pending_challenges_passed,
+    mark_challenge_passed_and_verify,
     list_pending_applications,
     get_player_name_for_tag,
     get_challenge_by_id,
@@ -102,14 +109,15 @@ from db import (
     set_application_status,
     set_user_penalty,
     clear_user_penalty,
-    set_user_verified,
     set_user_language,
     touch_last_reminded_at,
     update_application_tag,
     mark_application_invited,
+    update_challenge_message_and_reminded,
     update_challenge_message_id,
+    verify_user_and_pass_challenges,
     upsert_clan_chat,
-    upsert_user_link,
+    link_user_and_clear_request,
     upsert_user_link_request,
     delete_app_state,
     set_app_state,
@@ -139,6 +147,7 @@ logger.info("MODLOG_CHAT_ID loaded as %r", MODLOG_CHAT_ID)
 # Create router for handlers
 router = Router(name="main_handlers")
 moderation_router = Router(name="moderation_router")
+command_router = Router(name="command_handlers")
 
 from moderation_middleware import ModerationPolicyMiddleware
 
@@ -146,7 +155,89 @@ moderation_router.message.middleware(ModerationPolicyMiddleware())
 
 HEADER_LINE = "\u2550" * 30
 DIVIDER_LINE = "---------------------------"
+_GROUP_CHAT_TYPES = frozenset({ChatType.GROUP, ChatType.SUPERGROUP})
+_LOCKED_PERMS = ChatPermissions(
+    can_send_messages=False,
+    can_send_media_messages=False,
+    can_send_other_messages=False,
+    can_add_web_page_previews=False,
+)
+_UNLOCKED_PERMS = ChatPermissions(
+    can_send_messages=True,
+    can_send_media_messages=True,
+    can_send_other_messages=True,
+    can_add_web_page_previews=True,
+)
 _FLOOD_RATE_CACHE: dict[tuple[int, int], dict[str, object]] = {}
+_TTL_CACHE_MAX_ENTRIES = 10_000
+ADMIN_STATUS_CACHE_TTL_SECONDS = 300
+_ADMIN_STATUS_CACHE: dict[tuple[int, int], tuple[bool, float]] = {}
+TELEGRAM_MESSAGE_LIMIT = 4096
+MODLOG_FLUSH_INTERVAL_SECONDS = 0.2
+MODLOG_BATCH_MAX_ENTRIES = 20
+MESSAGE_BATCH_SEPARATOR = "\n\n"
+_MODLOG_QUEUE: asyncio.Queue[tuple[Bot, str]] | None = None
+MOD_DEBUG_CACHE_TTL_SECONDS = 30
+_MOD_DEBUG_CACHE: dict[int, tuple[bool, float]] = {}
+MODERATION_STATE_CACHE_TTL_SECONDS = 60
+_MODERATION_ENABLED_CACHE: dict[int, tuple[bool, float]] = {}
+# Captcha questions are seeded by migrations and never edited at runtime.
+_CAPTCHA_QUESTION_CACHE: dict[int, dict[str, object]] = {}
+TG_LOOKUP_CONCURRENCY = 10
+USERNAME_CACHE_TTL_SECONDS = 3600
+_USERNAME_CACHE: dict[int, tuple[str, float]] = {}
+LANG_CACHE_TTL_SECONDS = 60
+_LANG_CACHE: dict[tuple[int | None, int], tuple[str, float]] = {}
+CLAN_NAME_CACHE_TTL_SECONDS = 600
+_CLAN_NAME_CACHE: dict[str, tuple[str, float]] = {}
+PLAYER_SEARCH_CACHE_TTL_SECONDS = 60
+_PLAYER_SEARCH_CACHE: dict[tuple[str, str], tuple[list[dict[str, object]], float]] = {}
+# Users whose private messages found neither an apply state nor a link request.
+PRIVATE_STATE_MISS_TTL_SECONDS = 30
+_PRIVATE_STATE_MISS_CACHE: dict[int, tuple[bool, float]] = {}
+# Rendered war reports; the underlying data only changes on background fetches.
+REPORT_CACHE_TTL_SECONDS = 300
+_REPORT_CACHE: dict[tuple, tuple[str, float]] = {}
+# The bot's own username never changes while the process runs.
+_BOT_USERNAME_CACHE: str | None = None
+# Group members known to have no pending captcha challenge; cleared whenever a
+# challenge is created for them.
+PENDING_CAPTCHA_MISS_TTL_SECONDS = 60
+_PENDING_CAPTCHA_MISS_CACHE: dict[tuple[int, int], tuple[bool, float]] = {}
+# Flood-control and network errors are expected; log them without a traceback.
+_TRANSIENT_TELEGRAM_ERRORS = (TelegramNetworkError, TelegramRetryAfter)
+# Only every Nth chart failure is logged with a traceback.
+CHART_ERROR_TRACEBACK_EVERY = 50
+_CHART_ERROR_COUNTER = itertools.count()
+# matplotlib is CPU-bound and pyplot is not thread-safe, so charts are rendered
+# in worker processes to keep the event loop free.
+CHART_RENDER_WORKERS = 2
+_CHART_EXECUTOR: ProcessPoolExecutor | None = None
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _ttl_cache_get(cache: dict, key: object) -> object | None:
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    value, expires_at = entry
+    if expires_at <= time.monotonic():
+        cache.pop(key, None)
+        return None
+    return value
+
+
+def _ttl_cache_set(cache: dict, key: object, value: object, ttl: float) -> None:
+    if len(cache) >= _TTL_CACHE_MAX_ENTRIES and key not in cache:
+        now = time.monotonic()
+        for stale_key in [k for k, (_, exp) in cache.items() if exp <= now]:
+            cache.pop(stale_key, None)
+        if len(cache) >= _TTL_CACHE_MAX_ENTRIES:
+            cache.pop(next(iter(cache)), None)
+    cache[key] = (value, time.monotonic() + ttl)
 
 
 def _format_help_commands(commands: list[dict[str, object]]) -> list[str]:
@@ -158,18 +249,42 @@ def _format_help_commands(commands: list[dict[str, object]]) -> list[str]:
     return lines
 
 
+async def _get_user_language_cached(chat_id: int | None, user_id: int) -> str:
+    key = (chat_id, user_id)
+    cached = _ttl_cache_get(_LANG_CACHE, key)
+    if cached is not None:
+        return cached
+    lang = await get_user_language(chat_id, user_id)
+    _ttl_cache_set(_LANG_CACHE, key, lang, LANG_CACHE_TTL_SECONDS)
+    return lang
+
+
+def _invalidate_user_language(user_id: int) -> None:
+    # set_user_language updates every chat row of the user, and the
+    # chat-less lookup falls back to the latest row, so drop all entries.
+    for key in [key for key in _LANG_CACHE if key[1] == user_id]:
+        _LANG_CACHE.pop(key, None)
+
+
 async def _get_lang_for_message(message: Message) -> str:
     if message.from_user is None:
         return DEFAULT_LANG
     chat_id = message.chat.id if message.chat else None
-    return await get_user_language(chat_id, message.from_user.id)
+    return await _get_user_language_cached(chat_id, message.from_user.id)
 
 
 async def _get_lang_for_query(query: CallbackQuery) -> str:
     if query.from_user is None:
         return DEFAULT_LANG
     chat_id = query.message.chat.id if query.message else None
-    return await get_user_language(chat_id, query.from_user.id)
+    return await _get_user_language_cached(chat_id, query.from_user.id)
+
+
+_LANGUAGE_BUTTON_LABELS: tuple[tuple[str, str], ...] = (
+    ("uk", t("lang_button_uk", DEFAULT_LANG)),
+    ("ru", t("lang_button_ru", DEFAULT_LANG)),
+    ("en", t("lang_button_en", DEFAULT_LANG)),
+)
 
 
 def _build_language_keyboard(target_user_id: int) -> InlineKeyboardMarkup:
@@ -177,17 +292,10 @@ def _build_language_keyboard(target_user_id: int) -> InlineKeyboardMarkup:
         inline_keyboard=[
             [
                 InlineKeyboardButton(
-                    text=t("lang_button_uk", DEFAULT_LANG),
-                    callback_data=f"lang_select:{target_user_id}:uk",
-                ),
-                InlineKeyboardButton(
-                    text=t("lang_button_ru", DEFAULT_LANG),
-                    callback_data=f"lang_select:{target_user_id}:ru",
-                ),
-                InlineKeyboardButton(
-                    text=t("lang_button_en", DEFAULT_LANG),
-                    callback_data=f"lang_select:{target_user_id}:en",
-                ),
+                    text=label,
+                    callback_data=f"lang_select:{target_user_id}:{code}",
+                )
+                for code, label in _LANGUAGE_BUTTON_LABELS
             ]
         ]
     )
@@ -199,6 +307,14 @@ def _require_clan_tag() -> str | None:
     return None
 
 
+async def _ensure_clan_tag(message: Message, lang: str) -> str | None:
+    clan_tag = _require_clan_tag()
+    if not clan_tag:
+        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
+    return clan_tag
+
+
+@functools.lru_cache(maxsize=8192)
 def _normalize_tag(tag: str) -> str:
     raw = tag.strip()
     if not raw:
@@ -212,6 +328,10 @@ def _apply_state_key(user_id: int) -> str:
     return f"apply_state:{user_id}"
 
 
+def _clear_private_state_miss(user_id: int) -> None:
+    _PRIVATE_STATE_MISS_CACHE.pop(user_id, None)
+
+
 def _app_notify_state_key(app_id: int) -> str:
     return f"app_notify:{app_id}"
 
@@ -229,20 +349,41 @@ def _is_debug_admin(user_id: int) -> bool:
 
 
 async def _is_mod_debug(chat_id: int) -> bool:
+    cached = _ttl_cache_get(_MOD_DEBUG_CACHE, chat_id)
+    if cached is not None:
+        return cached
     state = await get_app_state(_mod_debug_state_key(chat_id))
-    if not state:
-        return False
-    return bool(state.get("enabled") is True)
+    enabled = bool(state and state.get("enabled") is True)
+    _ttl_cache_set(_MOD_DEBUG_CACHE, chat_id, enabled, MOD_DEBUG_CACHE_TTL_SECONDS)
+    return enabled
+
+
+async def _is_moderation_enabled_for_chat(chat_id: int) -> bool:
+    cached = _ttl_cache_get(_MODERATION_ENABLED_CACHE, chat_id)
+    if cached is not None:
+        return cached
+    state = await get_app_state(_moderation_state_key(chat_id))
+    enabled = not (state and state.get("enabled") is False)
+    _ttl_cache_set(
+        _MODERATION_ENABLED_CACHE, chat_id, enabled, MODERATION_STATE_CACHE_TTL_SECONDS
+    )
+    return enabled
 
 
-def _parse_debug_day(text: str | None) -> int:
+def _parse_command_args(text: str | None) -> str:
+    """Return the stripped text after the command word, or an empty string."""
     if not text:
-        return 1
-    parts = text.split()
-    if len(parts) < 2:
+        return ""
+    parts = text.split(maxsplit=1)
+    return parts[1].strip() if len(parts) > 1 else ""
+
+
+def _parse_debug_day(args: str | None) -> int:
+    parts = args.split(maxsplit=1) if args else []
+    if not parts:
         return 1
     try:
-        day = int(parts[1])
+        day = int(parts[0])
     except ValueError:
         return 1
     if day < 1:
@@ -257,7 +398,11 @@ def _format_dt(value: datetime | None) -> str:
         return "n/a"
     if value.tzinfo is None:
         value = value.replace(tzinfo=timezone.utc)
-    return value.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+    elif value.tzinfo is not timezone.utc:
+        value = value.astimezone(timezone.utc)
+    # isoformat() renders the same "YYYY-MM-DD HH:MM:SS" prefix as strftime
+    # without parsing a format string on every call.
+    return f"{value.isoformat(sep=' ', timespec='seconds')[:19]} UTC"
 
 
 def _format_user_label(user: object, lang: str = DEFAULT_LANG) -> str:
@@ -376,7 +521,7 @@ async def evaluate_moderation(
 ) -> dict[str, object]:
     # MUST REMAIN SIDE-EFFECT FREE
     if now is None:
-        now = datetime.now(timezone.utc)
+        now = _utc_now()
     if message.from_user is None or message.from_user.is_bot:
         return {
             "should_check": False,
@@ -394,8 +539,7 @@ async def evaluate_moderation(
             "debug": {},
         }
     try:
-        state = await get_app_state(_moderation_state_key(message.chat.id))
-        if state and state.get("enabled") is False:
+        if not await _is_moderation_enabled_for_chat(message.chat.id):
             return {
                 "should_check": False,
                 "violation": "none",
@@ -505,7 +649,7 @@ async def apply_moderation_decision(
 ) -> None:
     # ALL ENFORCEMENT MUST LIVE HERE
     if now is None:
-        now = datetime.now(timezone.utc)
+        now = _utc_now()
     if message.from_user is None or message.from_user.is_bot:
         return
     lang = await _get_lang_for_message(message)
@@ -666,9 +810,8 @@ async def apply_moderation_decision(
 
 
 def is_bot_command_message(message: Message) -> bool:
-    text = message.text or ""
-    caption = message.caption or ""
-    if text.startswith("/") or caption.startswith("/"):
+    text = message.text or message.caption
+    if text and text[0] == "/":
         return True
     for entity in message.entities or []:
         if entity.type == MessageEntityType.BOT_COMMAND and entity.offset == 0:
@@ -697,12 +840,71 @@ async def is_user_pending_captcha(chat_id: int, user_id: int, data=None) -> bool
         return False
     if data is not None and "pending_captcha_challenge" in data:
         return bool(data.get("pending_captcha_challenge"))
-    challenge = await get_pending_challenge(chat_id, user_id)
+    cache_key = (chat_id, user_id)
+    if _ttl_cache_get(_PENDING_CAPTCHA_MISS_CACHE, cache_key):
+        challenge = None
+    else:
+        challenge = await get_pending_challenge(chat_id, user_id)
+        if not challenge:
+            _ttl_cache_set(
+                _PENDING_CAPTCHA_MISS_CACHE,
+                cache_key,
+                True,
+                PENDING_CAPTCHA_MISS_TTL_SECONDS,
+            )
     if data is not None:
         data["pending_captcha_challenge"] = challenge
     return bool(challenge)
 
 
+def _clear_pending_captcha_miss(chat_id: int, user_id: int) -> None:
+    _PENDING_CAPTCHA_MISS_CACHE.pop((chat_id, user_id), None)
+
+
+class NonCommandFilter(BaseFilter):
+    async def __call__(self, message: Message) -> bool:
+        text = message.text or message.caption
+        return not (text and text[0] == "/")
+
+
+class CommandMessageFilter(BaseFilter):
+    async def __call__(self, message: Message) -> bool:
+        text = message.text or message.caption
+        return bool(text) and text[0] == "/"
+
+
+class PrivateTextFilter(BaseFilter):
+    async def __call__(self, message: Message) -> bool:
+        return bool(message.text) and message.chat.type == ChatType.PRIVATE
+
+
+# Plain messages skip every Command() filter with this single check.
+command_router.message.filter(CommandMessageFilter())
+
+
+CAPTCHA_CALLBACK_PREFIX = "cap:"
+
+
+def _parse_captcha_callback_data(data: str) -> tuple[int, int] | None:
+    parts = data.split(":")
+    if len(parts) != 3:
+        return None
+    try:
+        return int(parts[1]), int(parts[2])
+    except ValueError:
+        return None
+
+
+class CaptchaCallbackFilter(BaseFilter):
+    """Match captcha buttons and hand the parsed (challenge_id, choice) on."""
+
+    async def __call__(self, query: CallbackQuery) -> bool | dict[str, object]:
+        data = query.data
+        if not data or not data.startswith(CAPTCHA_CALLBACK_PREFIX):
+            return False
+        return {"captcha_choice": _parse_captcha_callback_data(data)}
+
+
 class PendingCaptchaFilter(BaseFilter):
     async def __call__(self, message: Message, data=None) -> bool:
         if message.from_user is None:
@@ -770,7 +972,7 @@ async def _delete_message_safe(message: Message) -> None:
 async def _mute_user(
     message: Message, user_id: int, *, minutes: int, reason: str
 ) -> None:
-    until = datetime.now(timezone.utc) + timedelta(minutes=minutes)
+    until = _utc_now() + timedelta(minutes=minutes)
     try:
         await _apply_mute_restriction(message, user_id=user_id, until=until)
         logger.warning(
@@ -830,6 +1032,13 @@ async def _mute_user(
 async def send_modlog(bot: Bot, text: str) -> None:
     if MODLOG_CHAT_ID == 0:
         return
+    if _MODLOG_QUEUE is not None:
+        _MODLOG_QUEUE.put_nowait((bot, text))
+        return
+    await _deliver_modlog(bot, text)
+
+
+async def _deliver_modlog(bot: Bot, text: str) -> None:
     try:
         await bot.send_message(
             MODLOG_CHAT_ID,
@@ -843,6 +1052,81 @@ async def send_modlog(bot: Bot, text: str) -> None:
         )
 
 
+def _join_message_batch(texts: list[str]) -> list[str]:
+    chunks: list[str] = []
+    current = ""
+    for text in texts:
+        if current and len(current) + len(MESSAGE_BATCH_SEPARATOR) + len(text) > (
+            TELEGRAM_MESSAGE_LIMIT
+        ):
+            chunks.append(current)
+            current = text
+        else:
+            current = f"{current}{MESSAGE_BATCH_SEPARATOR}{text}" if current else text
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def _flush_modlog_batch(batch: list[tuple[Bot, str]]) -> None:
+    # Entries are removed from ``batch`` as soon as their message is delivered,
+    # so a cancelled flush leaves only the undelivered ones behind.
+    while batch:
+        bot = batch[0][0]
+        end = 1
+        while end < len(batch) and batch[end][0] is bot:
+            end += 1
+        texts = [text for _, text in batch[:end]]
+        chunk = _join_message_batch(texts)[0]
+        count, size = 1, len(texts[0])
+        while size < len(chunk):
+            size += len(MESSAGE_BATCH_SEPARATOR) + len(texts[count])
+            count += 1
+        await _deliver_modlog(bot, chunk)
+        del batch[:count]
+
+
+async def modlog_flush_task() -> None:
+    """Coalesce modlog entries queued by send_modlog into fewer messages."""
+    global _MODLOG_QUEUE
+    queue: asyncio.Queue[tuple[Bot, str]] = asyncio.Queue()
+    _MODLOG_QUEUE = queue
+    loop = asyncio.get_running_loop()
+    batch: list[tuple[Bot, str]] = []
+    try:
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + MODLOG_FLUSH_INTERVAL_SECONDS
+            while len(batch) < MODLOG_BATCH_MAX_ENTRIES:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except TimeoutError:
+                    break
+            await _flush_modlog_batch(batch)
+    except asyncio.CancelledError:
+        logger.info("Modlog flush task cancelled")
+        _MODLOG_QUEUE = None
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+        if batch:
+            await _flush_modlog_batch(batch)
+        raise
+    finally:
+        _MODLOG_QUEUE = None
+
+
+async def _get_captcha_question_cached(question_id: int) -> dict[str, object] | None:
+    question = _CAPTCHA_QUESTION_CACHE.get(question_id)
+    if question is None:
+        question = await get_captcha_question(question_id)
+        if question:
+            _CAPTCHA_QUESTION_CACHE[question_id] = question
+    return question
+
+
 def _build_captcha_keyboard(
     challenge_id: int, question: dict[str, object]
 ) -> InlineKeyboardMarkup:
@@ -856,21 +1140,21 @@ def _build_captcha_keyboard(
         [
             InlineKeyboardButton(
                 text=str(options[0]),
-                callback_data=f"cap:{challenge_id}:0",
+                callback_data=f"{CAPTCHA_CALLBACK_PREFIX}{challenge_id}:0",
             ),
             InlineKeyboardButton(
                 text=str(options[1]),
-                callback_data=f"cap:{challenge_id}:1",
+                callback_data=f"{CAPTCHA_CALLBACK_PREFIX}{challenge_id}:1",
             ),
         ],
         [
             InlineKeyboardButton(
                 text=str(options[2]),
-                callback_data=f"cap:{challenge_id}:2",
+                callback_data=f"{CAPTCHA_CALLBACK_PREFIX}{challenge_id}:2",
             ),
             InlineKeyboardButton(
                 text=str(options[3]),
-                callback_data=f"cap:{challenge_id}:3",
+                callback_data=f"{CAPTCHA_CALLBACK_PREFIX}{challenge_id}:3",
             ),
         ],
     ]
@@ -900,23 +1184,26 @@ async def _send_captcha_message(
         )
         return sent.message_id
     except Exception as e:
-        logger.warning("Failed to send captcha message: %s", e, exc_info=True)
+        logger.warning(
+            "Failed to send captcha message: %s",
+            e,
+            exc_info=not isinstance(e, _TRANSIENT_TELEGRAM_ERRORS),
+        )
         return None
 
 
-async def _send_welcome_message(
-    bot: Bot,
-    chat_id: int,
-    user_display: str,
-) -> None:
-    lang = DEFAULT_LANG
+@functools.lru_cache(maxsize=None)
+def _build_welcome_keyboard(
+    rules_link: str | None, bot_username: str | None
+) -> InlineKeyboardMarkup | None:
+    """Build the welcome buttons; they only depend on static configuration."""
     buttons: list[list[InlineKeyboardButton]] = []
-    if WELCOME_RULES_MESSAGE_LINK:
+    if rules_link:
         buttons.append(
-            [InlineKeyboardButton(text=t("btn_rules", DEFAULT_LANG), url=WELCOME_RULES_MESSAGE_LINK)]
+            [InlineKeyboardButton(text=t("btn_rules", DEFAULT_LANG), url=rules_link)]
         )
-    if BOT_USERNAME:
-        username = BOT_USERNAME.lstrip("@")
+    if bot_username:
+        username = bot_username.lstrip("@")
         buttons.append(
             [
                 InlineKeyboardButton(
@@ -929,9 +1216,16 @@ async def _send_welcome_message(
                 ),
             ]
         )
-    keyboard = (
-        InlineKeyboardMarkup(inline_keyboard=buttons) if buttons else None
-    )
+    return InlineKeyboardMarkup(inline_keyboard=buttons) if buttons else None
+
+
+async def _send_welcome_message(
+    bot: Bot,
+    chat_id: int,
+    user_display: str,
+) -> None:
+    lang = DEFAULT_LANG
+    keyboard = _build_welcome_keyboard(WELCOME_RULES_MESSAGE_LINK, BOT_USERNAME)
     text = (
         f"{t('welcome_message', lang, user=user_display)} "
         f"{t('welcome_message_help', lang)}"
@@ -944,23 +1238,131 @@ async def _send_welcome_message(
     )
 
 
+async def _get_report_cached(
+    key: tuple, build: Callable[[], Awaitable[str]]
+) -> str:
+    cached = _ttl_cache_get(_REPORT_CACHE, key)
+    if cached is not None:
+        return cached
+    report = await build()
+    _ttl_cache_set(_REPORT_CACHE, key, report, REPORT_CACHE_TTL_SECONDS)
+    return report
+
+
 async def _get_bot_username(message: Message) -> str | None:
+    global _BOT_USERNAME_CACHE
     if BOT_USERNAME:
         return BOT_USERNAME.lstrip("@")
+    if _BOT_USERNAME_CACHE is not None:
+        return _BOT_USERNAME_CACHE
     try:
         me = await message.bot.get_me()
     except Exception:
         return None
-    return me.username if me else None
+    username = me.username if me else None
+    if username:
+        _BOT_USERNAME_CACHE = username
+    return username
+
+
+async def _get_clan_name(clan_tag: str) -> str | None:
+    cached = _ttl_cache_get(_CLAN_NAME_CACHE, clan_tag)
+    if cached is not None:
+        return cached
+    try:
+        api_client = await get_api_client()
+        clan_data = await api_client.get_clan(clan_tag)
+    except ClashRoyaleAPIError as e:
+        logger.warning("Failed to fetch clan name: %s", e)
+        return None
+    except Exception as e:
+        logger.warning("Failed to fetch clan name: %s", e)
+        return None
+    clan_name = clan_data.get("name") if isinstance(clan_data, dict) else None
+    if clan_name:
+        _ttl_cache_set(
+            _CLAN_NAME_CACHE, clan_tag, clan_name, CLAN_NAME_CACHE_TTL_SECONDS
+        )
+    return clan_name or None
+
+
+async def _search_player_candidates_cached(
+    clan_tag: str, nickname: str
+) -> list[dict[str, object]]:
+    # Every lookup in search_player_candidates is case-insensitive.
+    key = (clan_tag, nickname.strip().lower())
+    cached = _ttl_cache_get(_PLAYER_SEARCH_CACHE, key)
+    if cached is not None:
+        return cached
+    candidates = await search_player_candidates(clan_tag, nickname)
+    if candidates:
+        _ttl_cache_set(
+            _PLAYER_SEARCH_CACHE, key, candidates, PLAYER_SEARCH_CACHE_TTL_SECONDS
+        )
+    return candidates
+
+
+async def _resolve_username(
+    bot: Bot, user_id: int, semaphore: asyncio.Semaphore
+) -> str | None:
+    # An empty string marks a user known to have no username.
+    cached = _ttl_cache_get(_USERNAME_CACHE, user_id)
+    if cached is not None:
+        return cached or None
+    async with semaphore:
+        try:
+            chat = await bot.get_chat(user_id)
+        except Exception:
+            return None
+    username = getattr(chat, "username", None)
+    _ttl_cache_set(
+        _USERNAME_CACHE, user_id, username or "", USERNAME_CACHE_TTL_SECONDS
+    )
+    return username
 
 
 async def _is_admin_user(message: Message, user_id: int) -> bool:
     if user_id in ADMIN_USER_IDS:
         return True
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         return False
+    cache_key = (message.chat.id, user_id)
+    cached = _ttl_cache_get(_ADMIN_STATUS_CACHE, cache_key)
+    if cached is not None:
+        return cached
     member = await message.bot.get_chat_member(message.chat.id, user_id)
-    return member.status == ChatMemberStatus.CREATOR
+    is_admin = member.status == ChatMemberStatus.CREATOR
+    _ttl_cache_set(
+        _ADMIN_STATUS_CACHE, cache_key, is_admin, ADMIN_STATUS_CACHE_TTL_SECONDS
+    )
+    return is_admin
+
+
+def require_group_admin(
+    handler: Callable[..., Awaitable[None]],
+) -> Callable[..., Awaitable[None]]:
+    """Run the shared group/admin checks before an admin-only group command."""
+
+    @functools.wraps(handler)
+    async def wrapper(message: Message, **kwargs) -> None:
+        lang = await _get_lang_for_message(message)
+        if message.from_user is None:
+            await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
+            return
+        if message.chat.type not in _GROUP_CHAT_TYPES:
+            await message.answer(t("use_command_in_group", lang), parse_mode=None)
+            return
+        try:
+            if not await _is_admin_user(message, message.from_user.id):
+                await message.answer(t("not_allowed", lang), parse_mode=None)
+                return
+        except Exception as e:
+            logger.error("Failed to check admin status: %s", e, exc_info=True)
+            await message.answer(t("unable_verify_admin_status", lang), parse_mode=None)
+            return
+        await handler(message, lang=lang)
+
+    return wrapper
 
 
 def _admin_restore_state_key(chat_id: int, user_id: int) -> str:
@@ -1084,7 +1486,7 @@ async def _set_admin_title_if_possible(
 
 
 async def _bot_has_promote_rights(message: Message) -> bool:
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         return False
     try:
         me = await message.bot.get_me()
@@ -1124,7 +1526,7 @@ async def _restore_invite_only_admin(bot: Bot, chat_id: int, user_id: int) -> bo
 async def _demote_admin_for_mute(
     message: Message, user_id: int
 ) -> tuple[bool, bool]:
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         return False, False
     if user_id in ADMIN_USER_IDS:
         return False, False
@@ -1169,12 +1571,7 @@ async def _apply_mute_restriction(
         await message.bot.restrict_chat_member(
             message.chat.id,
             user_id,
-            permissions=ChatPermissions(
-                can_send_messages=False,
-                can_send_media_messages=False,
-                can_send_other_messages=False,
-                can_add_web_page_previews=False,
-            ),
+            permissions=_LOCKED_PERMS,
             until_date=until,
         )
     except Exception:
@@ -1328,12 +1725,12 @@ async def _enqueue_admin_grant(chat_id: int, user_id: int) -> None:
         {
             "chat_id": int(chat_id),
             "user_id": int(user_id),
-            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": _utc_now().isoformat(),
         }
     )
     await set_app_state(
         ADMIN_GRANT_QUEUE_KEY,
-        {"items": items, "updated_at": datetime.now(timezone.utc).isoformat()},
+        {"items": items, "updated_at": _utc_now().isoformat()},
     )
 
 
@@ -1373,7 +1770,7 @@ async def _send_link_button(message: Message) -> None:
         inline_keyboard=[[InlineKeyboardButton(text=t("btn_link_my_account", lang), url=url)]]
     )
     prefix = ""
-    if message.chat.type in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type in _GROUP_CHAT_TYPES:
         prefix = t("link_open_private", lang) + "\n"
     text = prefix + t("link_tap_button", lang)
     await message.answer(
@@ -1383,16 +1780,43 @@ async def _send_link_button(message: Message) -> None:
     )
 
 
-async def _send_war_activity_chart(
-    message: Message,
+def _get_chart_executor() -> ProcessPoolExecutor:
+    global _CHART_EXECUTOR
+    if _CHART_EXECUTOR is None:
+        # Spawned workers never inherit the running loop or open sockets. They
+        # do re-import the entry module (main.py as __mp_main__), so each one
+        # loads the bot's modules once at start-up.
+        _CHART_EXECUTOR = ProcessPoolExecutor(
+            max_workers=CHART_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _CHART_EXECUTOR
+
+
+def _discard_chart_executor(executor: ProcessPoolExecutor) -> None:
+    global _CHART_EXECUTOR
+    # Concurrent renders may all see the same broken pool; only the first one
+    # replaces it.
+    if _CHART_EXECUTOR is executor:
+        _CHART_EXECUTOR = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_chart_executor() -> None:
+    """Stop the chart worker processes, if any were started."""
+    global _CHART_EXECUTOR
+    if _CHART_EXECUTOR is not None:
+        _CHART_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        _CHART_EXECUTOR = None
+
+
+async def _render_war_activity_chart(
     *,
     clan_tag: str,
     player_tag: str,
     title: str,
     lang: str,
-) -> None:
-    from aiogram.types import BufferedInputFile
-
+) -> bytes | None:
     from charts import render_my_activity_decks_chart
     from db import (
         get_current_member_tags,
@@ -1403,7 +1827,7 @@ async def _send_war_activity_chart(
 
     weeks_desc = await get_last_completed_weeks_from_db(clan_tag, limit=8)
     if not weeks_desc:
-        return
+        return None
     weeks = list(reversed(weeks_desc))
     weekly_rows = await get_player_weekly_activity(player_tag, weeks)
     weeks_available = len(weekly_rows)
@@ -1435,7 +1859,8 @@ async def _send_war_activity_chart(
         if abs(player_avg_fame - clan_avg_fame) <= 500:
             clan_avg_fame_line = clan_avg_fame
 
-    png_bytes = render_my_activity_decks_chart(
+    render = functools.partial(
+        render_my_activity_decks_chart,
         title=title,
         week_labels=week_labels,
         player_decks=player_decks,
@@ -1450,10 +1875,59 @@ async def _send_war_activity_chart(
         legend_clan_avg_decks=t("chart.legend.clan_avg.decks", lang),
         legend_clan_avg_fame=t("chart.legend.clan_avg.fame", lang),
     )
-    await message.answer_photo(
-        BufferedInputFile(png_bytes, filename="activity.png"),
-        parse_mode=None,
+    loop = asyncio.get_running_loop()
+    executor = _get_chart_executor()
+    try:
+        return await loop.run_in_executor(executor, render)
+    except BrokenProcessPool:
+        # A worker died (OOM kill, native crash) and the pool is unusable from
+        # now on, so start a fresh one instead of failing every later chart.
+        logger.error("Chart worker pool is broken; restarting it", exc_info=True)
+        _discard_chart_executor(executor)
+        return await loop.run_in_executor(_get_chart_executor(), render)
+
+
+async def _send_report_and_chart(
+    message: Message,
+    *,
+    clan_tag: str,
+    player_tag: str,
+    player_name: str,
+    title: str,
+    lang: str,
+) -> None:
+    """Send a player's activity report followed by the war activity chart.
+
+    The chart data is loaded while the report is built and sent, but the photo
+    always goes out after the text.
+    """
+    from aiogram.types import BufferedInputFile
+
+    chart_task = asyncio.create_task(
+        _render_war_activity_chart(
+            clan_tag=clan_tag, player_tag=player_tag, title=title, lang=lang
+        )
     )
+    try:
+        report = await build_my_activity_report(
+            player_tag, player_name, clan_tag, lang=lang
+        )
+        await message.answer(report, parse_mode=None)
+    except BaseException:
+        chart_task.cancel()
+        raise
+    try:
+        png_bytes = await chart_task
+        if png_bytes:
+            await message.answer_photo(
+                BufferedInputFile(png_bytes, filename="activity.png"),
+                parse_mode=None,
+            )
+    except Exception as e:
+        with_traceback = next(_CHART_ERROR_COUNTER) % CHART_ERROR_TRACEBACK_EVERY == 0
+        logger.warning(
+            "Failed to send activity chart: %r", e, exc_info=with_traceback
+        )
 
 
 async def _handle_link_candidates(
@@ -1465,9 +1939,8 @@ async def _handle_link_candidates(
     origin_chat_id: int | None,
 ) -> None:
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
 
     candidates = await search_player_candidates(clan_tag, nickname)
@@ -1481,9 +1954,10 @@ async def _handle_link_candidates(
 
     if len(candidates) == 1:
         candidate = candidates[0]
-        await upsert_user_link(
+        tag = _normalize_tag(candidate["player_tag"])
+        await link_user_and_clear_request(
             telegram_user_id=target_user_id,
-            player_tag=_normalize_tag(candidate["player_tag"]),
+            player_tag=tag,
             player_name=candidate["player_name"],
             source=source,
         )
@@ -1500,52 +1974,34 @@ async def _handle_link_candidates(
                 type(e).__name__,
                 exc_info=True,
             )
-        await delete_user_link_request(target_user_id)
         await message.answer(
-            t(
-                "link_success",
-                lang,
-                name=candidate["player_name"],
-                tag=_normalize_tag(candidate["player_tag"]),
-            ),
+            t("link_success", lang, name=candidate["player_name"], tag=tag),
             parse_mode=None,
         )
         return
 
+    in_clan_text = t("status_in_clan", lang)
+    not_in_clan_text = t("status_not_in_clan", lang)
+    label_format = get_formatter("link_candidate_label", lang)
+    line_format = get_formatter("link_candidate_line", lang)
+    data_prefix = f"link_select:{target_user_id}:"
     buttons: list[list[InlineKeyboardButton]] = []
     lines = [t("link_multiple_found", lang)]
-    for candidate in candidates:
+    for index, candidate in enumerate(candidates, 1):
         tag = _normalize_tag(candidate["player_tag"])
-        status = (
-            t("status_in_clan", lang)
-            if candidate.get("in_clan")
-            else t("status_not_in_clan", lang)
-        )
-        label = t(
-            "link_candidate_label",
-            lang,
-            name=candidate["player_name"],
-            tag=tag,
-            status=status,
-        )
-        data = f"link_select:{target_user_id}:{tag.lstrip('#')}"
+        name = candidate["player_name"]
+        status = in_clan_text if candidate.get("in_clan") else not_in_clan_text
+        label = label_format(name=name, tag=tag, status=status)
+        data = f"{data_prefix}{tag.lstrip('#')}"
         buttons.append([InlineKeyboardButton(text=label, callback_data=data)])
-        lines.append(
-            t(
-                "link_candidate_line",
-                lang,
-                index=len(buttons),
-                name=candidate["player_name"],
-                tag=tag,
-                status=status,
-            )
-        )
+        lines.append(line_format(index=index, name=name, tag=tag, status=status))
 
     await upsert_user_link_request(
         telegram_user_id=target_user_id,
         status="awaiting_choice",
         origin_chat_id=origin_chat_id,
     )
+    _clear_private_state_miss(target_user_id)
     await message.answer(
         "\n".join(lines),
         reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons),
@@ -1553,14 +2009,10 @@ async def _handle_link_candidates(
     )
 
 
-@router.message(Command("start"))
-async def cmd_start(message: Message) -> None:
+@command_router.message(Command("start"))
+async def cmd_start(message: Message, command: CommandObject) -> None:
     """Handle /start command - Welcome message and bot information."""
-    args = ""
-    if message.text:
-        parts = message.text.split(maxsplit=1)
-        if len(parts) > 1:
-            args = parts[1].strip().lower()
+    args = (command.args or "").strip().lower()
     lang = await _get_lang_for_message(message)
     if args == "link":
         if message.chat.type != ChatType.PRIVATE:
@@ -1588,6 +2040,7 @@ async def cmd_start(message: Message) -> None:
             status="awaiting_name",
             origin_chat_id=None,
         )
+        _clear_private_state_miss(message.from_user.id)
         await message.answer(
             t("send_nickname_exact", lang),
             parse_mode=None,
@@ -1608,9 +2061,8 @@ async def cmd_start(message: Message) -> None:
                 t("unable_identify_account", lang), parse_mode=None
             )
             return
-        clan_tag = _require_clan_tag()
+        clan_tag = await _ensure_clan_tag(message, lang)
         if not clan_tag:
-            await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
             return
 
         pending_app = await get_pending_application_for_user(message.from_user.id)
@@ -1627,7 +2079,7 @@ async def cmd_start(message: Message) -> None:
 
         last_rejected = await get_last_rejected_time_for_user(message.from_user.id)
         if last_rejected and APPLY_COOLDOWN_HOURS > 0:
-            now = datetime.now(timezone.utc)
+            now = _utc_now()
             wait_until = last_rejected + timedelta(hours=APPLY_COOLDOWN_HOURS)
             if wait_until > now:
                 remaining = wait_until - now
@@ -1680,8 +2132,9 @@ async def cmd_start(message: Message) -> None:
 
         await set_app_state(
             state_key,
-            {"status": "awaiting_name", "started_at": datetime.now(timezone.utc).isoformat()},
+            {"status": "awaiting_name", "started_at": _utc_now().isoformat()},
         )
+        _clear_private_state_miss(message.from_user.id)
         await message.answer(
             t("send_nickname_exact", lang),
             parse_mode=None,
@@ -1691,7 +2144,7 @@ async def cmd_start(message: Message) -> None:
     await message.answer(t("start_welcome", lang), parse_mode=None)
 
 
-@router.message(Command("language"))
+@command_router.message(Command("language"))
 async def cmd_language(message: Message) -> None:
     if message.from_user is None:
         lang = DEFAULT_LANG
@@ -1706,18 +2159,9 @@ async def cmd_language(message: Message) -> None:
     )
 
 
-@router.message(Command("help"))
-async def cmd_help(message: Message) -> None:
-    """Show help for available commands."""
-    lang = await _get_lang_for_message(message)
-    is_admin = False
-    if message.chat.type in (ChatType.GROUP, ChatType.SUPERGROUP):
-        if message.from_user is not None:
-            try:
-                is_admin = await _is_admin_user(message, message.from_user.id)
-            except Exception:
-                is_admin = False
-
+@functools.lru_cache(maxsize=None)
+def _build_help_text(lang: str, is_admin: bool) -> str:
+    """Render the /help text; it only depends on the language and admin flag."""
     general_lines = [
         t("help_cmd_help", lang),
         t("help_cmd_start", lang),
@@ -1779,7 +2223,6 @@ async def cmd_help(message: Message) -> None:
     ]
 
     lines = [
-
         HEADER_LINE,
         t("help_title", lang),
         HEADER_LINE,
@@ -1807,22 +2250,37 @@ async def cmd_help(message: Message) -> None:
             HEADER_LINE,
         ]
     )
-    await message.answer("\n".join(lines), parse_mode=None)
+    return "\n".join(lines)
+
 
-@router.message(Command("apps"))
+@command_router.message(Command("help"))
+async def cmd_help(message: Message) -> None:
+    """Show help for available commands."""
+    lang = await _get_lang_for_message(message)
+    is_admin = False
+    if message.chat.type in _GROUP_CHAT_TYPES:
+        if message.from_user is not None:
+            try:
+                is_admin = await _is_admin_user(message, message.from_user.id)
+            except Exception:
+                is_admin = False
+
+    await message.answer(_build_help_text(lang, is_admin), parse_mode=None)
+
+
+@command_router.message(Command("apps"))
 async def cmd_apps(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
         await message.answer(t("not_allowed", lang), parse_mode=None)
         return
     limit = 10
-    if message.text:
-        parts = message.text.split(maxsplit=1)
-        if len(parts) > 1:
-            try:
-                limit = int(parts[1])
-            except ValueError:
-                limit = 10
+    args = _parse_command_args(message.text)
+    if args:
+        try:
+            limit = int(args)
+        except ValueError:
+            limit = 10
     if limit < 1:
         limit = 1
     if limit > 50:
@@ -1830,7 +2288,7 @@ async def cmd_apps(message: Message) -> None:
 
     apps = await list_pending_applications(limit=limit)
     invited_all = await list_invited_applications()
-    now = datetime.now(timezone.utc)
+    now = _utc_now()
     invited = []
     for app in invited_all:
         invite_expires_at = app.get("invite_expires_at")
@@ -1892,21 +2350,18 @@ async def cmd_apps(message: Message) -> None:
     await message.answer("\n".join(lines), parse_mode=None)
 
 
-@router.message(Command("app"))
+@command_router.message(Command("app"))
 async def cmd_app(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
         await message.answer(t("not_allowed", lang), parse_mode=None)
         return
-    if not message.text:
-        await message.answer(t("usage_app", lang), parse_mode=None)
-        return
-    parts = message.text.split(maxsplit=1)
-    if len(parts) < 2:
+    args = _parse_command_args(message.text)
+    if not args:
         await message.answer(t("usage_app", lang), parse_mode=None)
         return
     try:
-        app_id = int(parts[1])
+        app_id = int(args)
     except ValueError:
         await message.answer(t("invalid_application_id", lang), parse_mode=None)
         return
@@ -1943,21 +2398,18 @@ async def cmd_app(message: Message) -> None:
     await message.answer("\n".join(lines), parse_mode=None)
 
 
-@router.message(Command("app_approve"))
+@command_router.message(Command("app_approve"))
 async def cmd_app_approve(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
         await message.answer(t("not_allowed", lang), parse_mode=None)
         return
-    if not message.text:
-        await message.answer(t("usage_app_approve", lang), parse_mode=None)
-        return
-    parts = message.text.split(maxsplit=1)
-    if len(parts) < 2:
+    args = _parse_command_args(message.text)
+    if not args:
         await message.answer(t("usage_app_approve", lang), parse_mode=None)
         return
     try:
-        app_id = int(parts[1])
+        app_id = int(args)
     except ValueError:
         await message.answer(t("invalid_application_id", lang), parse_mode=None)
         return
@@ -1976,7 +2428,7 @@ async def cmd_app_approve(message: Message) -> None:
     try:
         target_user_id = app.get("telegram_user_id")
         if target_user_id:
-            target_lang = await get_user_language(None, int(target_user_id))
+            target_lang = await _get_user_language_cached(None, int(target_user_id))
             await message.bot.send_message(
                 target_user_id,
                 t("application_user_approved", target_lang),
@@ -1995,7 +2447,7 @@ async def cmd_app_approve(message: Message) -> None:
     )
 
 
-@router.message(Command("app_reject"))
+@command_router.message(Command("app_reject"))
 async def cmd_app_reject(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
@@ -2029,7 +2481,7 @@ async def cmd_app_reject(message: Message) -> None:
     try:
         target_user_id = app.get("telegram_user_id")
         if target_user_id:
-            target_lang = await get_user_language(None, int(target_user_id))
+            target_lang = await _get_user_language_cached(None, int(target_user_id))
             text = t("application_user_rejected", target_lang)
             if reason:
                 text = text + "\n" + t(
@@ -2055,7 +2507,7 @@ async def cmd_app_reject(message: Message) -> None:
     )
 
 
-@router.message(Command("app_notify"))
+@command_router.message(Command("app_notify"))
 async def cmd_app_notify(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
@@ -2116,13 +2568,12 @@ async def cmd_app_notify(message: Message) -> None:
         )
         return
 
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     clan_tag = _normalize_tag(clan_tag)
 
-    now = datetime.now(timezone.utc)
+    now = _utc_now()
     last_notified = app.get("last_notified_at")
     if isinstance(last_notified, datetime):
         if last_notified.tzinfo is None:
@@ -2295,13 +2746,13 @@ async def cmd_app_notify(message: Message) -> None:
     )
 
 
-@router.message(Command("warn"))
+@command_router.message(Command("warn"))
 async def cmd_warn(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None:
         await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(t("use_command_in_group", lang), parse_mode=None)
         return
     if message.reply_to_message is None or message.reply_to_message.from_user is None:
@@ -2317,13 +2768,9 @@ async def cmd_warn(message: Message) -> None:
         return
 
     target = message.reply_to_message.from_user
-    reason = ""
-    if message.text:
-        parts = message.text.split(maxsplit=1)
-        if len(parts) > 1:
-            reason = parts[1].strip()
+    reason = _parse_command_args(message.text)
 
-    now = datetime.now(timezone.utc)
+    now = _utc_now()
     warn_count = await increment_user_warning(
         message.chat.id, target.id, now=now
     )
@@ -2347,7 +2794,7 @@ async def cmd_warn(message: Message) -> None:
         ),
     )
     if warn_count >= WARN_MUTE_AFTER:
-        until = datetime.now(timezone.utc) + timedelta(minutes=WARN_MUTE_MINUTES)
+        until = now + timedelta(minutes=WARN_MUTE_MINUTES)
         try:
             await _apply_mute_restriction(message, user_id=target.id, until=until)
         except Exception as e:
@@ -2414,13 +2861,13 @@ async def cmd_warn(message: Message) -> None:
     )
 
 
-@router.message(Command("warns"))
+@command_router.message(Command("warns"))
 async def cmd_warns(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None:
         await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(t("use_command_in_group", lang), parse_mode=None)
         return
     if message.reply_to_message is None or message.reply_to_message.from_user is None:
@@ -2436,13 +2883,12 @@ async def cmd_warns(message: Message) -> None:
         return
 
     limit = 5
-    if message.text:
-        parts = message.text.split(maxsplit=1)
-        if len(parts) > 1:
-            try:
-                limit = int(parts[1])
-            except ValueError:
-                limit = 5
+    args = _parse_command_args(message.text)
+    if args:
+        try:
+            limit = int(args)
+        except ValueError:
+            limit = 5
     if limit < 1:
         limit = 1
     if limit > 10:
@@ -2477,13 +2923,13 @@ async def cmd_warns(message: Message) -> None:
     await message.answer("\n".join(lines), parse_mode=None)
 
 
-@router.message(Command("mute"))
+@command_router.message(Command("mute"))
 async def cmd_mute(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None:
         await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(t("use_command_in_group", lang), parse_mode=None)
         return
     if message.reply_to_message is None or message.reply_to_message.from_user is None:
@@ -2513,7 +2959,7 @@ async def cmd_mute(message: Message) -> None:
     reason = parts[2].strip() if len(parts) > 2 else ""
     target = message.reply_to_message.from_user
 
-    until = datetime.now(timezone.utc) + timedelta(minutes=minutes)
+    until = _utc_now() + timedelta(minutes=minutes)
     try:
         await _apply_mute_restriction(message, user_id=target.id, until=until)
     except RuntimeError as e:
@@ -2562,13 +3008,13 @@ async def cmd_mute(message: Message) -> None:
     await message.answer(t("mute_done", lang), parse_mode=None)
 
 
-@router.message(Command("unmute"))
+@command_router.message(Command("unmute"))
 async def cmd_unmute(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None:
         await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(t("use_command_in_group", lang), parse_mode=None)
         return
     if message.reply_to_message is None or message.reply_to_message.from_user is None:
@@ -2588,12 +3034,7 @@ async def cmd_unmute(message: Message) -> None:
         await message.bot.restrict_chat_member(
             message.chat.id,
             target.id,
-            permissions=ChatPermissions(
-                can_send_messages=True,
-                can_send_media_messages=True,
-                can_send_other_messages=True,
-                can_add_web_page_previews=True,
-            ),
+            permissions=_UNLOCKED_PERMS,
         )
     except Exception as e:
         logger.warning("Failed to unmute user: %s", e, exc_info=True)
@@ -2622,13 +3063,13 @@ async def cmd_unmute(message: Message) -> None:
     await message.answer(t("unmute_done", lang), parse_mode=None)
 
 
-@router.message(Command("ban"))
+@command_router.message(Command("ban"))
 async def cmd_ban(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None:
         await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(t("use_command_in_group", lang), parse_mode=None)
         return
     if message.reply_to_message is None or message.reply_to_message.from_user is None:
@@ -2643,11 +3084,7 @@ async def cmd_ban(message: Message) -> None:
         await message.answer(t("unable_verify_admin_status", lang), parse_mode=None)
         return
 
-    reason = ""
-    if message.text:
-        parts = message.text.split(maxsplit=1)
-        if len(parts) > 1:
-            reason = parts[1].strip()
+    reason = _parse_command_args(message.text)
     target = message.reply_to_message.from_user
 
     try:
@@ -2679,13 +3116,13 @@ async def cmd_ban(message: Message) -> None:
     await message.answer(t("ban_done", lang), parse_mode=None)
 
 
-@router.message(Command("unban"))
+@command_router.message(Command("unban"))
 async def cmd_unban(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None:
         await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(t("use_command_in_group", lang), parse_mode=None)
         return
     try:
@@ -2697,12 +3134,12 @@ async def cmd_unban(message: Message) -> None:
         await message.answer(t("unable_verify_admin_status", lang), parse_mode=None)
         return
 
-    parts = (message.text or "").split(maxsplit=1)
-    if len(parts) < 2:
+    args = _parse_command_args(message.text)
+    if not args:
         await message.answer(t("usage_unban", lang), parse_mode=None)
         return
     try:
-        user_id = int(parts[1])
+        user_id = int(args)
     except ValueError:
         await message.answer(t("invalid_user_id", lang), parse_mode=None)
         return
@@ -2735,13 +3172,13 @@ async def cmd_unban(message: Message) -> None:
     await message.answer(t("unban_done", lang), parse_mode=None)
 
 
-@router.message(Command("purge"))
+@command_router.message(Command("purge"))
 async def cmd_purge(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None:
         await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(t("use_command_in_group", lang), parse_mode=None)
         return
     try:
@@ -2753,12 +3190,12 @@ async def cmd_purge(message: Message) -> None:
         await message.answer(t("unable_verify_admin_status", lang), parse_mode=None)
         return
 
-    parts = (message.text or "").split(maxsplit=1)
-    if len(parts) < 2:
+    args = _parse_command_args(message.text)
+    if not args:
         await message.answer(t("usage_purge", lang), parse_mode=None)
         return
     try:
-        count = int(parts[1])
+        count = int(args)
     except ValueError:
         await message.answer(t("invalid_number", lang), parse_mode=None)
         return
@@ -2798,13 +3235,13 @@ async def cmd_purge(message: Message) -> None:
     await message.answer(t("purge_done", lang, count=deleted), parse_mode=None)
 
 
-@router.message(Command("raid_on"))
+@command_router.message(Command("raid_on"))
 async def cmd_raid_on(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None:
         await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(t("use_command_in_group", lang), parse_mode=None)
         return
     try:
@@ -2837,13 +3274,13 @@ async def cmd_raid_on(message: Message) -> None:
     await message.answer(t("raid_mode_enabled", lang), parse_mode=None)
 
 
-@router.message(Command("raid_off"))
+@command_router.message(Command("raid_off"))
 async def cmd_raid_off(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None:
         await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(t("use_command_in_group", lang), parse_mode=None)
         return
     try:
@@ -2876,13 +3313,13 @@ async def cmd_raid_off(message: Message) -> None:
     await message.answer(t("raid_mode_disabled", lang), parse_mode=None)
 
 
-@router.message(Command("raid_status"))
+@command_router.message(Command("raid_status"))
 async def cmd_raid_status(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None:
         await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(t("use_command_in_group", lang), parse_mode=None)
         return
     try:
@@ -2935,129 +3372,71 @@ async def cmd_raid_status(message: Message) -> None:
     await message.answer("\n".join(lines), parse_mode=None)
 
 
-@router.message(Command("mod_debug_on"))
-async def cmd_mod_debug_on(message: Message) -> None:
-    lang = await _get_lang_for_message(message)
-    if message.from_user is None:
-        await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
-        return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
-        await message.answer(t("use_command_in_group", lang), parse_mode=None)
-        return
-    try:
-        if not await _is_admin_user(message, message.from_user.id):
-            await message.answer(t("not_allowed", lang), parse_mode=None)
-            return
-    except Exception as e:
-        logger.error("Failed to check admin status: %s", e, exc_info=True)
-        await message.answer(t("unable_verify_admin_status", lang), parse_mode=None)
-        return
-
+@command_router.message(Command("mod_debug_on"))
+@require_group_admin
+async def cmd_mod_debug_on(message: Message, lang: str) -> None:
     await set_app_state(
         _mod_debug_state_key(message.chat.id),
-        {"enabled": True, "updated_at": datetime.now(timezone.utc).isoformat()},
+        {"enabled": True, "updated_at": _utc_now().isoformat()},
+    )
+    _ttl_cache_set(
+        _MOD_DEBUG_CACHE, message.chat.id, True, MOD_DEBUG_CACHE_TTL_SECONDS
     )
     await message.answer(t("mod_debug_enabled", lang), parse_mode=None)
 
 
-@router.message(Command("mod_debug_off"))
-async def cmd_mod_debug_off(message: Message) -> None:
-    lang = await _get_lang_for_message(message)
-    if message.from_user is None:
-        await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
-        return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
-        await message.answer(t("use_command_in_group", lang), parse_mode=None)
-        return
-    try:
-        if not await _is_admin_user(message, message.from_user.id):
-            await message.answer(t("not_allowed", lang), parse_mode=None)
-            return
-    except Exception as e:
-        logger.error("Failed to check admin status: %s", e, exc_info=True)
-        await message.answer(t("unable_verify_admin_status", lang), parse_mode=None)
-        return
-
+@command_router.message(Command("mod_debug_off"))
+@require_group_admin
+async def cmd_mod_debug_off(message: Message, lang: str) -> None:
     await delete_app_state(_mod_debug_state_key(message.chat.id))
+    _ttl_cache_set(
+        _MOD_DEBUG_CACHE, message.chat.id, False, MOD_DEBUG_CACHE_TTL_SECONDS
+    )
     await message.answer(t("mod_debug_disabled", lang), parse_mode=None)
 
 
-@router.message(Command("moderation_on"))
-async def cmd_moderation_on(message: Message) -> None:
-    lang = await _get_lang_for_message(message)
-    if message.from_user is None:
-        await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
-        return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
-        await message.answer(t("use_command_in_group", lang), parse_mode=None)
-        return
-    try:
-        if not await _is_admin_user(message, message.from_user.id):
-            await message.answer(t("not_allowed", lang), parse_mode=None)
-            return
-    except Exception as e:
-        logger.error("Failed to check admin status: %s", e, exc_info=True)
-        await message.answer(t("unable_verify_admin_status", lang), parse_mode=None)
-        return
-
+@command_router.message(Command("moderation_on"))
+@require_group_admin
+async def cmd_moderation_on(message: Message, lang: str) -> None:
     await set_app_state(
         _moderation_state_key(message.chat.id),
-        {"enabled": True, "updated_at": datetime.now(timezone.utc).isoformat()},
+        {"enabled": True, "updated_at": _utc_now().isoformat()},
+    )
+    _ttl_cache_set(
+        _MODERATION_ENABLED_CACHE,
+        message.chat.id,
+        True,
+        MODERATION_STATE_CACHE_TTL_SECONDS,
     )
     await message.answer(t("moderation_enabled", lang), parse_mode=None)
 
 
-@router.message(Command("moderation_off"))
-async def cmd_moderation_off(message: Message) -> None:
-    lang = await _get_lang_for_message(message)
-    if message.from_user is None:
-        await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
-        return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
-        await message.answer(t("use_command_in_group", lang), parse_mode=None)
-        return
-    try:
-        if not await _is_admin_user(message, message.from_user.id):
-            await message.answer(t("not_allowed", lang), parse_mode=None)
-            return
-    except Exception as e:
-        logger.error("Failed to check admin status: %s", e, exc_info=True)
-        await message.answer(t("unable_verify_admin_status", lang), parse_mode=None)
-        return
-
+@command_router.message(Command("moderation_off"))
+@require_group_admin
+async def cmd_moderation_off(message: Message, lang: str) -> None:
     await set_app_state(
         _moderation_state_key(message.chat.id),
-        {"enabled": False, "updated_at": datetime.now(timezone.utc).isoformat()},
+        {"enabled": False, "updated_at": _utc_now().isoformat()},
+    )
+    _ttl_cache_set(
+        _MODERATION_ENABLED_CACHE,
+        message.chat.id,
+        False,
+        MODERATION_STATE_CACHE_TTL_SECONDS,
     )
     await message.answer(t("moderation_disabled", lang), parse_mode=None)
 
 
-@router.message(Command("modlog"))
-async def cmd_modlog(message: Message) -> None:
-    lang = await _get_lang_for_message(message)
-    if message.from_user is None:
-        await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
-        return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
-        await message.answer(t("use_command_in_group", lang), parse_mode=None)
-        return
-    try:
-        if not await _is_admin_user(message, message.from_user.id):
-            await message.answer(t("not_allowed", lang), parse_mode=None)
-            return
-    except Exception as e:
-        logger.error("Failed to check admin status: %s", e, exc_info=True)
-        await message.answer(t("unable_verify_admin_status", lang), parse_mode=None)
-        return
-
+@command_router.message(Command("modlog"))
+@require_group_admin
+async def cmd_modlog(message: Message, lang: str) -> None:
     limit = 10
-    if message.text:
-        parts = message.text.split(maxsplit=1)
-        if len(parts) > 1:
-            try:
-                limit = int(parts[1])
-            except ValueError:
-                limit = 10
+    args = _parse_command_args(message.text)
+    if args:
+        try:
+            limit = int(args)
+        except ValueError:
+            limit = 10
     if limit < 1:
         limit = 1
     if limit > 50:
@@ -3066,25 +3445,35 @@ async def cmd_modlog(message: Message) -> None:
     if not actions:
         await message.answer(t("modlog_none", lang), parse_mode=None)
         return
-    lines = [
-        t("modlog_header", lang, count=len(actions))
-    ]
-    for entry in actions:
-        created_at = _format_dt(entry.get("created_at"))
-        lines.append(
-            t(
-                "modlog_line",
-                lang,
-                entry_id=entry.get("id"),
-                action=entry.get("action"),
-                user_id=entry.get("target_user_id"),
-                admin_id=entry.get("admin_user_id"),
-                created_at=created_at,
-            )
-        )
+    line_format = get_formatter("modlog_line", lang)
+    lines = [t("modlog_header", lang, count=len(actions))]
+    lines.extend(
+        line_format(
+            entry_id=entry.get("id"),
+            action=entry.get("action"),
+            user_id=entry.get("target_user_id"),
+            admin_id=entry.get("admin_user_id"),
+            created_at=_format_dt(entry.get("created_at")),
+        )
+        for entry in actions
+    )
     await message.answer("\n".join(lines), parse_mode=None)
 
 
+# (old_status, new_status, old_is_member, new_is_member) updates that count as a
+# join: coming back from left/kicked, or a restricted user re-entering the chat.
+_JOIN_TRANSITIONS = frozenset(
+    {
+        (old_status, new_status, old_is_member, new_is_member)
+        for old_status in (ChatMemberStatus.LEFT, ChatMemberStatus.KICKED)
+        for new_status in (ChatMemberStatus.MEMBER, ChatMemberStatus.RESTRICTED)
+        for old_is_member in (None, True, False)
+        for new_is_member in (None, True, False)
+    }
+    | {(ChatMemberStatus.RESTRICTED, ChatMemberStatus.RESTRICTED, False, True)}
+)
+
+
 @moderation_router.chat_member()
 async def handle_member_join(event: ChatMemberUpdated) -> None:
     user = event.new_chat_member.user
@@ -3101,10 +3490,13 @@ async def handle_member_join(event: ChatMemberUpdated) -> None:
         old_is_member,
         new_is_member,
     )
+    # Any membership change may promote or demote the user; drop the cached status.
+    _ADMIN_STATUS_CACHE.pop((event.chat.id, user.id), None)
+    _USERNAME_CACHE.pop(user.id, None)
     if not ENABLE_CAPTCHA:
         logger.info("CAPTCHA skip: reason=disabled chat_id=%s", event.chat.id)
         return
-    if event.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if event.chat.type not in _GROUP_CHAT_TYPES:
         logger.info("CAPTCHA skip: reason=chat_type chat_id=%s", event.chat.id)
         return
     if user.is_bot:
@@ -3114,6 +3506,14 @@ async def handle_member_join(event: ChatMemberUpdated) -> None:
             user.id,
         )
         return
+    transition = (old_status, new_status, old_is_member, new_is_member)
+    if transition not in _JOIN_TRANSITIONS:
+        logger.info(
+            "CAPTCHA skip: reason=not_join chat_id=%s user_id=%s",
+            event.chat.id,
+            user.id,
+        )
+        return
     try:
         if await _is_admin_user(event, user.id):
             logger.info(
@@ -3124,22 +3524,6 @@ async def handle_member_join(event: ChatMemberUpdated) -> None:
             return
     except Exception:
         pass
-    is_join = (
-        old_status in (ChatMemberStatus.LEFT, ChatMemberStatus.KICKED)
-        and new_status in (ChatMemberStatus.MEMBER, ChatMemberStatus.RESTRICTED)
-    ) or (
-        old_status == ChatMemberStatus.RESTRICTED
-        and new_status == ChatMemberStatus.RESTRICTED
-        and old_is_member is False
-        and new_is_member is True
-    )
-    if not is_join:
-        logger.info(
-            "CAPTCHA skip: reason=not_join chat_id=%s user_id=%s",
-            event.chat.id,
-            user.id,
-        )
-        return
 
     try:
         if await is_user_verified(event.chat.id, user.id):
@@ -3153,20 +3537,26 @@ async def handle_member_join(event: ChatMemberUpdated) -> None:
         logger.error("Failed to check verification: %s", e, exc_info=True)
         return
 
-    try:
-        await event.bot.restrict_chat_member(
+    # Restricting the user and preparing the challenge are independent, so run
+    # them together. If the restriction fails the pending challenge is kept and
+    # the pending-message handler still gates the user.
+    restrict_result, challenge_result = await asyncio.gather(
+        event.bot.restrict_chat_member(
             event.chat.id,
             user.id,
-            permissions=ChatPermissions(
-                can_send_messages=False,
-                can_send_media_messages=False,
-                can_send_other_messages=False,
-                can_add_web_page_previews=False,
-            ),
-        )
-        logger.info("Restricted new member %s in chat %s", user.id, event.chat.id)
-    except Exception as e:
-        logger.error("Failed to restrict member %s: %s", user.id, e, exc_info=True)
+            permissions=_LOCKED_PERMS,
+        ),
+        get_or_create_pending_challenge(
+            event.chat.id, user.id, CAPTCHA_EXPIRE_MINUTES
+        ),
+        return_exceptions=True,
+    )
+    # Cleared after the challenge exists so a message racing the insert cannot
+    # leave a stale "not pending" entry behind.
+    _clear_pending_captcha_miss(event.chat.id, user.id)
+    if isinstance(restrict_result, Exception):
+        e = restrict_result
+        logger.error("Failed to restrict member %s: %s", user.id, e, exc_info=e)
         await send_modlog(
             event.bot,
             t(
@@ -3178,14 +3568,13 @@ async def handle_member_join(event: ChatMemberUpdated) -> None:
             ),
         )
         return
+    logger.info("Restricted new member %s in chat %s", user.id, event.chat.id)
 
-    try:
-        challenge, question = await get_or_create_pending_challenge(
-            event.chat.id, user.id, CAPTCHA_EXPIRE_MINUTES
-        )
-    except Exception as e:
-        logger.error("Failed to create challenge: %s", e, exc_info=True)
+    if isinstance(challenge_result, Exception):
+        e = challenge_result
+        logger.error("Failed to create challenge: %s", e, exc_info=e)
         return
+    challenge, question = challenge_result
 
     if not challenge:
         return
@@ -3212,7 +3601,7 @@ async def handle_member_join(event: ChatMemberUpdated) -> None:
         )
         return
     if not question:
-        question = await get_captcha_question(challenge["question_id"])
+        question = await _get_captcha_question_cached(challenge["question_id"])
     if not question:
         logger.info(
             "CAPTCHA skip: reason=missing_question chat_id=%s user_id=%s",
@@ -3220,7 +3609,7 @@ async def handle_member_join(event: ChatMemberUpdated) -> None:
             user.id,
         )
         return
-    now = datetime.now(timezone.utc)
+    now = _utc_now()
     last_reminded_at = challenge.get("last_reminded_at")
     if challenge.get("message_id") and isinstance(last_reminded_at, datetime):
         if (now - last_reminded_at).total_seconds() < CAPTCHA_REMIND_COOLDOWN_SECONDS:
@@ -3239,8 +3628,7 @@ async def handle_member_join(event: ChatMemberUpdated) -> None:
         mention=_build_user_mention(user),
     )
     if message_id:
-        await update_challenge_message_id(challenge["id"], message_id)
-        await touch_last_reminded_at(challenge["id"], now)
+        await update_challenge_message_and_reminded(challenge["id"], message_id, now)
         logger.info(
             "Captcha sent to user %s in chat %s", user.id, event.chat.id
         )
@@ -3279,8 +3667,8 @@ async def handle_member_join(event: ChatMemberUpdated) -> None:
 
 
 @moderation_router.message(
-    F.chat.type.in_({ChatType.GROUP, ChatType.SUPERGROUP}),
-    ~(F.text.startswith("/") | F.caption.startswith("/")),
+    F.chat.type.in_(_GROUP_CHAT_TYPES),
+    NonCommandFilter(),
     PendingCaptchaFilter(),
 )
 async def handle_pending_user_message(message: Message) -> None:
@@ -3313,7 +3701,11 @@ async def handle_pending_user_message(message: Message) -> None:
             message.chat.id,
         )
     except Exception as e:
-        logger.warning("Failed to delete message: %s", e, exc_info=True)
+        logger.warning(
+            "Failed to delete message: %s",
+            e,
+            exc_info=not isinstance(e, _TRANSIENT_TELEGRAM_ERRORS),
+        )
         await send_modlog(
             message.bot,
             t(
@@ -3326,7 +3718,7 @@ async def handle_pending_user_message(message: Message) -> None:
             ),
         )
 
-    now = datetime.now(timezone.utc)
+    now = _utc_now()
     last_reminded_at = challenge.get("last_reminded_at")
     if isinstance(last_reminded_at, datetime):
         if (now - last_reminded_at).total_seconds() < CAPTCHA_REMIND_COOLDOWN_SECONDS:
@@ -3351,7 +3743,7 @@ async def handle_pending_user_message(message: Message) -> None:
     )
 
     if not challenge.get("message_id"):
-        question = await get_captcha_question(challenge["question_id"])
+        question = await _get_captcha_question_cached(challenge["question_id"])
         if question:
             message_id = await _send_captcha_message(
                 message.bot,
@@ -3365,8 +3757,8 @@ async def handle_pending_user_message(message: Message) -> None:
 
 
 @moderation_router.message(
-    F.chat.type.in_({ChatType.GROUP, ChatType.SUPERGROUP}),
-    ~(F.text.startswith("/") | F.caption.startswith("/")),
+    F.chat.type.in_(_GROUP_CHAT_TYPES),
+    NonCommandFilter(),
     NotPendingCaptchaFilter(),
 )
 async def handle_moderation_message(message: Message) -> None:
@@ -3384,27 +3776,66 @@ async def handle_moderation_message(message: Message) -> None:
             (message.text or message.caption or "")[:200],
             [entity.type for entity in (message.entities or [])],
         )
-    now = datetime.now(timezone.utc)
+    now = _utc_now()
     decision = await evaluate_moderation(
         message, now=now, mod_debug=mod_debug
     )
     await apply_moderation_decision(message, decision, now=now)
 
 
-@moderation_router.callback_query(F.data.startswith("cap:"))
-async def handle_captcha_callback(query: CallbackQuery) -> None:
-    lang = DEFAULT_LANG
-    data = query.data or ""
-    parts = data.split(":")
-    if len(parts) != 3:
-        await query.answer(t("captcha_invalid", lang), show_alert=False)
+async def _lift_captcha_restriction(bot: Bot, chat_id: int, user_id: int) -> None:
+    try:
+        await bot.restrict_chat_member(
+            chat_id,
+            user_id,
+            permissions=_UNLOCKED_PERMS,
+        )
+    except Exception as e:
+        logger.error("Failed to unrestrict member: %s", e, exc_info=True)
+        await send_modlog(
+            bot,
+            t(
+                "modlog_captcha_unrestrict_failed",
+                DEFAULT_LANG,
+                chat_id=chat_id,
+                user_id=user_id,
+                error=e,
+            ),
+        )
+
+
+async def _delete_captcha_prompt(message: Message | None) -> None:
+    if not message:
         return
     try:
-        challenge_id = int(parts[1])
-        choice = int(parts[2])
-    except ValueError:
+        await message.delete()
+    except Exception:
+        pass
+
+
+async def _send_verified_greeting(
+    bot: Bot, chat_id: int, user_id: int, full_name: str
+) -> None:
+    await _send_welcome_message(bot, chat_id, full_name)
+    await bot.send_message(
+        chat_id,
+        t("language_prompt", DEFAULT_LANG),
+        reply_markup=_build_language_keyboard(user_id),
+        parse_mode=None,
+    )
+
+
+@moderation_router.callback_query(CaptchaCallbackFilter())
+async def handle_captcha_callback(
+    query: CallbackQuery, captcha_choice: tuple[int, int] | None = None
+) -> None:
+    lang = DEFAULT_LANG
+    if captcha_choice is None:
+        captcha_choice = _parse_captcha_callback_data(query.data or "")
+    if captcha_choice is None:
         await query.answer(t("captcha_invalid", lang), show_alert=False)
         return
+    challenge_id, choice = captcha_choice
 
     challenge = await get_challenge_by_id(challenge_id)
     if not challenge:
@@ -3417,7 +3848,7 @@ async def handle_captcha_callback(query: CallbackQuery) -> None:
         await query.answer(t("captcha_not_for_you", lang), show_alert=False)
         return
 
-    now = datetime.now(timezone.utc)
+    now = _utc_now()
     expires_at = challenge.get("expires_at")
     if isinstance(expires_at, datetime) and expires_at < now:
         await mark_challenge_expired(challenge_id)
@@ -3428,55 +3859,38 @@ async def handle_captcha_callback(query: CallbackQuery) -> None:
         await query.answer(t("captcha_not_active", lang), show_alert=False)
         return
 
-    question = await get_captcha_question(challenge["question_id"])
+    question = await _get_captcha_question_cached(challenge["question_id"])
     if not question:
         await query.answer(t("captcha_missing", lang), show_alert=False)
         return
 
     if int(choice) == int(question["correct_option"]):
-        await mark_challenge_passed(challenge_id)
-        await set_user_verified(challenge["chat_id"], challenge["user_id"])
-        try:
-            await query.bot.restrict_chat_member(
+        await mark_challenge_passed_and_verify(
+            challenge_id, challenge["chat_id"], challenge["user_id"]
+        )
+        _invalidate_user_language(challenge["user_id"])
+        # The follow-up Telegram calls are independent of each other. gather()
+        # rather than a TaskGroup: one failed request must never cancel the
+        # unrestrict and leave a verified user muted.
+        answer_result, _, _, greeting_result = await asyncio.gather(
+            query.answer(t("captcha_verified", lang), show_alert=False),
+            _lift_captcha_restriction(
+                query.bot, challenge["chat_id"], challenge["user_id"]
+            ),
+            _delete_captcha_prompt(query.message),
+            _send_verified_greeting(
+                query.bot,
                 challenge["chat_id"],
                 challenge["user_id"],
-                permissions=ChatPermissions(
-                    can_send_messages=True,
-                    can_send_media_messages=True,
-                    can_send_other_messages=True,
-                    can_add_web_page_previews=True,
-                ),
-            )
-        except Exception as e:
-            logger.error("Failed to unrestrict member: %s", e, exc_info=True)
-            await send_modlog(
-                query.bot,
-                t(
-                    "modlog_captcha_unrestrict_failed",
-                    DEFAULT_LANG,
-                    chat_id=challenge["chat_id"],
-                    user_id=challenge["user_id"],
-                    error=e,
-                ),
-            )
-
-        if query.message:
-            try:
-                await query.message.delete()
-            except Exception:
-                pass
-        await _send_welcome_message(
-            query.bot,
-            challenge["chat_id"],
-            query.from_user.full_name,
-        )
-        await query.bot.send_message(
-            challenge["chat_id"],
-            t("language_prompt", DEFAULT_LANG),
-            reply_markup=_build_language_keyboard(challenge["user_id"]),
-            parse_mode=None,
+                query.from_user.full_name,
+            ),
+            return_exceptions=True,
         )
-        await query.answer(t("captcha_verified", lang), show_alert=False)
+        for result in (answer_result, greeting_result):
+            if isinstance(result, Exception):
+                logger.warning(
+                    "Captcha pass follow-up failed: %s", result, exc_info=result
+                )
         logger.info(
             "Captcha passed for user %s in chat %s",
             challenge["user_id"],
@@ -3496,20 +3910,39 @@ async def handle_captcha_callback(query: CallbackQuery) -> None:
 
     attempts = await increment_challenge_attempts(challenge_id)
     if attempts >= CAPTCHA_MAX_ATTEMPTS:
-        now = datetime.now(timezone.utc)
-        await mark_challenge_failed(
-            challenge_id,
-            now + timedelta(seconds=30),
+        failed_until = now + timedelta(seconds=30)
+        # Closing the old challenge, opening the new one and acknowledging the
+        # button press touch different rows/requests, so do them together.
+        # Failures are collected rather than raised: once the fresh challenge
+        # is committed, its prompt must still be sent.
+        fail_result, create_result, answer_result = await asyncio.gather(
+            mark_challenge_failed(challenge_id, failed_until),
+            create_fresh_captcha_challenge(
+                challenge["chat_id"],
+                challenge["user_id"],
+                CAPTCHA_EXPIRE_MINUTES,
+            ),
+            query.answer(t("captcha_wrong_short", lang), show_alert=False),
+            return_exceptions=True,
         )
+        for result in (fail_result, answer_result):
+            if isinstance(result, Exception):
+                logger.warning(
+                    "Captcha fail follow-up failed: %s", result, exc_info=result
+                )
+        if isinstance(create_result, Exception):
+            logger.error(
+                "Failed to create captcha challenge: %s",
+                create_result,
+                exc_info=create_result,
+            )
+            new_challenge, new_question = None, None
+        else:
+            new_challenge, new_question = create_result
         if query.message:
             await query.message.answer(
                 t("captcha_wrong_new", lang), parse_mode=None
             )
-        new_challenge, new_question = await create_fresh_captcha_challenge(
-            challenge["chat_id"],
-            challenge["user_id"],
-            CAPTCHA_EXPIRE_MINUTES,
-        )
         if new_challenge and new_question:
             message_id = await _send_captcha_message(
                 query.bot,
@@ -3519,11 +3952,9 @@ async def handle_captcha_callback(query: CallbackQuery) -> None:
                 mention=_build_user_mention(query.from_user),
             )
             if message_id:
-                await update_challenge_message_id(
-                    new_challenge["id"], message_id
+                await update_challenge_message_and_reminded(
+                    new_challenge["id"], message_id, now
                 )
-                await touch_last_reminded_at(new_challenge["id"], now)
-        await query.answer(t("captcha_wrong_short", lang), show_alert=False)
         logger.info(
             "Captcha failed for user %s in chat %s (new challenge created)",
             challenge["user_id"],
@@ -3537,7 +3968,7 @@ async def handle_captcha_callback(query: CallbackQuery) -> None:
                 chat_id=challenge["chat_id"],
                 user_id=challenge["user_id"],
                 challenge_id=challenge_id,
-                expires_at=_format_dt(now + timedelta(seconds=30)),
+                expires_at=_format_dt(failed_until),
             ),
         )
         return
@@ -3612,21 +4043,32 @@ async def _send_debug_reminder(
         )
 
 
-@router.message(Command("ping"))
+async def _fetch_ping_clan() -> dict:
+    clan_tag = _require_clan_tag()
+    if not clan_tag:
+        raise ValueError("CLAN_TAG is not configured")
+    api_client = await get_api_client()
+    return await api_client.get_clan(clan_tag)
+
+
+@command_router.message(Command("ping"))
 async def cmd_ping(message: Message) -> None:
     """Handle /ping command - Check bot responsiveness and API status."""
-    lang = await _get_lang_for_message(message)
-    start_time = datetime.now(timezone.utc)
+    start_time = _utc_now()
+    # The API check does not depend on the language, so overlap it with the
+    # language lookup.
+    clan_task = asyncio.create_task(_fetch_ping_clan())
+    try:
+        lang = await _get_lang_for_message(message)
+    except BaseException:
+        clan_task.cancel()
+        raise
 
     api_status = t("ping_api_connected", lang)
     clan_name = t("unknown", lang)
 
     try:
-        api_client = await get_api_client()
-        clan_tag = _require_clan_tag()
-        if not clan_tag:
-            raise ValueError("CLAN_TAG is not configured")
-        clan_data = await api_client.get_clan(clan_tag)
+        clan_data = await clan_task
         if isinstance(clan_data, dict):
             clan_name = clan_data.get("name", t("unknown", lang))
     except ClashRoyaleAPIError as e:
@@ -3636,9 +4078,10 @@ async def cmd_ping(message: Message) -> None:
         api_status = t("ping_api_error", lang, error=e)
         logger.error("Unexpected error during API check: %s", e)
 
-    response_time = (datetime.now(timezone.utc) - start_time).total_seconds() * 1000
+    finished_at = _utc_now()
+    response_time = (finished_at - start_time).total_seconds() * 1000
     response_time_text = f"{response_time:.0f}"
-    server_time = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    server_time = finished_at.isoformat(sep=" ", timespec="seconds")[:19]
 
     response_text = t(
         "ping_response",
@@ -3652,11 +4095,11 @@ async def cmd_ping(message: Message) -> None:
     await message.answer(response_text, parse_mode=None)
 
 
-@router.message(Command("bind"))
+@command_router.message(Command("bind"))
 async def cmd_bind(message: Message) -> None:
     """Bind the current group chat for weekly war reports."""
     lang = await _get_lang_for_message(message)
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(
             t("bind_group_only", lang), parse_mode=None
         )
@@ -3674,65 +4117,64 @@ async def cmd_bind(message: Message) -> None:
         logger.error("Failed to check admin status: %s", e, exc_info=True)
         await message.answer(t("unable_verify_admin_status", lang), parse_mode=None)
         return
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     await upsert_clan_chat(clan_tag, message.chat.id, enabled=True)
     await message.answer(t("bind_success", lang), parse_mode=None)
 
 
-@router.message(Command("war"))
+@command_router.message(Command("war"))
 async def cmd_war(message: Message) -> None:
     """Show the weekly war report for the last completed week."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     week = await get_last_completed_week(clan_tag)
     if not week:
         await message.answer(t("war_no_completed_weeks", lang), parse_mode=None)
         return
     season_id, section_index = week
-    report = await build_weekly_report(
-        season_id, section_index, clan_tag, lang=lang
+    report = await _get_report_cached(
+        ("weekly", season_id, section_index, clan_tag, lang),
+        lambda: build_weekly_report(season_id, section_index, clan_tag, lang=lang),
     )
     await message.answer(report, parse_mode=None)
 
 
-@router.message(Command("war8"))
+@command_router.message(Command("war8"))
 async def cmd_war8(message: Message) -> None:
     """Show the rolling war report for the last 8 completed weeks."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     weeks = await get_last_completed_weeks(8, clan_tag)
     if not weeks:
         await message.answer(t("war_no_completed_weeks", lang), parse_mode=None)
         return
-    report = await build_rolling_report(weeks, clan_tag, lang=lang)
+    report = await _get_report_cached(
+        ("rolling", tuple(weeks), clan_tag, lang),
+        lambda: build_rolling_report(weeks, clan_tag, lang=lang),
+    )
     await message.answer(report, parse_mode=None)
 
 
-@router.message(Command("top"))
+@command_router.message(Command("top"))
 async def cmd_top(message: Message) -> None:
     """Show top players by decks and fame for the last 10 completed weeks."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     n = 10
-    if message.text:
-        parts = message.text.split(maxsplit=1)
-        if len(parts) > 1:
-            try:
-                n = int(parts[1].strip())
-            except Exception:
-                n = 10
+    args = _parse_command_args(message.text)
+    if args:
+        try:
+            n = int(args)
+        except Exception:
+            n = 10
     n = max(1, min(50, n))
     report = await build_top_players_report(
         clan_tag, lang=lang, limit=n, window_weeks=10, min_tenure_weeks=6
@@ -3742,67 +4184,80 @@ async def cmd_top(message: Message) -> None:
     )
 
 
-@router.message(Command("war_all"))
+@command_router.message(Command("war_all"))
 async def cmd_war_all(message: Message) -> None:
     """Send weekly, rolling, and kick shortlist reports together."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
-        return
-    last_week = await get_last_completed_week(clan_tag)
-    if not last_week:
-        await message.answer(t("war_no_completed_weeks", lang), parse_mode=None)
         return
+    # The most recent completed week is the head of the 8-week window, so a
+    # single river race log request covers both.
     weeks = await get_last_completed_weeks(8, clan_tag)
     if not weeks:
-        weeks = [last_week]
+        await message.answer(t("war_no_completed_weeks", lang), parse_mode=None)
+        return
+    last_week = weeks[0]
 
-    weekly_report = await build_weekly_report(
-        last_week[0], last_week[1], clan_tag, lang=lang
-    )
-    rolling_report = await build_rolling_report(weeks, clan_tag, lang=lang)
-    kick_report = await build_kick_shortlist_report(
-        weeks, last_week, clan_tag, lang=lang
+    week_key = tuple(weeks)
+    weekly_report, rolling_report, kick_report = await asyncio.gather(
+        _get_report_cached(
+            ("weekly", last_week[0], last_week[1], clan_tag, lang),
+            lambda: build_weekly_report(
+                last_week[0], last_week[1], clan_tag, lang=lang
+            ),
+        ),
+        _get_report_cached(
+            ("rolling", week_key, clan_tag, lang),
+            lambda: build_rolling_report(weeks, clan_tag, lang=lang),
+        ),
+        _get_report_cached(
+            ("kick", week_key, last_week, clan_tag, lang, None),
+            lambda: build_kick_shortlist_report(
+                weeks, last_week, clan_tag, lang=lang
+            ),
+        ),
     )
 
-    await message.answer(weekly_report, parse_mode=None)
-    await message.answer(rolling_report, parse_mode=None)
-    await message.answer(kick_report, parse_mode=None)
+    for chunk in _join_message_batch([weekly_report, rolling_report, kick_report]):
+        await message.answer(chunk, parse_mode=None)
 
 
-@router.message(Command("list_for_kick"))
+@command_router.message(Command("list_for_kick"))
 async def cmd_list_for_kick(message: Message) -> None:
     """Show kick shortlist based on the last 8 completed weeks.
 
     Optional: /list_for_kick <limit>, where limit is 1..50.
     """
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     limit = 5
-    if message.text:
-        parts = message.text.split(maxsplit=1)
-        if len(parts) > 1:
-            try:
-                limit = int(parts[1].strip())
-            except Exception:
-                limit = 5
+    args = _parse_command_args(message.text)
+    if args:
+        try:
+            limit = int(args)
+        except Exception:
+            limit = 5
     limit = max(1, min(50, limit))
+    # The last completed week heads the 8-week window, so one river race log
+    # request answers both.
     weeks = await get_last_completed_weeks(8, clan_tag)
-    last_week = await get_last_completed_week(clan_tag)
-    if not weeks or not last_week:
+    if not weeks:
         await message.answer(t("war_no_completed_weeks", lang), parse_mode=None)
         return
-    report = await build_kick_shortlist_report(
-        weeks, last_week, clan_tag, lang=lang, short_limit=limit
+    last_week = weeks[0]
+    report = await _get_report_cached(
+        ("kick", tuple(weeks), last_week, clan_tag, lang, limit),
+        lambda: build_kick_shortlist_report(
+            weeks, last_week, clan_tag, lang=lang, short_limit=limit
+        ),
     )
     await message.answer(report, parse_mode=None)
 
 
-@router.message(Command("kick_report"))
+@command_router.message(Command("kick_report"))
 async def cmd_kick_report(message: Message) -> None:
     """Show detailed kick shortlist diagnostics (admin-only)."""
     lang = await _get_lang_for_message(message)
@@ -3817,9 +4272,8 @@ async def cmd_kick_report(message: Message) -> None:
         logger.error("Failed to check admin status: %s", e, exc_info=True)
         await message.answer(t("unable_verify_admin_status", lang), parse_mode=None)
         return
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     weeks = await get_last_completed_weeks(8, clan_tag)
     last_week = await get_last_completed_week(clan_tag)
@@ -3832,13 +4286,12 @@ async def cmd_kick_report(message: Message) -> None:
     await message.answer(report, parse_mode=None)
 
 
-@router.message(Command("kick_newbie"))
+@command_router.message(Command("kick_newbie"))
 async def cmd_kick_newbie(message: Message) -> None:
     """Show kick shortlist for newbies (1-2 full war weeks)."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     report = await build_kick_newbie_report(
         clan_tag, lang=lang, limit=10
@@ -3846,52 +4299,42 @@ async def cmd_kick_newbie(message: Message) -> None:
     await message.answer(report, parse_mode=None)
 
 
-@router.message(Command("tg"))
+@command_router.message(Command("tg"))
 async def cmd_tg(message: Message) -> None:
     """Show clan members with Telegram usernames (if known)."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     members = await get_current_members_snapshot(clan_tag)
     if not members:
         await message.answer(t("tg_no_snapshot", lang), parse_mode=None)
         return
-    tags: set[str] = set()
+    tagged_rows: list[tuple[dict[str, object], str]] = []
     for row in members:
         raw_tag = row.get("player_tag")
         if not raw_tag:
             continue
-        tag = str(raw_tag).strip().upper()
-        if tag and not tag.startswith("#"):
-            tag = f"#{tag}"
+        tag = _normalize_tag(str(raw_tag))
         if tag:
-            tags.add(tag)
-    if not tags:
+            tagged_rows.append((row, tag))
+    if not tagged_rows:
         await message.answer(t("tg_no_snapshot", lang), parse_mode=None)
         return
-    links = await get_user_links_by_tags(tags)
+    links = await get_user_links_by_tags({tag for _, tag in tagged_rows})
     if not links:
         await message.answer(t("tg_no_users", lang), parse_mode=None)
         return
+    linked = [(row, links[tag]) for row, tag in tagged_rows if links.get(tag)]
+    semaphore = asyncio.Semaphore(TG_LOOKUP_CONCURRENCY)
+    usernames = await asyncio.gather(
+        *(
+            _resolve_username(message.bot, user_id, semaphore)
+            for _, user_id in linked
+        )
+    )
     entries: list[dict[str, str]] = []
-    for row in members:
-        raw_tag = row.get("player_tag")
-        if not raw_tag:
-            continue
-        tag = str(raw_tag).strip().upper()
-        if tag and not tag.startswith("#"):
-            tag = f"#{tag}"
-        user_id = links.get(tag)
-        if not user_id:
-            continue
-        username = None
-        try:
-            chat = await message.bot.get_chat(user_id)
-            username = getattr(chat, "username", None)
-        except Exception:
-            username = None
+    for (row, user_id), username in zip(linked, usernames):
         entries.append(
             {
                 "name": row.get("player_name") or t("unknown", lang),
@@ -3912,13 +4355,12 @@ async def cmd_tg(message: Message) -> None:
     await message.answer(report, parse_mode=None)
 
 
-@router.message(Command("inactive"))
+@command_router.message(Command("inactive"))
 async def cmd_inactive(message: Message) -> None:
     """Handle /inactive command - Show players with low River Race participation."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     try:
         current_members = await get_current_member_tags(clan_tag)
@@ -3939,26 +4381,27 @@ async def cmd_inactive(message: Message) -> None:
             )
             return
 
+        unknown_name = t("unknown", lang)
+        na_text = t("na", lang)
+        days_ago_format = get_formatter("inactive_days_ago", lang)
+        line_format = get_formatter("inactive_line", lang)
         response_lines = [t("inactive_header", lang), ""]
         for index, member in enumerate(absent_members, 1):
-            name = member.get("player_name") or t("unknown", lang)
+            name = member.get("player_name") or unknown_name
             days_absent = member.get("days_absent")
             if days_absent is None:
-                days_text = t("na", lang)
-                flag = ""
+                days_text = na_text
+                prefix = ""
             else:
-                days_text = t("inactive_days_ago", lang, days=days_absent)
+                days_text = days_ago_format(days=days_absent)
                 if days_absent >= LAST_SEEN_RED_DAYS:
-                    flag = "🔴"
+                    prefix = "🔴 "
                 elif days_absent >= LAST_SEEN_YELLOW_DAYS:
-                    flag = "🟡"
+                    prefix = "🟡 "
                 else:
-                    flag = ""
-            prefix = f"{flag} " if flag else ""
+                    prefix = ""
             response_lines.append(
-                t(
-                    "inactive_line",
-                    lang,
+                line_format(
                     index=index,
                     prefix=prefix,
                     name=name,
@@ -3975,37 +4418,34 @@ async def cmd_inactive(message: Message) -> None:
         )
 
 
-@router.message(Command("current_war"))
+@command_router.message(Command("current_war"))
 async def cmd_current_war(message: Message) -> None:
     """Show current war snapshot from the database."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     report = await build_current_war_report(clan_tag, lang=lang)
     await message.answer(report, parse_mode=None)
 
 
-@router.message(Command("info"))
+@command_router.message(Command("info"))
 async def cmd_info(message: Message) -> None:
     """Show clan info from the official Clash Royale API."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     report = await build_clan_info_report(clan_tag, lang=lang)
     await message.answer(report, parse_mode=None)
 
 
-@router.message(Command("clan"))
+@command_router.message(Command("clan"))
 async def cmd_clan(message: Message) -> None:
     """Show clan tag and deep link for Clash Royale."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     clan_tag_hash = _normalize_tag(clan_tag)
     clan_tag_no_hash = clan_tag_hash.lstrip("#")
@@ -4038,25 +4478,23 @@ async def cmd_clan(message: Message) -> None:
     )
 
 
-@router.message(Command("clan_place"))
+@command_router.message(Command("clan_place"))
 async def cmd_clan_place(message: Message) -> None:
     """Show current clan place in River Race."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     report = await build_clan_place_report(clan_tag, lang=lang)
     await message.answer(report, parse_mode=None)
 
 
-@router.message(Command("rank"))
+@command_router.message(Command("rank"))
 async def cmd_rank(message: Message) -> None:
     """Show clan ranking snapshot for current location."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     report = await build_rank_report(clan_tag, lang=lang)
     await message.answer(
@@ -4066,14 +4504,14 @@ async def cmd_rank(message: Message) -> None:
     )
 
 
-@router.message(Command("debug_reminder"))
+@command_router.message(Command("debug_reminder"))
 async def cmd_debug_reminder(message: Message) -> None:
     """Debug: run daily reminder logic immediately for this chat."""
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
         await message.answer(t("not_allowed", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(t("use_command_in_group", lang), parse_mode=None)
         return
     try:
@@ -4109,14 +4547,14 @@ async def cmd_debug_reminder(message: Message) -> None:
         await message.answer(t("debug_reminder_failed", lang), parse_mode=None)
 
 
-@router.message(Command("riverside"))
-async def cmd_riverside(message: Message) -> None:
+@command_router.message(Command("riverside"))
+async def cmd_riverside(message: Message, command: CommandObject) -> None:
     """Debug: send Clan War reminder to this chat only."""
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
         await message.answer(t("not_allowed", lang), parse_mode=None)
         return
-    day = _parse_debug_day(message.text)
+    day = _parse_debug_day(command.args)
     templates = {
         1: t("riverside_day1", lang),
         2: t("riverside_day2", lang),
@@ -4134,14 +4572,14 @@ async def cmd_riverside(message: Message) -> None:
     )
 
 
-@router.message(Command("coliseum"))
-async def cmd_coliseum(message: Message) -> None:
+@command_router.message(Command("coliseum"))
+async def cmd_coliseum(message: Message, command: CommandObject) -> None:
     """Debug: send Colosseum reminder to this chat only."""
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
         await message.answer(t("not_allowed", lang), parse_mode=None)
         return
-    day = _parse_debug_day(message.text)
+    day = _parse_debug_day(command.args)
     templates = {
         1: t("coliseum_day1", lang),
         2: t("coliseum_day2", lang),
@@ -4159,13 +4597,13 @@ async def cmd_coliseum(message: Message) -> None:
     )
 
 
-@router.message(Command("captcha_send"))
+@command_router.message(Command("captcha_send"))
 async def cmd_captcha_send(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
         await message.answer(t("not_allowed", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(
             t("reply_to_user_message_in_group", lang), parse_mode=None
         )
@@ -4214,12 +4652,7 @@ async def cmd_captcha_send(message: Message) -> None:
         await message.bot.restrict_chat_member(
             chat_id,
             target.id,
-            permissions=ChatPermissions(
-                can_send_messages=False,
-                can_send_media_messages=False,
-                can_send_other_messages=False,
-                can_add_web_page_previews=False,
-            ),
+            permissions=_LOCKED_PERMS,
         )
     except Exception as e:
         logger.warning("Failed to restrict user: %s", e, exc_info=True)
@@ -4238,6 +4671,7 @@ async def cmd_captcha_send(message: Message) -> None:
         challenge, question = await get_or_create_pending_challenge(
             chat_id, target.id, CAPTCHA_EXPIRE_MINUTES
         )
+        _clear_pending_captcha_miss(chat_id, target.id)
     except Exception as e:
         logger.error("Failed to create captcha challenge: %s", e, exc_info=True)
         await message.answer(t("captcha_create_failed", lang), parse_mode=None)
@@ -4247,7 +4681,7 @@ async def cmd_captcha_send(message: Message) -> None:
         await message.answer(t("captcha_create_failed", lang), parse_mode=None)
         return
     if not question:
-        question = await get_captcha_question(challenge["question_id"])
+        question = await _get_captcha_question_cached(challenge["question_id"])
     if not question:
         await message.answer(
             t("captcha_question_unavailable", lang), parse_mode=None
@@ -4262,8 +4696,9 @@ async def cmd_captcha_send(message: Message) -> None:
         mention=_build_user_mention(target),
     )
     if message_id:
-        await update_challenge_message_id(challenge["id"], message_id)
-        await touch_last_reminded_at(challenge["id"], datetime.now(timezone.utc))
+        await update_challenge_message_and_reminded(
+            challenge["id"], message_id, _utc_now()
+        )
         await message.answer(
             t(
                 "captcha_sent",
@@ -4281,13 +4716,13 @@ async def cmd_captcha_send(message: Message) -> None:
     )
 
 
-@router.message(Command("captcha_status"))
+@command_router.message(Command("captcha_status"))
 async def cmd_captcha_status(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
         await message.answer(t("not_allowed", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(
             t("reply_to_user_message_in_group", lang), parse_mode=None
         )
@@ -4309,13 +4744,10 @@ async def cmd_captcha_status(message: Message) -> None:
     )
 
     try:
-        is_verified = await is_user_verified(chat_id, target.id)
-        challenge = await get_pending_challenge(chat_id, target.id)
-        if not challenge:
-            challenge = await get_latest_challenge(chat_id, target.id)
+        is_verified, challenge = await get_captcha_status(chat_id, target.id)
         question_text = None
         if challenge:
-            question = await get_captcha_question(challenge["question_id"])
+            question = await _get_captcha_question_cached(challenge["question_id"])
             if question:
                 question_text = question.get("question_text") or ""
         if question_text:
@@ -4374,13 +4806,13 @@ async def cmd_captcha_status(message: Message) -> None:
     await message.answer("\n".join(lines), parse_mode=None)
 
 
-@router.message(Command("captcha_reset"))
+@command_router.message(Command("captcha_reset"))
 async def cmd_captcha_reset(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
         await message.answer(t("not_allowed", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(
             t("reply_to_user_message_in_group", lang), parse_mode=None
         )
@@ -4401,25 +4833,27 @@ async def cmd_captcha_reset(message: Message) -> None:
         ),
     )
 
-    try:
-        await expire_active_challenges(chat_id, target.id)
-        await delete_verified_user(chat_id, target.id)
-    except Exception as e:
-        logger.error("Failed to reset captcha state: %s", e, exc_info=True)
-
-    try:
-        await message.bot.restrict_chat_member(
+    # The state cleanup and the restriction are independent; the new challenge
+    # is only created once the old ones are expired.
+    expire_result, delete_result, restrict_result = await asyncio.gather(
+        expire_active_challenges(chat_id, target.id),
+        delete_verified_user(chat_id, target.id),
+        message.bot.restrict_chat_member(
             chat_id,
             target.id,
-            permissions=ChatPermissions(
-                can_send_messages=False,
-                can_send_media_messages=False,
-                can_send_other_messages=False,
-                can_add_web_page_previews=False,
-            ),
-        )
-    except Exception as e:
-        logger.warning("Failed to restrict user: %s", e, exc_info=True)
+            permissions=_LOCKED_PERMS,
+        ),
+        return_exceptions=True,
+    )
+    for result in (expire_result, delete_result):
+        if isinstance(result, Exception):
+            logger.error("Failed to reset captcha state: %s", result, exc_info=result)
+    if not isinstance(delete_result, Exception):
+        _invalidate_user_language(target.id)
+
+    if isinstance(restrict_result, Exception):
+        e = restrict_result
+        logger.warning("Failed to restrict user: %s", e, exc_info=e)
         await send_modlog(
             message.bot,
             t(
@@ -4435,6 +4869,7 @@ async def cmd_captcha_reset(message: Message) -> None:
         challenge, question = await get_or_create_pending_challenge(
             chat_id, target.id, CAPTCHA_EXPIRE_MINUTES
         )
+        _clear_pending_captcha_miss(chat_id, target.id)
     except Exception as e:
         logger.error("Failed to create captcha challenge: %s", e, exc_info=True)
         await message.answer(t("captcha_create_new_failed", lang), parse_mode=None)
@@ -4445,7 +4880,7 @@ async def cmd_captcha_reset(message: Message) -> None:
         return
 
     if not question:
-        question = await get_captcha_question(challenge["question_id"])
+        question = await _get_captcha_question_cached(challenge["question_id"])
     message_id = None
     if question:
         message_id = await _send_captcha_message(
@@ -4467,13 +4902,13 @@ async def cmd_captcha_reset(message: Message) -> None:
     )
 
 
-@router.message(Command("captcha_verify"))
+@command_router.message(Command("captcha_verify"))
 async def cmd_captcha_verify(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
         await message.answer(t("not_allowed", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(
             t("reply_to_user_message_in_group", lang), parse_mode=None
         )
@@ -4495,8 +4930,8 @@ async def cmd_captcha_verify(message: Message) -> None:
     )
 
     try:
-        await set_user_verified(chat_id, target.id)
-        await mark_pending_challenges_passed(chat_id, target.id)
+        await verify_user_and_pass_challenges(chat_id, target.id)
+        _invalidate_user_language(target.id)
     except Exception as e:
         logger.error("Failed to mark user verified: %s", e, exc_info=True)
         await message.answer(t("captcha_verify_failed", lang), parse_mode=None)
@@ -4506,12 +4941,7 @@ async def cmd_captcha_verify(message: Message) -> None:
         await message.bot.restrict_chat_member(
             chat_id,
             target.id,
-            permissions=ChatPermissions(
-                can_send_messages=True,
-                can_send_media_messages=True,
-                can_send_other_messages=True,
-                can_add_web_page_previews=True,
-            ),
+            permissions=_UNLOCKED_PERMS,
         )
     except Exception as e:
         logger.warning("Failed to unrestrict user: %s", e, exc_info=True)
@@ -4529,13 +4959,13 @@ async def cmd_captcha_verify(message: Message) -> None:
     await message.answer(t("captcha_verify_done", lang), parse_mode=None)
 
 
-@router.message(Command("captcha_unverify"))
+@command_router.message(Command("captcha_unverify"))
 async def cmd_captcha_unverify(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
         await message.answer(t("not_allowed", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(
             t("reply_to_user_message_in_group", lang), parse_mode=None
         )
@@ -4564,11 +4994,12 @@ async def cmd_captcha_unverify(message: Message) -> None:
             t("captcha_unverify_failed", lang), parse_mode=None
         )
         return
+    _invalidate_user_language(target.id)
 
     await message.answer(t("captcha_unverify_done", lang), parse_mode=None)
 
 
-@router.message(Command("modlog_test"))
+@command_router.message(Command("modlog_test"))
 async def cmd_modlog_test(message: Message) -> None:
     lang = await _get_lang_for_message(message)
     if message.from_user is None or not _is_debug_admin(message.from_user.id):
@@ -4599,43 +5030,32 @@ async def cmd_modlog_test(message: Message) -> None:
     await message.answer(t("modlog_test_sent", lang), parse_mode=None)
 
 
-@router.message(Command("donations"))
+@command_router.message(Command("donations"))
 async def cmd_donations(message: Message) -> None:
     """Show donation leaderboards for the clan."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
-    clan_name = t("unknown", lang)
-    try:
-        api_client = await get_api_client()
-        clan_data = await api_client.get_clan(clan_tag)
-        if isinstance(clan_data, dict):
-            clan_name = clan_data.get("name") or clan_name
-    except ClashRoyaleAPIError as e:
-        logger.warning("Failed to fetch clan name: %s", e)
-    except Exception as e:
-        logger.warning("Failed to fetch clan name: %s", e)
+    clan_name = await _get_clan_name(clan_tag) or t("unknown", lang)
     report = await build_donations_report(
         clan_tag, clan_name, lang=lang
     )
     await message.answer(report, parse_mode=None)
 
 
-@router.message(Command("promote_candidates"))
+@command_router.message(Command("promote_candidates"))
 async def cmd_promote_candidates(message: Message) -> None:
     """Show promotion recommendations."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     report = await build_promotion_candidates_report(clan_tag, lang=lang)
     await message.answer(report, parse_mode=None)
 
 
-@router.message(Command("my_activity"))
+@command_router.message(Command("my_activity"))
 async def cmd_my_activity(message: Message) -> None:
     """Show the current user's war activity report."""
     lang = await _get_lang_for_message(message)
@@ -4643,16 +5063,11 @@ async def cmd_my_activity(message: Message) -> None:
         await message.answer(t("unable_identify_account", lang), parse_mode=None)
         return
 
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
 
-    args = ""
-    if message.text:
-        parts = message.text.split(maxsplit=1)
-        if len(parts) > 1:
-            args = parts[1].strip()
+    args = _parse_command_args(message.text)
 
     existing = await get_user_link(message.from_user.id)
     if existing:
@@ -4665,25 +5080,14 @@ async def cmd_my_activity(message: Message) -> None:
             ),
             parse_mode=None,
         )
-        report = await build_my_activity_report(
-            existing["player_tag"],
-            existing["player_name"],
-            clan_tag,
+        await _send_report_and_chart(
+            message,
+            clan_tag=clan_tag,
+            player_tag=existing["player_tag"],
+            player_name=existing["player_name"],
+            title=t("chart.war_activity.title", lang),
             lang=lang,
         )
-        await message.answer(report, parse_mode=None)
-        try:
-            await _send_war_activity_chart(
-                message,
-                clan_tag=clan_tag,
-                player_tag=existing["player_tag"],
-                title=t("chart.war_activity.title", lang),
-                lang=lang,
-            )
-        except Exception as e:
-            logger.warning(
-                "Failed to send my_activity chart: %s", e, exc_info=True
-            )
         return
 
     if message.chat.type == ChatType.PRIVATE:
@@ -4692,6 +5096,7 @@ async def cmd_my_activity(message: Message) -> None:
             status="awaiting_name",
             origin_chat_id=None,
         )
+        _clear_private_state_miss(message.from_user.id)
         if args:
             await _handle_link_candidates(
                 message=message,
@@ -4710,20 +5115,15 @@ async def cmd_my_activity(message: Message) -> None:
     await _send_link_button(message)
 
 
-@router.message(Command("activity"))
+@command_router.message(Command("activity"))
 async def cmd_activity(message: Message) -> None:
     """Show a player's activity report by nickname, #tag, @username, or reply."""
     lang = await _get_lang_for_message(message)
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
 
-    args = ""
-    if message.text:
-        parts = message.text.split(maxsplit=1)
-        if len(parts) > 1:
-            args = parts[1].strip()
+    args = _parse_command_args(message.text)
 
     if args.startswith("@"):
         try:
@@ -4743,26 +5143,16 @@ async def cmd_activity(message: Message) -> None:
                 parse_mode=None,
             )
             return
-        report = await build_my_activity_report(
-            link["player_tag"], link["player_name"], clan_tag, lang=lang
+        await _send_report_and_chart(
+            message,
+            clan_tag=clan_tag,
+            player_tag=link["player_tag"],
+            player_name=link["player_name"],
+            title=t(
+                "chart.war_activity.title_named", lang, name=link["player_name"]
+            ),
+            lang=lang,
         )
-        await message.answer(report, parse_mode=None)
-        try:
-            await _send_war_activity_chart(
-                message,
-                clan_tag=clan_tag,
-                player_tag=link["player_tag"],
-                title=t(
-                    "chart.war_activity.title_named",
-                    lang,
-                    name=link["player_name"],
-                ),
-                lang=lang,
-            )
-        except Exception as e:
-            logger.warning(
-                "Failed to send activity chart: %s", e, exc_info=True
-            )
         return
 
     if not args and message.reply_to_message and message.reply_to_message.from_user:
@@ -4774,26 +5164,16 @@ async def cmd_activity(message: Message) -> None:
                 parse_mode=None,
             )
             return
-        report = await build_my_activity_report(
-            link["player_tag"], link["player_name"], clan_tag, lang=lang
+        await _send_report_and_chart(
+            message,
+            clan_tag=clan_tag,
+            player_tag=link["player_tag"],
+            player_name=link["player_name"],
+            title=t(
+                "chart.war_activity.title_named", lang, name=link["player_name"]
+            ),
+            lang=lang,
         )
-        await message.answer(report, parse_mode=None)
-        try:
-            await _send_war_activity_chart(
-                message,
-                clan_tag=clan_tag,
-                player_tag=link["player_tag"],
-                title=t(
-                    "chart.war_activity.title_named",
-                    lang,
-                    name=link["player_name"],
-                ),
-                lang=lang,
-            )
-        except Exception as e:
-            logger.warning(
-                "Failed to send activity chart: %s", e, exc_info=True
-            )
         return
 
     if not args:
@@ -4804,7 +5184,7 @@ async def cmd_activity(message: Message) -> None:
         await cmd_my_activity(message)
         return
 
-    candidates = await search_player_candidates(clan_tag, args)
+    candidates = await _search_player_candidates_cached(clan_tag, args)
     if not candidates:
         await message.answer(
             t("activity_no_player_found", lang),
@@ -4813,55 +5193,38 @@ async def cmd_activity(message: Message) -> None:
         return
 
     if len(candidates) > 1:
+        in_clan_text = t("status_in_clan", lang)
+        not_in_clan_text = t("status_not_in_clan", lang)
+        line_format = get_formatter("activity_candidate_line", lang)
         lines = [t("activity_multiple_found", lang)]
         for index, candidate in enumerate(candidates, 1):
-            tag = _normalize_tag(candidate["player_tag"])
-            status = (
-                t("status_in_clan", lang)
-                if candidate.get("in_clan")
-                else t("status_not_in_clan", lang)
-            )
             lines.append(
-                t(
-                    "activity_candidate_line",
-                    lang,
+                line_format(
                     index=index,
                     name=candidate["player_name"],
-                    tag=tag,
-                    status=status,
+                    tag=_normalize_tag(candidate["player_tag"]),
+                    status=(
+                        in_clan_text if candidate.get("in_clan") else not_in_clan_text
+                    ),
                 )
             )
         await message.answer("\n".join(lines), parse_mode=None)
         return
 
     candidate = candidates[0]
-    player_tag = _normalize_tag(candidate["player_tag"])
-    report = await build_my_activity_report(
-        player_tag,
-        candidate["player_name"],
-        clan_tag,
+    await _send_report_and_chart(
+        message,
+        clan_tag=clan_tag,
+        player_tag=_normalize_tag(candidate["player_tag"]),
+        player_name=candidate["player_name"],
+        title=t(
+            "chart.war_activity.title_named", lang, name=candidate["player_name"]
+        ),
         lang=lang,
     )
-    await message.answer(report, parse_mode=None)
-    try:
-        await _send_war_activity_chart(
-            message,
-            clan_tag=clan_tag,
-            player_tag=player_tag,
-            title=t(
-                "chart.war_activity.title_named",
-                lang,
-                name=candidate["player_name"],
-            ),
-            lang=lang,
-        )
-    except Exception as e:
-        logger.warning(
-            "Failed to send activity chart: %s", e, exc_info=True
-        )
 
 
-@router.message(Command("admin_link_name"))
+@command_router.message(Command("admin_link_name"))
 async def cmd_admin_link_name(message: Message) -> None:
     """Link a user account by nickname (admin-only, reply required)."""
     lang = await _get_lang_for_message(message)
@@ -4887,11 +5250,7 @@ async def cmd_admin_link_name(message: Message) -> None:
         await message.answer(t("no_permission", lang), parse_mode=None)
         return
 
-    args = ""
-    if message.text:
-        parts = message.text.split(maxsplit=1)
-        if len(parts) > 1:
-            args = parts[1].strip()
+    args = _parse_command_args(message.text)
 
     if not args:
         await message.answer(t("admin_link_missing_nickname", lang), parse_mode=None)
@@ -4906,7 +5265,7 @@ async def cmd_admin_link_name(message: Message) -> None:
     )
 
 
-@router.message(Command("unlink"))
+@command_router.message(Command("unlink"))
 async def cmd_unlink(message: Message) -> None:
     """Unlink a user account (admin-only, reply required)."""
     lang = await _get_lang_for_message(message)
@@ -4941,8 +5300,7 @@ async def cmd_unlink(message: Message) -> None:
         await message.answer(t("unlink_no_account", lang), parse_mode=None)
         return
 
-    await delete_user_link(target_id)
-    await delete_user_link_request(target_id)
+    await delete_user_link_and_request(target_id)
     await message.answer(
         t(
             "unlink_done",
@@ -4954,14 +5312,14 @@ async def cmd_unlink(message: Message) -> None:
     )
 
 
-@router.message(Command("admin_debug"))
+@command_router.message(Command("admin_debug"))
 async def cmd_admin_debug(message: Message) -> None:
     """Dry-run regrant admin rights from /tg links (admin-only)."""
     lang = await _get_lang_for_message(message)
     if message.from_user is None:
         await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(t("use_command_in_group", lang), parse_mode=None)
         return
     try:
@@ -4972,9 +5330,8 @@ async def cmd_admin_debug(message: Message) -> None:
         logger.error("Failed to check admin status: %s", e, exc_info=True)
         await message.answer(t("unable_verify_admin_status", lang), parse_mode=None)
         return
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     plan = await _collect_admin_regrant_candidates(
         message, clan_tag=clan_tag, lang=lang
@@ -5048,14 +5405,14 @@ async def cmd_admin_debug(message: Message) -> None:
     await message.answer("\n".join(lines), parse_mode=None)
 
 
-@router.message(Command("admin_regrant"))
+@command_router.message(Command("admin_regrant"))
 async def cmd_admin_regrant(message: Message) -> None:
     """Regrant admin rights (invite-only) from /tg links (admin-only)."""
     lang = await _get_lang_for_message(message)
     if message.from_user is None:
         await message.answer(t("unable_verify_permissions", lang), parse_mode=None)
         return
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+    if message.chat.type not in _GROUP_CHAT_TYPES:
         await message.answer(t("use_command_in_group", lang), parse_mode=None)
         return
     try:
@@ -5066,9 +5423,8 @@ async def cmd_admin_regrant(message: Message) -> None:
         logger.error("Failed to check admin status: %s", e, exc_info=True)
         await message.answer(t("unable_verify_admin_status", lang), parse_mode=None)
         return
-    clan_tag = _require_clan_tag()
+    clan_tag = await _ensure_clan_tag(message, lang)
     if not clan_tag:
-        await message.answer(t("clan_tag_not_configured", lang), parse_mode=None)
         return
     if not await _bot_has_promote_rights(message):
         await message.answer(t("admin_regrant_bot_no_rights", lang), parse_mode=None)
@@ -5186,16 +5542,29 @@ async def cmd_admin_regrant(message: Message) -> None:
     await message.answer("\n".join(lines), parse_mode=None)
 
 
-@router.message(F.text & (F.chat.type == ChatType.PRIVATE))
+@router.message(PrivateTextFilter())
 async def handle_private_text(message: Message) -> None:
-    if message.text is None or message.text.startswith("/"):
+    text = message.text
+    if not text or text[0] == "/":
         return
     if message.from_user is None:
         return
+    if _ttl_cache_get(_PRIVATE_STATE_MISS_CACHE, message.from_user.id):
+        return
     lang = await _get_lang_for_message(message)
 
     state_key = _apply_state_key(message.from_user.id)
-    apply_state = await get_app_state(state_key)
+    apply_state, request = await get_app_state_and_link_request(
+        state_key, message.from_user.id
+    )
+    if not apply_state and not request:
+        _ttl_cache_set(
+            _PRIVATE_STATE_MISS_CACHE,
+            message.from_user.id,
+            True,
+            PRIVATE_STATE_MISS_TTL_SECONDS,
+        )
+        return
     if apply_state:
         status = apply_state.get("status")
         if status == "awaiting_name":
@@ -5287,7 +5656,6 @@ async def handle_private_text(message: Message) -> None:
             )
             return
 
-    request = await get_user_link_request(message.from_user.id)
     if not request:
         return
 
@@ -5356,13 +5724,12 @@ async def handle_link_select(query: CallbackQuery) -> None:
     if request.get("origin_chat_id") is not None and query.from_user.id != target_user_id:
         source = "admin"
 
-    await upsert_user_link(
+    await link_user_and_clear_request(
         telegram_user_id=target_user_id,
         player_tag=tag,
         player_name=player_name,
         source=source,
     )
-    await delete_user_link_request(target_user_id)
     try:
         chat_ids = await _resolve_admin_grant_chats(
             clan_tag=clan_tag, origin_chat_id=request.get("origin_chat_id")
@@ -5377,28 +5744,17 @@ async def handle_link_select(query: CallbackQuery) -> None:
             exc_info=True,
         )
 
+    # The confirmation goes back to the chat with the buttons when possible,
+    # otherwise straight to the linked user in their own language.
     if query.message is not None:
-        await query.message.answer(
-            t(
-                "link_success",
-                lang,
-                name=player_name,
-                tag=tag,
-            ),
-            parse_mode=None,
-        )
+        success_lang = lang
     else:
-        target_lang = await get_user_language(None, target_user_id)
-        await query.bot.send_message(
-            target_user_id,
-            t(
-                "link_success",
-                target_lang,
-                name=player_name,
-                tag=tag,
-            ),
-            parse_mode=None,
-        )
+        success_lang = await _get_user_language_cached(None, target_user_id)
+    success_text = t("link_success", success_lang, name=player_name, tag=tag)
+    if query.message is not None:
+        await query.message.answer(success_text, parse_mode=None)
+    else:
+        await query.bot.send_message(target_user_id, success_text, parse_mode=None)
 
     await query.answer(t("link_confirm", lang))
 
@@ -5420,6 +5776,7 @@ async def handle_lang_select(query: CallbackQuery) -> None:
         await query.answer(t("lang_not_for_you", DEFAULT_LANG), show_alert=True)
         return
     await set_user_language(target_user_id, lang_code)
+    _invalidate_user_language(target_user_id)
     confirm = (
         f"{t('lang_set_confirm', lang_code)} "
         f"{t('lang_set_change_hint', lang_code)}"
@@ -5432,10 +5789,7 @@ async def handle_lang_select(query: CallbackQuery) -> None:
     await query.answer(confirm, show_alert=False)
 
 
-@router.message(
-    F.chat.type.in_({ChatType.GROUP, ChatType.SUPERGROUP}),
-    ~(F.text.startswith("/") | F.caption.startswith("/")),
-)
+@router.message(F.chat.type.in_(_GROUP_CHAT_TYPES), NonCommandFilter())
 async def trace_catch_all(message: Message) -> None:
     if message.from_user is None or message.from_user.is_bot:
         return
@@ -3,7 +3,7 @@ import subprocess
 import pathlib
 from i18n import TEXT
 
-pattern = re.compile(r"""(?<!\w)t\s*\(\s*['\"]([^'\"]+)['\"]""")
+pattern = re.compile(r"""(?<!\w)(?:t|get_template|get_formatter)\s*\(\s*['\"]([^'\"]+)['\"]""")
 
 
 def git_tracked_py_files():
@@ -316,6 +316,22 @@ PROMOTE_MIN_ALLTIME_WEEKS_COLEADER: int = int(
 # Clash Royale API base URL
 CR_API_BASE_URL: str = os.getenv("CR_API_BASE_URL", "https://api.clashroyale.com/v1")
 
+# Clash Royale API HTTP connection pool
+CR_API_HTTP_POOL_LIMIT: int = int(
+    get_env_var("CR_API_HTTP_POOL_LIMIT", default="16", required=False)
+)
+CR_API_HTTP_KEEPALIVE_SECONDS: int = int(
+    get_env_var("CR_API_HTTP_KEEPALIVE_SECONDS", default="30", required=False)
+)
+
+# Telegram Bot API HTTP connection pool
+TELEGRAM_HTTP_POOL_LIMIT: int = int(
+    get_env_var("TELEGRAM_HTTP_POOL_LIMIT", default="100", required=False)
+)
+TELEGRAM_HTTP_KEEPALIVE_SECONDS: int = int(
+    get_env_var("TELEGRAM_HTTP_KEEPALIVE_SECONDS", default="75", required=False)
+)
+
 # Telegram bot username for deep-linking (optional)
 BOT_USERNAME: str | None = get_env_var("BOT_USERNAME", required=False)
 
@@ -7,7 +7,12 @@ from urllib.parse import quote
 
 import httpx
 
-from config import CR_API_BASE_URL, CR_API_TOKEN
+from config import (
+    CR_API_BASE_URL,
+    CR_API_HTTP_KEEPALIVE_SECONDS,
+    CR_API_HTTP_POOL_LIMIT,
+    CR_API_TOKEN,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +42,13 @@ class ClashRoyaleAPI:
                     "Accept": "application/json",
                 },
                 timeout=30.0,
+                # httpx drops idle sockets after 5s by default; keep them warm
+                # across the bursts of calls made by reports and background jobs.
+                limits=httpx.Limits(
+                    max_connections=CR_API_HTTP_POOL_LIMIT,
+                    max_keepalive_connections=CR_API_HTTP_POOL_LIMIT,
+                    keepalive_expiry=CR_API_HTTP_KEEPALIVE_SECONDS,
+                ),
             )
         return self._client
     
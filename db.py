@@ -120,6 +120,7 @@ class PlayerParticipation(Base):
             "section_index",
             "decks_used",
         ),
+        Index("ix_player_participation_lower_name", text("lower(player_name)")),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -600,6 +601,7 @@ class VerifiedUser(Base):
 
 
 APP_STATE_COLOSSEUM_KEY = "colosseum_index_by_season"
+PLAYER_SEARCH_LIMIT = 25
 
 
 _engine: AsyncEngine | None = None
@@ -645,6 +647,9 @@ async def connect_db() -> None:
         max_overflow = _pool_int("DB_MAX_OVERFLOW", os.getenv("DB_MAX_OVERFLOW"))
         pool_timeout = _pool_int("DB_POOL_TIMEOUT", os.getenv("DB_POOL_TIMEOUT"))
         pool_recycle = _pool_int("DB_POOL_RECYCLE", os.getenv("DB_POOL_RECYCLE"))
+        statement_cache_size = _pool_int(
+            "DB_STATEMENT_CACHE_SIZE", os.getenv("DB_STATEMENT_CACHE_SIZE")
+        )
         if pool_size is not None:
             pool_kwargs["pool_size"] = pool_size
         if max_overflow is not None:
@@ -653,6 +658,12 @@ async def connect_db() -> None:
             pool_kwargs["pool_timeout"] = pool_timeout
         if pool_recycle is not None:
             pool_kwargs["pool_recycle"] = pool_recycle
+        if statement_cache_size is not None:
+            # asyncpg keeps this many prepared statements per pooled connection
+            # (SQLAlchemy defaults to 100); set 0 behind transaction poolers.
+            pool_kwargs["connect_args"] = {
+                "prepared_statement_cache_size": statement_cache_size
+            }
         _engine = create_async_engine(async_url, **pool_kwargs)
         _session_factory = async_sessionmaker(_engine, expire_on_commit=False)
 
@@ -3121,27 +3132,30 @@ async def list_mod_actions(
     if session is None:
         async with _get_session() as session:
             return await list_mod_actions(chat_id, limit=limit, session=session)
+    # Only the columns /modlog renders; ix_mod_actions_chat_created serves the
+    # ORDER BY ... LIMIT as a backward index scan.
     result = await session.execute(
-        select(ModAction)
+        select(
+            ModAction.id,
+            ModAction.target_user_id,
+            ModAction.admin_user_id,
+            ModAction.action,
+            ModAction.created_at,
+        )
         .where(ModAction.chat_id == chat_id)
         .order_by(ModAction.created_at.desc())
         .limit(limit)
     )
-    actions = []
-    for action in result.scalars().all():
-        actions.append(
-            {
-                "id": action.id,
-                "chat_id": action.chat_id,
-                "target_user_id": action.target_user_id,
-                "admin_user_id": action.admin_user_id,
-                "action": action.action,
-                "reason": action.reason,
-                "message_id": action.message_id,
-                "created_at": action.created_at,
-            }
-        )
-    return actions
+    return [
+        {
+            "id": row.id,
+            "target_user_id": row.target_user_id,
+            "admin_user_id": row.admin_user_id,
+            "action": row.action,
+            "created_at": row.created_at,
+        }
+        for row in result.all()
+    ]
 
 
 async def list_mod_actions_for_user(
@@ -3410,6 +3424,70 @@ async def get_user_link_request(
     }
 
 
+async def get_app_state_and_link_request(
+    key: str, telegram_user_id: int, session: AsyncSession | None = None
+) -> tuple[dict[str, Any] | None, dict[str, Any] | None]:
+    """Return the app state under ``key`` and the user's link request."""
+    if session is None:
+        async with _get_session() as session:
+            return await get_app_state_and_link_request(
+                key, telegram_user_id, session=session
+            )
+    state = await get_app_state(key, session=session)
+    request = await get_user_link_request(telegram_user_id, session=session)
+    return state, request
+
+
+async def delete_user_link_and_request(
+    telegram_user_id: int, session: AsyncSession | None = None
+) -> None:
+    if session is None:
+        async with _get_session() as session:
+            try:
+                await delete_user_link_and_request(
+                    telegram_user_id, session=session
+                )
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+        return
+    await delete_user_link(telegram_user_id, session=session)
+    await delete_user_link_request(telegram_user_id, session=session)
+
+
+async def link_user_and_clear_request(
+    telegram_user_id: int,
+    player_tag: str,
+    player_name: str,
+    source: str,
+    session: AsyncSession | None = None,
+) -> None:
+    if session is None:
+        async with _get_session() as session:
+            try:
+                await link_user_and_clear_request(
+                    telegram_user_id,
+                    player_tag,
+                    player_name,
+                    source,
+                    session=session,
+                )
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+        return
+    await upsert_user_link(
+        telegram_user_id=telegram_user_id,
+        player_tag=player_tag,
+        player_name=player_name,
+        source=source,
+        session=session,
+    )
+    await delete_user_link_request(telegram_user_id, session=session)
+
+
 async def upsert_user_link_request(
     telegram_user_id: int,
     status: str,
@@ -3794,6 +3872,26 @@ async def get_latest_challenge(
     return _challenge_to_dict(challenge)
 
 
+async def get_captcha_status(
+    chat_id: int, user_id: int, session: AsyncSession | None = None
+) -> tuple[bool, dict[str, Any] | None]:
+    """Return the verified flag and the pending (or latest) challenge."""
+    if session is None:
+        async with _get_session() as session:
+            try:
+                result = await get_captcha_status(chat_id, user_id, session=session)
+                await session.commit()
+                return result
+            except Exception:
+                await session.rollback()
+                raise
+    is_verified = await is_user_verified(chat_id, user_id, session=session)
+    challenge = await get_pending_challenge(chat_id, user_id, session=session)
+    if not challenge:
+        challenge = await get_latest_challenge(chat_id, user_id, session=session)
+    return is_verified, challenge
+
+
 async def update_challenge_message_id(
     challenge_id: int, message_id: int, session: AsyncSession | None = None
 ) -> None:
@@ -3911,6 +4009,47 @@ async def mark_challenge_passed(
         await session.execute(stmt)
 
 
+async def mark_challenge_passed_and_verify(
+    challenge_id: int,
+    chat_id: int,
+    user_id: int,
+    session: AsyncSession | None = None,
+) -> None:
+    if session is None:
+        async with _get_session() as session:
+            try:
+                await mark_challenge_passed_and_verify(
+                    challenge_id, chat_id, user_id, session=session
+                )
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+        return
+    await mark_challenge_passed(challenge_id, session=session)
+    await set_user_verified(chat_id, user_id, session=session)
+
+
+async def verify_user_and_pass_challenges(
+    chat_id: int,
+    user_id: int,
+    session: AsyncSession | None = None,
+) -> None:
+    if session is None:
+        async with _get_session() as session:
+            try:
+                await verify_user_and_pass_challenges(
+                    chat_id, user_id, session=session
+                )
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+        return
+    await set_user_verified(chat_id, user_id, session=session)
+    await mark_pending_challenges_passed(chat_id, user_id, session=session)
+
+
 async def delete_verified_user(
     chat_id: int, user_id: int, session: AsyncSession | None = None
 ) -> int:
@@ -3974,6 +4113,29 @@ async def mark_challenge_expired(
         await session.execute(stmt)
 
 
+async def expire_overdue_challenges(session: AsyncSession | None = None) -> int:
+    now = _utc_now()
+    stmt = (
+        update(CaptchaChallenge)
+        .where(
+            CaptchaChallenge.status == "pending",
+            CaptchaChallenge.expires_at < now,
+        )
+        .values(status="expired", updated_at=now)
+    )
+    if session is None:
+        async with _get_session() as session:
+            try:
+                result = await session.execute(stmt)
+                await session.commit()
+                return int(result.rowcount or 0)
+            except Exception:
+                await session.rollback()
+                raise
+    result = await session.execute(stmt)
+    return int(result.rowcount or 0)
+
+
 async def touch_last_reminded_at(
     challenge_id: int,
     now: datetime,
@@ -3996,6 +4158,34 @@ async def touch_last_reminded_at(
         await session.execute(stmt)
 
 
+async def update_challenge_message_and_reminded(
+    challenge_id: int,
+    message_id: int,
+    reminded_at: datetime,
+    session: AsyncSession | None = None,
+) -> None:
+    """Record a freshly sent captcha message and its reminder time in one UPDATE."""
+    stmt = (
+        update(CaptchaChallenge)
+        .where(CaptchaChallenge.id == challenge_id)
+        .values(
+            message_id=message_id,
+            last_reminded_at=reminded_at,
+            updated_at=reminded_at,
+        )
+    )
+    if session is None:
+        async with _get_session() as session:
+            try:
+                await session.execute(stmt)
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+    else:
+        await session.execute(stmt)
+
+
 async def search_player_candidates(
     clan_tag: str,
     nickname: str,
@@ -4094,7 +4284,9 @@ async def search_player_candidates(
             ClanMemberDaily.clan_tag == clan_tag,
             ClanMemberDaily.snapshot_date == latest_date,
             ClanMemberDaily.player_name.ilike(f"%{nickname}%"),
-        )
+        ).order_by(
+            func.lower(ClanMemberDaily.player_name), ClanMemberDaily.player_tag
+        ).limit(PLAYER_SEARCH_LIMIT)
         contains_rows = (await session.execute(contains_query)).all()
         if contains_rows:
             return _format_rows(contains_rows, True)
@@ -4106,6 +4298,11 @@ async def search_player_candidates(
         )
         .where(func.lower(PlayerParticipation.player_name) == nickname.lower())
         .group_by(PlayerParticipation.player_tag)
+        .order_by(
+            func.lower(func.max(PlayerParticipation.player_name)),
+            PlayerParticipation.player_tag,
+        )
+        .limit(PLAYER_SEARCH_LIMIT)
     )
     exact_hist = (await session.execute(exact_hist_query)).all()
     if exact_hist:
@@ -4125,6 +4322,11 @@ async def search_player_candidates(
         )
         .where(PlayerParticipation.player_name.ilike(f"%{nickname}%"))
         .group_by(PlayerParticipation.player_tag)
+        .order_by(
+            func.lower(func.max(PlayerParticipation.player_name)),
+            PlayerParticipation.player_tag,
+        )
+        .limit(PLAYER_SEARCH_LIMIT)
     )
     contains_hist = (await session.execute(contains_hist_query)).all()
     return [
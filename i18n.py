@@ -1,5 +1,7 @@
 ﻿"""Simple i18n helper for Telegram-visible text."""
 
+from typing import Callable
+
 DEFAULT_LANG = "ru"
 
 TEXT = {
@@ -2085,15 +2087,41 @@ TEXT = {
 }
 
 
+# Per-language tables with the default-language fallback already merged in,
+# so a lookup is a single dict access.
+_RESOLVED_TEXT: dict[str, dict[str, str]] = {
+    lang: {**TEXT.get(DEFAULT_LANG, {}), **lang_dict}
+    for lang, lang_dict in TEXT.items()
+}
+
+
+def get_template(key: str, lang: str = DEFAULT_LANG) -> str:
+    templates = _RESOLVED_TEXT.get(lang) or _RESOLVED_TEXT.get(DEFAULT_LANG, {})
+    template = templates.get(key)
+    if template is None:
+        return f"[MISSING:{key}]"
+    return template
+
+
 def t(key: str, lang: str = DEFAULT_LANG, **fmt) -> str:
-    lang_dict = TEXT.get(lang, {})
-    if key in lang_dict:
-        template = lang_dict[key]
-    else:
-        template = TEXT.get(DEFAULT_LANG, {}).get(key, f"[MISSING:{key}]")
+    template = get_template(key, lang)
     try:
         return template.format(**fmt)
     except Exception:
         return template
 
 
+def get_formatter(key: str, lang: str = DEFAULT_LANG) -> Callable[..., str]:
+    """Return a ``t(key, lang, **fmt)`` equivalent with the template resolved once."""
+    template = get_template(key, lang)
+    format_template = template.format
+
+    def _format(**fmt) -> str:
+        try:
+            return format_template(**fmt)
+        except Exception:
+            return template
+
+    return _format
+
+
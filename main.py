@@ -4,15 +4,27 @@ import asyncio
 import inspect
 import logging
 import os
+import ssl
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone, date, timedelta
 
+import aiogram
+import certifi
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.enums import ChatMemberStatus, ParseMode
 from aiogram.types import ChatPermissions
-
-from bot import router, moderation_router
+from aiohttp import ClientSession, TCPConnector, hdrs
+from aiohttp.http import SERVER_SOFTWARE
+
+from bot import (
+    command_router,
+    moderation_router,
+    modlog_flush_task,
+    router,
+    shutdown_chart_executor,
+)
 from config import (
     AUTO_INVITE_BATCH_SIZE,
     AUTO_INVITE_CHECK_INTERVAL_MINUTES,
@@ -23,6 +35,7 @@ from config import (
     CLAN_PLACE_GAP_HOURS,
     CLAN_PLACE_GAP_THRESHOLD,
     CR_API_TOKEN,
+    ENABLE_CAPTCHA,
     FETCH_INTERVAL_SECONDS,
     MODLOG_CHAT_ID,
     RANKING_AUTOPOST_DAY,
@@ -37,6 +50,8 @@ from config import (
     REMINDER_WAR_BANNER_URL_DAY4,
     TRAINING_DAYS_FALLBACK,
     TELEGRAM_BOT_TOKEN,
+    TELEGRAM_HTTP_KEEPALIVE_SECONDS,
+    TELEGRAM_HTTP_POOL_LIMIT,
     require_env_value,
 )
 from cr_api import get_api_client, close_api_client, ClashRoyaleAPIError
@@ -48,6 +63,7 @@ from db import (
     get_colosseum_index_for_season,
     get_app_state,
     delete_app_state,
+    expire_overdue_challenges,
     get_user_link,
     get_enabled_clan_chats,
     get_first_snapshot_date_for_week,
@@ -108,6 +124,13 @@ CR_API_FORBIDDEN_ALERT_KEY = "cr_api_403_alert"
 CR_API_FORBIDDEN_ALERT_COOLDOWN = timedelta(minutes=30)
 ADMIN_GRANT_QUEUE_KEY = "admin_grant_queue"
 ADMIN_GRANT_TTL = timedelta(hours=1)
+CAPTCHA_EXPIRY_SWEEP_SECONDS = 60
+_UNMUTED_PERMS = ChatPermissions(
+    can_send_messages=True,
+    can_send_media_messages=True,
+    can_send_other_messages=True,
+    can_add_web_page_previews=True,
+)
 BOT: Bot | None = None
 
 
@@ -1812,12 +1835,7 @@ async def scheduled_unmute_task(bot: Bot) -> None:
                         await bot.restrict_chat_member(
                             chat_id,
                             user_id,
-                            permissions=ChatPermissions(
-                                can_send_messages=True,
-                                can_send_media_messages=True,
-                                can_send_other_messages=True,
-                                can_add_web_page_previews=True,
-                            ),
+                            permissions=_UNMUTED_PERMS,
                         )
                     except Exception as e:
                         logger.warning(
@@ -1904,6 +1922,22 @@ def _parse_admin_grant_time(value: object, now: datetime) -> datetime:
     return parsed
 
 
+async def captcha_expiry_task() -> None:
+    logger.info("Captcha expiry sweep started")
+    while True:
+        try:
+            expired = await expire_overdue_challenges()
+            if expired:
+                logger.info("Expired %s overdue captcha challenges", expired)
+            await asyncio.sleep(CAPTCHA_EXPIRY_SWEEP_SECONDS)
+        except asyncio.CancelledError:
+            logger.info("Captcha expiry sweep cancelled")
+            break
+        except Exception as e:
+            logger.error("Error in captcha expiry sweep: %s", e, exc_info=True)
+            await asyncio.sleep(CAPTCHA_EXPIRY_SWEEP_SECONDS)
+
+
 async def admin_grant_task(bot: Bot) -> None:
     logger.info("Admin grant task started")
     while True:
@@ -2002,13 +2036,17 @@ async def lifespan(dispatcher: Dispatcher):
     unmute_task = None
     clan_place_task = None
     admin_grant_task_handle = None
+    captcha_expiry_task_handle = None
     if REMINDER_ENABLED:
         reminder_task = asyncio.create_task(daily_reminder_task(BOT))
     if AUTO_INVITE_ENABLED:
         invite_task = asyncio.create_task(auto_invite_task(BOT))
+    if ENABLE_CAPTCHA:
+        captcha_expiry_task_handle = asyncio.create_task(captcha_expiry_task())
     unmute_task = asyncio.create_task(scheduled_unmute_task(BOT))
     admin_grant_task_handle = asyncio.create_task(admin_grant_task(BOT))
     clan_place_task = asyncio.create_task(clan_place_watchdog_task(BOT))
+    modlog_task = asyncio.create_task(modlog_flush_task())
     logger.info("Scheduled unmute notification task started")
     logger.info("Background fetch task started")
     
@@ -2027,6 +2065,8 @@ async def lifespan(dispatcher: Dispatcher):
         unmute_task.cancel()
     if admin_grant_task_handle is not None:
         admin_grant_task_handle.cancel()
+    if captcha_expiry_task_handle is not None:
+        captcha_expiry_task_handle.cancel()
     if clan_place_task is not None:
         clan_place_task.cancel()
     try:
@@ -2053,24 +2093,87 @@ async def lifespan(dispatcher: Dispatcher):
             await admin_grant_task_handle
         except asyncio.CancelledError:
             pass
+    if captcha_expiry_task_handle is not None:
+        try:
+            await captcha_expiry_task_handle
+        except asyncio.CancelledError:
+            pass
     if clan_place_task is not None:
         try:
             await clan_place_task
         except asyncio.CancelledError:
             pass
+    # Stop the modlog flusher last so entries queued during shutdown are sent.
+    modlog_task.cancel()
+    try:
+        await modlog_task
+    except asyncio.CancelledError:
+        pass
     
+    shutdown_chart_executor()
+
     # Close connections
     await close_api_client()
     await close_db()
     logger.info("Cleanup complete")
 
 
+class KeepAliveAiohttpSession(AiohttpSession):
+    """AiohttpSession whose connector keeps idle sockets open for longer.
+
+    aiogram only exposes the pool size, so the ClientSession is built here
+    through the public create_session/close hooks instead of its internals.
+    """
+
+    def __init__(self, *, limit: int, keepalive_timeout: float) -> None:
+        super().__init__(limit=limit)
+        self._pool_limit = limit
+        self._keepalive_timeout = keepalive_timeout
+        self._client_session: ClientSession | None = None
+
+    async def create_session(self) -> ClientSession:
+        if self._client_session is None or self._client_session.closed:
+            self._client_session = ClientSession(
+                connector=TCPConnector(
+                    ssl=ssl.create_default_context(cafile=certifi.where()),
+                    limit=self._pool_limit,
+                    ttl_dns_cache=3600,
+                    keepalive_timeout=self._keepalive_timeout,
+                ),
+                headers={
+                    hdrs.USER_AGENT: (
+                        f"{SERVER_SOFTWARE} aiogram/{aiogram.__version__}"
+                    ),
+                },
+            )
+        return self._client_session
+
+    async def close(self) -> None:
+        if self._client_session is not None and not self._client_session.closed:
+            await self._client_session.close()
+            # Let the underlying SSL connections close gracefully.
+            await asyncio.sleep(0.25)
+
+
+def _build_bot_session() -> AiohttpSession:
+    # Keep idle sockets longer than aiohttp's 15s default so sporadic handler
+    # calls reuse TLS connections.
+    return KeepAliveAiohttpSession(
+        limit=TELEGRAM_HTTP_POOL_LIMIT,
+        keepalive_timeout=TELEGRAM_HTTP_KEEPALIVE_SECONDS,
+    )
+
+
 async def main() -> None:
     """Main function to run the bot."""
     token = _ensure_required_config()
     # Create bot instance
     bot = Bot(
         token=token,
+        session=_build_bot_session(),
+        # Plain text by default. Handlers still pass parse_mode=None explicitly
+        # because their texts embed player and user names that must never be
+        # parsed as markup, whatever default a future Bot instance carries.
         default=DefaultBotProperties(parse_mode=None),
     )
     global BOT
@@ -2081,12 +2184,17 @@ async def main() -> None:
     
     # Register router with handlers
     dp.include_router(moderation_router)
+    dp.include_router(command_router)
     dp.include_router(router)
     
-    # Run bot with lifespan management
-    async with lifespan(dp):
-        logger.info("Bot is starting polling...")
-        await dp.start_polling(bot)
+    # Run bot with lifespan management. The session outlives polling so the
+    # lifespan shutdown (modlog drain) can still reach Telegram.
+    try:
+        async with lifespan(dp):
+            logger.info("Bot is starting polling...")
+            await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        await bot.session.close()
 
 
 if __name__ == "__main__":
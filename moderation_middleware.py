@@ -15,6 +15,8 @@ from db import get_app_state, get_pending_challenge
 
 logger = logging.getLogger(__name__)
 
+_GROUP_CHAT_TYPES = frozenset({ChatType.GROUP, ChatType.SUPERGROUP})
+
 
 class ModerationPolicyMiddleware(BaseMiddleware):
     async def __call__(
@@ -29,12 +31,11 @@ class ModerationPolicyMiddleware(BaseMiddleware):
             return await handler(event, data)
 
         message = event
-        if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+        if message.chat.type not in _GROUP_CHAT_TYPES:
             return await handler(event, data)
 
-        text = message.text or ""
-        caption = message.caption or ""
-        if text.startswith("/") or caption.startswith("/"):
+        text = message.text or message.caption
+        if text and text[0] == "/":
             return await handler(event, data)
 
         if message.from_user is None:
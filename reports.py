@@ -74,7 +74,7 @@ from db import (
     save_river_race_place_snapshot,
 )
 from riverrace_import import get_last_completed_weeks
-from i18n import DEFAULT_LANG, t
+from i18n import DEFAULT_LANG, get_formatter, t
 
 NAME_WIDTH = 20
 HEADER_LINE = "══════════════════════════════"
@@ -144,6 +144,7 @@ def _format_entries(
     decks_width = max(decks_width, 2)
     fame_width = max(fame_width, 2)
 
+    line_format = get_formatter("report_entry_line", lang)
     lines: list[str] = []
     for index, row in enumerate(rows, 1):
         name = _format_name(row.get("player_name"), lang)
@@ -155,9 +156,7 @@ def _format_entries(
                 row.get("player_tag"), donations_wtd, lang=lang
             )
         lines.append(
-            t(
-                "report_entry_line",
-                lang,
+            line_format(
                 index=index,
                 name=name,
                 decks=decks_used,
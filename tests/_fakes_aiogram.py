@@ -37,6 +37,7 @@ class FakeBot:
     restrict_chat_member: AsyncMock = field(default_factory=AsyncMock)
     ban_chat_member: AsyncMock = field(default_factory=AsyncMock)
     get_chat_member: AsyncMock = field(default_factory=AsyncMock)
+    get_chat: AsyncMock = field(default_factory=AsyncMock)
     get_me: AsyncMock = field(default_factory=AsyncMock)
     promote_chat_member: AsyncMock = field(default_factory=AsyncMock)
     set_chat_administrator_custom_title: AsyncMock = field(default_factory=AsyncMock)
@@ -52,7 +53,9 @@ class FakeMessage:
         "entities",
         "caption_entities",
         "message_id",
+        "reply_to_message",
         "answer",
+        "answer_photo",
         "_delete_mock",
     )
 
@@ -67,6 +70,7 @@ class FakeMessage:
         entities: list[FakeEntity] | None = None,
         caption_entities: list[FakeEntity] | None = None,
         message_id: int = 1,
+        reply_to_message: "FakeMessage | None" = None,
     ):
         self.bot = bot
         self.chat = chat
@@ -76,7 +80,9 @@ class FakeMessage:
         self.entities = entities or []
         self.caption_entities = caption_entities or []
         self.message_id = message_id
+        self.reply_to_message = reply_to_message
         self.answer = AsyncMock()
+        self.answer_photo = AsyncMock()
         self._delete_mock = AsyncMock()
 
     async def delete(self) -> None:
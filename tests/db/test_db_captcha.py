@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta, timezone
+import unittest
+
+try:
+    from sqlalchemy import text
+except Exception:
+    raise unittest.SkipTest("sqlalchemy not available")
+
+from db import (
+    expire_overdue_challenges,
+    get_captcha_status,
+    get_latest_challenge,
+    mark_challenge_passed_and_verify,
+    update_challenge_message_and_reminded,
+    verify_user_and_pass_challenges,
+)
+from tests._db_harness import DBTestCase
+from tests._seed import seed_captcha
+
+
+class DBCaptchaTests(DBTestCase):
+    async def test_update_challenge_message_and_reminded_sets_both(self) -> None:
+        chat_id = -200300
+        user_id = 7001
+        await seed_captcha(self.session, chat_id=chat_id, user_id=user_id)
+        challenge = await get_latest_challenge(chat_id, user_id, session=self.session)
+        assert challenge is not None
+        reminded_at = datetime(2026, 2, 10, 12, 0, tzinfo=timezone.utc)
+
+        await update_challenge_message_and_reminded(
+            challenge["id"], 4242, reminded_at, session=self.session
+        )
+
+        row = (
+            await self.session.execute(
+                text(
+                    "SELECT message_id, last_reminded_at "
+                    "FROM captcha_challenges WHERE id = :challenge_id"
+                ),
+                {"challenge_id": challenge["id"]},
+            )
+        ).first()
+        assert row is not None
+        self.assertEqual(4242, row._mapping["message_id"])
+        self.assertEqual(reminded_at, row._mapping["last_reminded_at"])
+
+    async def test_captcha_status_falls_back_to_latest_challenge(self) -> None:
+        chat_id = -200301
+        user_id = 7002
+        await seed_captcha(
+            self.session,
+            chat_id=chat_id,
+            user_id=user_id,
+            challenge_status="passed",
+            verified=True,
+        )
+
+        is_verified, challenge = await get_captcha_status(
+            chat_id, user_id, session=self.session
+        )
+
+        self.assertTrue(is_verified)
+        assert challenge is not None
+        self.assertEqual("passed", challenge["status"])
+
+    async def test_captcha_status_prefers_pending_challenge(self) -> None:
+        chat_id = -200302
+        user_id = 7003
+        await seed_captcha(self.session, chat_id=chat_id, user_id=user_id)
+
+        is_verified, challenge = await get_captcha_status(
+            chat_id, user_id, session=self.session
+        )
+
+        self.assertFalse(is_verified)
+        assert challenge is not None
+        self.assertEqual("pending", challenge["status"])
+
+    async def test_mark_challenge_passed_and_verify(self) -> None:
+        chat_id = -200303
+        user_id = 7004
+        await seed_captcha(self.session, chat_id=chat_id, user_id=user_id)
+        challenge = await get_latest_challenge(chat_id, user_id, session=self.session)
+        assert challenge is not None
+
+        await mark_challenge_passed_and_verify(
+            challenge["id"], chat_id, user_id, session=self.session
+        )
+
+        is_verified, challenge = await get_captcha_status(
+            chat_id, user_id, session=self.session
+        )
+        self.assertTrue(is_verified)
+        assert challenge is not None
+        self.assertEqual("passed", challenge["status"])
+
+    async def test_verify_user_and_pass_challenges(self) -> None:
+        chat_id = -200306
+        user_id = 7007
+        await seed_captcha(self.session, chat_id=chat_id, user_id=user_id)
+
+        await verify_user_and_pass_challenges(chat_id, user_id, session=self.session)
+
+        is_verified, challenge = await get_captcha_status(
+            chat_id, user_id, session=self.session
+        )
+        self.assertTrue(is_verified)
+        assert challenge is not None
+        self.assertEqual("passed", challenge["status"])
+
+    async def test_expire_overdue_challenges_only_touches_overdue(self) -> None:
+        await seed_captcha(self.session, chat_id=-200304, user_id=7005)
+        await seed_captcha(self.session, chat_id=-200305, user_id=7006)
+        overdue = await get_latest_challenge(-200304, 7005, session=self.session)
+        assert overdue is not None
+        await self.session.execute(
+            text(
+                "UPDATE captcha_challenges SET expires_at = :expires_at "
+                "WHERE id = :challenge_id"
+            ),
+            {
+                "expires_at": datetime.now(timezone.utc) - timedelta(minutes=1),
+                "challenge_id": overdue["id"],
+            },
+        )
+
+        expired = await expire_overdue_challenges(session=self.session)
+
+        self.assertEqual(1, expired)
+        overdue = await get_latest_challenge(-200304, 7005, session=self.session)
+        fresh = await get_latest_challenge(-200305, 7006, session=self.session)
+        assert overdue is not None and fresh is not None
+        self.assertEqual("expired", overdue["status"])
+        self.assertEqual("pending", fresh["status"])
@@ -1,5 +1,6 @@
 from datetime import date, datetime, timezone
 import unittest
+from unittest.mock import patch
 
 try:
     import sqlalchemy  # noqa: F401
@@ -11,6 +12,7 @@ from db import (
     get_donation_week_start_date,
     get_donation_weekly_sums_for_window,
     get_last_seen_map,
+    search_player_candidates,
 )
 from tests._db_harness import DBTestCase
 from tests._seed import seed_donations, seed_members
@@ -49,6 +51,24 @@ class DBMembershipAndDonationsTests(DBTestCase):
         self.assertIn("#C", last_seen)
         self.assertIsNone(last_seen["#C"])
 
+    async def test_search_player_candidates_limit_keeps_first_names(self) -> None:
+        clan_tag = "#CLAN"
+        await seed_members(
+            self.session,
+            clan_tag=clan_tag,
+            snapshot_date=date(2026, 2, 10),
+            members=[
+                {"player_tag": "#Z1", "player_name": "zbob"},
+                {"player_tag": "#A2", "player_name": "Bobby"},
+                {"player_tag": "#M3", "player_name": "abob"},
+            ],
+        )
+        with patch("db.PLAYER_SEARCH_LIMIT", 2):
+            rows = await search_player_candidates(
+                clan_tag, "bo", session=self.session
+            )
+        self.assertEqual(["abob", "Bobby"], [row["player_name"] for row in rows])
+
     def test_get_donation_week_start_date(self) -> None:
         dt = datetime(2026, 2, 11, 5, 0, tzinfo=timezone.utc)  # Wed
         week_start = get_donation_week_start_date(dt)
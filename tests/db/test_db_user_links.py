@@ -0,0 +1,76 @@
+import unittest
+
+try:
+    import sqlalchemy  # noqa: F401
+except Exception:
+    raise unittest.SkipTest("sqlalchemy not available")
+
+from db import (
+    delete_user_link_and_request,
+    get_app_state_and_link_request,
+    get_user_link,
+    get_user_link_request,
+    link_user_and_clear_request,
+    set_app_state,
+    upsert_user_link,
+    upsert_user_link_request,
+)
+from tests._db_harness import DBTestCase
+
+
+class DBUserLinksTests(DBTestCase):
+    async def test_app_state_and_link_request_are_read_together(self) -> None:
+        await set_app_state(
+            "apply:501", {"status": "awaiting_name"}, session=self.session
+        )
+        await upsert_user_link_request(
+            telegram_user_id=501,
+            status="awaiting_choice",
+            origin_chat_id=None,
+            session=self.session,
+        )
+
+        state, request = await get_app_state_and_link_request(
+            "apply:501", 501, session=self.session
+        )
+
+        self.assertEqual({"status": "awaiting_name"}, state)
+        assert request is not None
+        self.assertEqual("awaiting_choice", request["status"])
+
+    async def test_delete_user_link_and_request_removes_both(self) -> None:
+        await upsert_user_link(
+            telegram_user_id=502,
+            player_tag="#P502",
+            player_name="Player 502",
+            source="self",
+            session=self.session,
+        )
+        await upsert_user_link_request(
+            telegram_user_id=502,
+            status="awaiting_name",
+            origin_chat_id=None,
+            session=self.session,
+        )
+
+        await delete_user_link_and_request(502, session=self.session)
+
+        self.assertIsNone(await get_user_link(502, session=self.session))
+        self.assertIsNone(await get_user_link_request(502, session=self.session))
+
+    async def test_link_user_and_clear_request(self) -> None:
+        await upsert_user_link_request(
+            telegram_user_id=503,
+            status="awaiting_choice",
+            origin_chat_id=None,
+            session=self.session,
+        )
+
+        await link_user_and_clear_request(
+            503, "#P503", "Player 503", "self", session=self.session
+        )
+
+        link = await get_user_link(503, session=self.session)
+        assert link is not None
+        self.assertEqual("#P503", link["player_tag"])
+        self.assertIsNone(await get_user_link_request(503, session=self.session))
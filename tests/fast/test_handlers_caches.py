@@ -0,0 +1,431 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+try:
+    from aiogram.enums import ChatMemberStatus, ChatType
+except Exception:
+    raise unittest.SkipTest("aiogram not available")
+
+try:
+    from bot import handlers as h
+except Exception:
+    raise unittest.SkipTest("bot.handlers dependencies not available")
+
+from tests._fakes_aiogram import FakeBot, FakeChat, FakeMessage, FakeUser
+
+
+class AdminStatusCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._ADMIN_STATUS_CACHE.clear()
+        self.bot = FakeBot()
+        self.bot.get_chat_member.return_value = SimpleNamespace(
+            status=ChatMemberStatus.CREATOR
+        )
+        self.chat = FakeChat(id=-100200, type=ChatType.SUPERGROUP)
+
+    def _message(self, user_id: int) -> FakeMessage:
+        return FakeMessage(
+            bot=self.bot,
+            chat=self.chat,
+            from_user=FakeUser(id=user_id),
+            text="/modlog",
+        )
+
+    async def test_repeated_checks_hit_cache(self) -> None:
+        message = self._message(7)
+        self.assertTrue(await h._is_admin_user(message, 7))
+        self.assertTrue(await h._is_admin_user(message, 7))
+        self.bot.get_chat_member.assert_awaited_once_with(self.chat.id, 7)
+
+    async def test_expired_entry_is_refetched(self) -> None:
+        message = self._message(7)
+        with patch("bot.handlers.ADMIN_STATUS_CACHE_TTL_SECONDS", 0):
+            await h._is_admin_user(message, 7)
+            await h._is_admin_user(message, 7)
+        self.assertEqual(2, self.bot.get_chat_member.await_count)
+
+    async def test_configured_admin_skips_api(self) -> None:
+        message = self._message(7)
+        with patch("bot.handlers.ADMIN_USER_IDS", {7}):
+            self.assertTrue(await h._is_admin_user(message, 7))
+        self.bot.get_chat_member.assert_not_awaited()
+
+    async def test_member_update_invalidates_entry(self) -> None:
+        message = self._message(7)
+        await h._is_admin_user(message, 7)
+        event = SimpleNamespace(
+            bot=self.bot,
+            chat=self.chat,
+            old_chat_member=SimpleNamespace(
+                status=ChatMemberStatus.CREATOR, user=FakeUser(id=7)
+            ),
+            new_chat_member=SimpleNamespace(
+                status=ChatMemberStatus.MEMBER, user=FakeUser(id=7)
+            ),
+        )
+        with patch("bot.handlers.ENABLE_CAPTCHA", False):
+            await h.handle_member_join(event)
+        self.assertNotIn((self.chat.id, 7), h._ADMIN_STATUS_CACHE)
+
+
+class ModDebugCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._MOD_DEBUG_CACHE.clear()
+
+    async def test_state_is_read_once_within_ttl(self) -> None:
+        get_state = AsyncMock(return_value=None)
+        with patch("bot.handlers.get_app_state", new=get_state):
+            self.assertFalse(await h._is_mod_debug(-1))
+            self.assertFalse(await h._is_mod_debug(-1))
+        get_state.assert_awaited_once()
+
+    async def test_toggle_updates_cache(self) -> None:
+        message = FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=-1, type=ChatType.SUPERGROUP),
+            from_user=FakeUser(id=5),
+            text="/mod_debug_on",
+        )
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch(
+            "bot.handlers._is_admin_user", new=AsyncMock(return_value=True)
+        ), patch("bot.handlers.set_app_state", new=AsyncMock()), patch(
+            "bot.handlers.get_app_state", new=AsyncMock(return_value=None)
+        ) as get_state:
+            await h.cmd_mod_debug_on(message)
+            self.assertTrue(await h._is_mod_debug(-1))
+        get_state.assert_not_awaited()
+
+
+class CaptchaQuestionCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._CAPTCHA_QUESTION_CACHE.clear()
+
+    async def test_question_is_fetched_once(self) -> None:
+        question = {"id": 3, "question_text": "2+2?", "correct_option": 1}
+        fetch = AsyncMock(return_value=question)
+        with patch("bot.handlers.get_captcha_question", new=fetch):
+            self.assertEqual(question, await h._get_captcha_question_cached(3))
+            self.assertEqual(question, await h._get_captcha_question_cached(3))
+        fetch.assert_awaited_once_with(3)
+
+    async def test_missing_question_is_not_cached(self) -> None:
+        fetch = AsyncMock(return_value=None)
+        with patch("bot.handlers.get_captcha_question", new=fetch):
+            self.assertIsNone(await h._get_captcha_question_cached(4))
+            self.assertIsNone(await h._get_captcha_question_cached(4))
+        self.assertEqual(2, fetch.await_count)
+
+
+class UsernameCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._USERNAME_CACHE.clear()
+        self.bot = FakeBot()
+        self.semaphore = asyncio.Semaphore(1)
+
+    async def test_username_is_fetched_once_within_ttl(self) -> None:
+        self.bot.get_chat.return_value = SimpleNamespace(username="alice")
+        for _ in range(2):
+            self.assertEqual(
+                "alice", await h._resolve_username(self.bot, 7, self.semaphore)
+            )
+        self.bot.get_chat.assert_awaited_once_with(7)
+
+    async def test_missing_username_is_cached(self) -> None:
+        self.bot.get_chat.return_value = SimpleNamespace(username=None)
+        for _ in range(2):
+            self.assertIsNone(await h._resolve_username(self.bot, 7, self.semaphore))
+        self.bot.get_chat.assert_awaited_once()
+
+    async def test_lookup_error_is_not_cached(self) -> None:
+        self.bot.get_chat.side_effect = RuntimeError("boom")
+        self.assertIsNone(await h._resolve_username(self.bot, 7, self.semaphore))
+        self.assertNotIn(7, h._USERNAME_CACHE)
+
+
+class UserLanguageCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._LANG_CACHE.clear()
+        self.message = FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=-100200, type=ChatType.SUPERGROUP),
+            from_user=FakeUser(id=7),
+            text="/ping",
+        )
+
+    async def test_language_is_read_once_within_ttl(self) -> None:
+        get_lang = AsyncMock(return_value="en")
+        with patch("bot.handlers.get_user_language", new=get_lang):
+            self.assertEqual("en", await h._get_lang_for_message(self.message))
+            self.assertEqual("en", await h._get_lang_for_message(self.message))
+        get_lang.assert_awaited_once_with(-100200, 7)
+
+    async def test_language_change_invalidates_all_user_entries(self) -> None:
+        get_lang = AsyncMock(return_value="ru")
+        with patch("bot.handlers.get_user_language", new=get_lang):
+            await h._get_lang_for_message(self.message)
+            await h._get_user_language_cached(None, 7)
+            await h._get_user_language_cached(None, 8)
+        query = SimpleNamespace(
+            data="lang_select:7:en",
+            from_user=FakeUser(id=7),
+            message=None,
+            answer=AsyncMock(),
+        )
+        with patch("bot.handlers.set_user_language", new=AsyncMock()):
+            await h.handle_lang_select(query)
+        self.assertEqual([(None, 8)], list(h._LANG_CACHE))
+
+
+    def _admin_reply(self, text: str) -> FakeMessage:
+        chat = FakeChat(id=-100200, type=ChatType.SUPERGROUP)
+        bot = FakeBot()
+        target = FakeMessage(bot=bot, chat=chat, from_user=FakeUser(id=7))
+        return FakeMessage(
+            bot=bot,
+            chat=chat,
+            from_user=FakeUser(id=1),
+            text=text,
+            reply_to_message=target,
+        )
+
+    async def test_captcha_unverify_invalidates_target_language(self) -> None:
+        h._LANG_CACHE[(-100200, 7)] = ("ru", float("inf"))
+        h._LANG_CACHE[(-100200, 8)] = ("uk", float("inf"))
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._is_debug_admin", return_value=True), patch(
+            "bot.handlers.send_modlog", new=AsyncMock()
+        ), patch(
+            "bot.handlers.delete_verified_user", new=AsyncMock()
+        ):
+            await h.cmd_captcha_unverify(self._admin_reply("/captcha_unverify"))
+        self.assertEqual([(-100200, 8)], list(h._LANG_CACHE))
+
+    async def test_captcha_reset_invalidates_target_language(self) -> None:
+        h._LANG_CACHE[(-100200, 7)] = ("ru", float("inf"))
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._is_debug_admin", return_value=True), patch(
+            "bot.handlers.send_modlog", new=AsyncMock()
+        ), patch(
+            "bot.handlers.expire_active_challenges", new=AsyncMock()
+        ), patch(
+            "bot.handlers.delete_verified_user", new=AsyncMock()
+        ), patch(
+            "bot.handlers.get_or_create_pending_challenge",
+            new=AsyncMock(return_value=(None, None)),
+        ):
+            await h.cmd_captcha_reset(self._admin_reply("/captcha_reset"))
+        self.assertEqual([], list(h._LANG_CACHE))
+
+
+class ClanNameCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._CLAN_NAME_CACHE.clear()
+
+    async def test_clan_name_is_fetched_once_within_ttl(self) -> None:
+        api_client = SimpleNamespace(
+            get_clan=AsyncMock(return_value={"name": "Royals"})
+        )
+        with patch(
+            "bot.handlers.get_api_client", new=AsyncMock(return_value=api_client)
+        ):
+            self.assertEqual("Royals", await h._get_clan_name("#CLAN"))
+            self.assertEqual("Royals", await h._get_clan_name("#CLAN"))
+        api_client.get_clan.assert_awaited_once_with("#CLAN")
+
+    async def test_api_error_is_not_cached(self) -> None:
+        api_client = SimpleNamespace(
+            get_clan=AsyncMock(side_effect=RuntimeError("timeout"))
+        )
+        with patch(
+            "bot.handlers.get_api_client", new=AsyncMock(return_value=api_client)
+        ):
+            self.assertIsNone(await h._get_clan_name("#CLAN"))
+        self.assertNotIn("#CLAN", h._CLAN_NAME_CACHE)
+
+
+class PlayerSearchCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._PLAYER_SEARCH_CACHE.clear()
+
+    async def test_search_is_cached_case_insensitively(self) -> None:
+        rows = [{"player_tag": "#AAA", "player_name": "Bob", "in_clan": True}]
+        search = AsyncMock(return_value=rows)
+        with patch("bot.handlers.search_player_candidates", new=search):
+            self.assertEqual(
+                rows, await h._search_player_candidates_cached("#C", "Bob")
+            )
+            self.assertEqual(
+                rows, await h._search_player_candidates_cached("#C", " bob ")
+            )
+        search.assert_awaited_once_with("#C", "Bob")
+
+    async def test_empty_result_is_not_cached(self) -> None:
+        search = AsyncMock(return_value=[])
+        with patch("bot.handlers.search_player_candidates", new=search):
+            await h._search_player_candidates_cached("#C", "nobody")
+            await h._search_player_candidates_cached("#C", "nobody")
+        self.assertEqual(2, search.await_count)
+
+
+class PrivateStateMissCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._PRIVATE_STATE_MISS_CACHE.clear()
+        self.message = FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=7, type=ChatType.PRIVATE),
+            from_user=FakeUser(id=7),
+            text="hello",
+        )
+
+    async def test_stateless_user_skips_lookup_within_ttl(self) -> None:
+        lookup = AsyncMock(return_value=(None, None))
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers.get_app_state_and_link_request", new=lookup):
+            await h.handle_private_text(self.message)
+            await h.handle_private_text(self.message)
+        lookup.assert_awaited_once()
+
+    async def test_new_link_request_clears_miss(self) -> None:
+        lookup = AsyncMock(return_value=(None, None))
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers.get_app_state_and_link_request", new=lookup):
+            await h.handle_private_text(self.message)
+        link_message = FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=7, type=ChatType.PRIVATE),
+            from_user=FakeUser(id=7),
+            text="/my_activity",
+        )
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._require_clan_tag", return_value="#CLAN"), patch(
+            "bot.handlers.get_user_link", new=AsyncMock(return_value=None)
+        ), patch(
+            "bot.handlers.upsert_user_link_request", new=AsyncMock()
+        ):
+            await h.cmd_my_activity(link_message)
+        self.assertNotIn(7, h._PRIVATE_STATE_MISS_CACHE)
+
+
+class PendingCaptchaMissCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._PENDING_CAPTCHA_MISS_CACHE.clear()
+
+    async def test_verified_member_skips_lookup_within_ttl(self) -> None:
+        lookup = AsyncMock(return_value=None)
+        with patch("bot.handlers.ENABLE_CAPTCHA", True), patch(
+            "bot.handlers.get_pending_challenge", new=lookup
+        ):
+            self.assertFalse(await h.is_user_pending_captcha(-1, 7))
+            self.assertFalse(await h.is_user_pending_captcha(-1, 7))
+        lookup.assert_awaited_once_with(-1, 7)
+
+    async def test_pending_member_is_not_cached(self) -> None:
+        lookup = AsyncMock(return_value={"id": 3})
+        with patch("bot.handlers.ENABLE_CAPTCHA", True), patch(
+            "bot.handlers.get_pending_challenge", new=lookup
+        ):
+            self.assertTrue(await h.is_user_pending_captcha(-1, 7))
+            self.assertTrue(await h.is_user_pending_captcha(-1, 7))
+        self.assertEqual(2, lookup.await_count)
+
+    async def test_new_challenge_clears_miss(self) -> None:
+        lookup = AsyncMock(side_effect=[None, {"id": 3}])
+        with patch("bot.handlers.ENABLE_CAPTCHA", True), patch(
+            "bot.handlers.get_pending_challenge", new=lookup
+        ):
+            self.assertFalse(await h.is_user_pending_captcha(-1, 7))
+            h._clear_pending_captcha_miss(-1, 7)
+            self.assertTrue(await h.is_user_pending_captcha(-1, 7))
+
+
+class BotUsernameCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.addCleanup(setattr, h, "_BOT_USERNAME_CACHE", None)
+        h._BOT_USERNAME_CACHE = None
+        self.bot = FakeBot()
+        self.message = FakeMessage(
+            bot=self.bot,
+            chat=FakeChat(id=-100200, type=ChatType.SUPERGROUP),
+            from_user=FakeUser(id=7),
+            text="/start link",
+        )
+
+    async def test_get_me_is_called_once(self) -> None:
+        self.bot.get_me.return_value = SimpleNamespace(username="cr_bot")
+        with patch("bot.handlers.BOT_USERNAME", None):
+            self.assertEqual("cr_bot", await h._get_bot_username(self.message))
+            self.assertEqual("cr_bot", await h._get_bot_username(self.message))
+        self.bot.get_me.assert_awaited_once()
+
+    async def test_failed_lookup_is_retried(self) -> None:
+        self.bot.get_me.side_effect = [RuntimeError("timeout"), None]
+        with patch("bot.handlers.BOT_USERNAME", None):
+            self.assertIsNone(await h._get_bot_username(self.message))
+            self.assertIsNone(await h._get_bot_username(self.message))
+        self.assertEqual(2, self.bot.get_me.await_count)
+
+
+class WelcomeKeyboardCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def test_keyboard_is_reused_between_welcomes(self) -> None:
+        bot = FakeBot()
+        with patch(
+            "bot.handlers.WELCOME_RULES_MESSAGE_LINK", "https://t.me/c/1/2"
+        ), patch("bot.handlers.BOT_USERNAME", "@cr_bot"):
+            await h._send_welcome_message(bot, -1, "Alice")
+            await h._send_welcome_message(bot, -1, "Bob")
+        first, second = [
+            call.kwargs["reply_markup"] for call in bot.send_message.await_args_list
+        ]
+        self.assertIs(first, second)
+        self.assertEqual(
+            "https://t.me/cr_bot?start=link", first.inline_keyboard[1][0].url
+        )
+
+    def test_no_buttons_without_configuration(self) -> None:
+        self.assertIsNone(h._build_welcome_keyboard(None, None))
+
+
+class ReportCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._REPORT_CACHE.clear()
+
+    def _message(self) -> FakeMessage:
+        return FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=-100200, type=ChatType.SUPERGROUP),
+            from_user=FakeUser(id=7),
+            text="/war",
+        )
+
+    async def test_weekly_report_is_built_once_within_ttl(self) -> None:
+        build = AsyncMock(return_value="report")
+        messages = [self._message(), self._message()]
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._require_clan_tag", return_value="#CLAN"), patch(
+            "bot.handlers.get_last_completed_week",
+            new=AsyncMock(return_value=(120, 3)),
+        ), patch("bot.handlers.build_weekly_report", new=build):
+            for message in messages:
+                await h.cmd_war(message)
+        build.assert_awaited_once_with(120, 3, "#CLAN", lang="en")
+        for message in messages:
+            message.answer.assert_awaited_once_with("report", parse_mode=None)
+
+    async def test_reports_are_cached_per_language(self) -> None:
+        build = AsyncMock(side_effect=["en report", "ru report"])
+        for lang in ("en", "ru"):
+            await h._get_report_cached(
+                ("weekly", 120, 3, "#CLAN", lang),
+                lambda: build(120, 3, "#CLAN", lang=lang),
+            )
+        self.assertEqual(2, build.await_count)
@@ -0,0 +1,707 @@
+import asyncio
+import itertools
+import pickle
+import threading
+import unittest
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+try:
+    from aiogram.enums import ChatType
+except Exception:
+    raise unittest.SkipTest("aiogram not available")
+
+try:
+    from bot import handlers as h
+except Exception:
+    raise unittest.SkipTest("bot.handlers dependencies not available")
+
+from tests._fakes_aiogram import FakeBot, FakeChat, FakeMessage, FakeUser
+
+
+class RequireGroupAdminTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.bot = FakeBot()
+        self.user = FakeUser(id=42)
+
+    def _message(self, chat_type: object = ChatType.SUPERGROUP) -> FakeMessage:
+        return FakeMessage(
+            bot=self.bot,
+            chat=FakeChat(id=-100300, type=chat_type),
+            from_user=self.user,
+            text="/moderation_on",
+        )
+
+    async def test_admin_reaches_handler_with_lang(self) -> None:
+        message = self._message()
+        set_state = AsyncMock()
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch(
+            "bot.handlers._is_admin_user", new=AsyncMock(return_value=True)
+        ), patch("bot.handlers.set_app_state", new=set_state):
+            await h.cmd_moderation_on(message)
+        set_state.assert_awaited_once()
+        message.answer.assert_awaited_once_with(
+            h.t("moderation_enabled", "en"), parse_mode=None
+        )
+
+    async def test_non_admin_is_rejected(self) -> None:
+        message = self._message()
+        set_state = AsyncMock()
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch(
+            "bot.handlers._is_admin_user", new=AsyncMock(return_value=False)
+        ), patch("bot.handlers.set_app_state", new=set_state):
+            await h.cmd_moderation_on(message)
+        set_state.assert_not_awaited()
+        message.answer.assert_awaited_once_with(
+            h.t("not_allowed", "en"), parse_mode=None
+        )
+
+    async def test_private_chat_is_rejected(self) -> None:
+        message = self._message(ChatType.PRIVATE)
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._is_admin_user", new=AsyncMock()) as is_admin:
+            await h.cmd_modlog(message)
+        is_admin.assert_not_awaited()
+        message.answer.assert_awaited_once_with(
+            h.t("use_command_in_group", "en"), parse_mode=None
+        )
+
+
+class ModlogCommandTests(unittest.IsolatedAsyncioTestCase):
+    async def test_lines_use_localized_template(self) -> None:
+        message = FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=-100300, type=ChatType.SUPERGROUP),
+            from_user=FakeUser(id=42),
+            text="/modlog 2",
+        )
+        created_at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+        actions = [
+            {
+                "id": 9,
+                "action": "warn",
+                "target_user_id": 100,
+                "admin_user_id": 42,
+                "created_at": created_at,
+            }
+        ]
+        list_actions = AsyncMock(return_value=actions)
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch(
+            "bot.handlers._is_admin_user", new=AsyncMock(return_value=True)
+        ), patch("bot.handlers.list_mod_actions", new=list_actions):
+            await h.cmd_modlog(message)
+        list_actions.assert_awaited_once_with(-100300, limit=2)
+        expected_line = h.t(
+            "modlog_line",
+            "en",
+            entry_id=9,
+            action="warn",
+            user_id=100,
+            admin_id=42,
+            created_at=h._format_dt(created_at),
+        )
+        text = message.answer.await_args.args[0]
+        self.assertEqual(
+            [h.t("modlog_header", "en", count=1), expected_line], text.split("\n")
+        )
+
+
+class FormatDtTests(unittest.TestCase):
+    def test_matches_previous_strftime_output(self) -> None:
+        values = [
+            datetime(2024, 5, 1, 12, 30, 5, 999999, tzinfo=timezone.utc),
+            datetime(2024, 5, 1, 12, 30, 5, tzinfo=timezone(timedelta(hours=3))),
+            datetime(2024, 5, 1, 0, 0),
+        ]
+        for value in values:
+            aware = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+            expected = aware.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+            self.assertEqual(expected, h._format_dt(value))
+
+    def test_non_datetime(self) -> None:
+        self.assertEqual("n/a", h._format_dt(None))
+
+
+class TgCommandTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._USERNAME_CACHE.clear()
+
+    async def test_usernames_resolved_per_linked_member(self) -> None:
+        bot = FakeBot()
+
+        async def get_chat(user_id: int) -> object:
+            if user_id == 2:
+                raise RuntimeError("chat not found")
+            return SimpleNamespace(username=f"user{user_id}")
+
+        bot.get_chat.side_effect = get_chat
+        message = FakeMessage(
+            bot=bot,
+            chat=FakeChat(id=-100300, type=ChatType.SUPERGROUP),
+            from_user=FakeUser(id=42),
+            text="/tg",
+        )
+        members = [
+            {"player_tag": "aaa", "player_name": "Bravo"},
+            {"player_tag": "#BBB", "player_name": "alpha"},
+            {"player_tag": "#CCC", "player_name": "Unlinked"},
+        ]
+        build_report = AsyncMock(return_value="report")
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._require_clan_tag", return_value="#CLAN"), patch(
+            "bot.handlers.get_current_members_snapshot",
+            new=AsyncMock(return_value=members),
+        ), patch(
+            "bot.handlers.get_user_links_by_tags",
+            new=AsyncMock(return_value={"#AAA": 1, "#BBB": 2}),
+        ), patch("bot.handlers.build_tg_list_report", new=build_report):
+            await h.cmd_tg(message)
+        self.assertEqual(2, bot.get_chat.await_count)
+        self.assertEqual(
+            [
+                {"name": "alpha", "username": h.t("tg_username_id", "en", id=2)},
+                {"name": "Bravo", "username": "user1"},
+            ],
+            build_report.await_args.kwargs["entries"],
+        )
+        message.answer.assert_awaited_once_with("report", parse_mode=None)
+
+
+class InactiveCommandTests(unittest.IsolatedAsyncioTestCase):
+    async def test_lines_are_flagged_by_days_absent(self) -> None:
+        message = FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=-100300, type=ChatType.SUPERGROUP),
+            from_user=FakeUser(id=42),
+            text="/inactive",
+        )
+        absent = [
+            {"player_name": "Red", "days_absent": 10},
+            {"player_name": "Yellow", "days_absent": 5},
+            {"player_name": "Fresh", "days_absent": 1},
+            {"player_name": None, "days_absent": None},
+        ]
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._require_clan_tag", return_value="#CLAN"), patch(
+            "bot.handlers.get_current_member_tags",
+            new=AsyncMock(return_value={"#AAA"}),
+        ), patch(
+            "bot.handlers.get_top_absent_members",
+            new=AsyncMock(return_value=absent),
+        ), patch("bot.handlers.LAST_SEEN_RED_DAYS", 7), patch(
+            "bot.handlers.LAST_SEEN_YELLOW_DAYS", 3
+        ):
+            await h.cmd_inactive(message)
+        lines = message.answer.await_args.args[0].split("\n")[2:]
+        self.assertEqual(len(absent), len(lines))
+        expected_prefixes = ["🔴 ", "🟡 ", "", ""]
+        for index, (line, prefix, member) in enumerate(
+            zip(lines, expected_prefixes, absent), 1
+        ):
+            days = member["days_absent"]
+            self.assertEqual(
+                h.t(
+                    "inactive_line",
+                    "en",
+                    index=index,
+                    prefix=prefix,
+                    name=member["player_name"] or h.t("unknown", "en"),
+                    days_text=(
+                        h.t("na", "en")
+                        if days is None
+                        else h.t("inactive_days_ago", "en", days=days)
+                    ),
+                ),
+                line,
+            )
+
+
+class EnsureClanTagTests(unittest.IsolatedAsyncioTestCase):
+    async def test_missing_clan_tag_is_reported(self) -> None:
+        message = FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=-100300, type=ChatType.SUPERGROUP),
+            from_user=FakeUser(id=42),
+            text="/current_war",
+        )
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._require_clan_tag", return_value=None), patch(
+            "bot.handlers.build_current_war_report", new=AsyncMock()
+        ) as build_report:
+            await h.cmd_current_war(message)
+        build_report.assert_not_awaited()
+        message.answer.assert_awaited_once_with(
+            h.t("clan_tag_not_configured", "en"), parse_mode=None
+        )
+
+
+class ParseCommandArgsTests(unittest.TestCase):
+    def test_parse_command_args(self) -> None:
+        cases = [
+            (None, ""),
+            ("", ""),
+            ("/activity", ""),
+            ("/activity   ", ""),
+            ("/activity  Some Player ", "Some Player"),
+            ("/warn@bot spam\nlinks", "spam\nlinks"),
+        ]
+        for text, expected in cases:
+            self.assertEqual(expected, h._parse_command_args(text), text)
+
+    def test_parse_debug_day(self) -> None:
+        cases = [(None, 1), ("", 1), ("3", 3), ("0", 1), ("9 extra", 4), ("x", 1)]
+        for args, expected in cases:
+            self.assertEqual(expected, h._parse_debug_day(args), args)
+
+
+class ActivityCommandTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._PLAYER_SEARCH_CACHE.clear()
+
+    async def test_multiple_candidates_are_listed(self) -> None:
+        message = FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=-100300, type=ChatType.SUPERGROUP),
+            from_user=FakeUser(id=42),
+            text="/activity Bob",
+        )
+        candidates = [
+            {"player_tag": "aaa", "player_name": "Bob", "in_clan": True},
+            {"player_tag": "#BBB", "player_name": "Bobby", "in_clan": False},
+        ]
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._require_clan_tag", return_value="#CLAN"), patch(
+            "bot.handlers.search_player_candidates",
+            new=AsyncMock(return_value=candidates),
+        ):
+            await h.cmd_activity(message)
+        expected = [h.t("activity_multiple_found", "en")] + [
+            h.t(
+                "activity_candidate_line",
+                "en",
+                index=index,
+                name=name,
+                tag=tag,
+                status=h.t(status_key, "en"),
+            )
+            for index, name, tag, status_key in [
+                (1, "Bob", "#AAA", "status_in_clan"),
+                (2, "Bobby", "#BBB", "status_not_in_clan"),
+            ]
+        ]
+        message.answer.assert_awaited_once_with("\n".join(expected), parse_mode=None)
+
+
+class ReportAndChartTests(unittest.IsolatedAsyncioTestCase):
+    def _message(self) -> FakeMessage:
+        return FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=-100300, type=ChatType.SUPERGROUP),
+            from_user=FakeUser(id=42),
+            text="/activity",
+        )
+
+    async def test_photo_follows_report(self) -> None:
+        message = self._message()
+        order: list[str] = []
+        message.answer.side_effect = lambda *args, **kwargs: order.append("report")
+        message.answer_photo.side_effect = lambda *args, **kwargs: order.append(
+            "chart"
+        )
+        with patch(
+            "bot.handlers.build_my_activity_report",
+            new=AsyncMock(return_value="report"),
+        ), patch(
+            "bot.handlers._render_war_activity_chart",
+            new=AsyncMock(return_value=b"png"),
+        ):
+            await h._send_report_and_chart(
+                message,
+                clan_tag="#CLAN",
+                player_tag="#AAA",
+                player_name="Bob",
+                title="title",
+                lang="en",
+            )
+        self.assertEqual(["report", "chart"], order)
+
+    async def test_chart_failure_keeps_report(self) -> None:
+        message = self._message()
+        with patch(
+            "bot.handlers.build_my_activity_report",
+            new=AsyncMock(return_value="report"),
+        ), patch(
+            "bot.handlers._render_war_activity_chart",
+            new=AsyncMock(side_effect=RuntimeError("no data")),
+        ):
+            await h._send_report_and_chart(
+                message,
+                clan_tag="#CLAN",
+                player_tag="#AAA",
+                player_name="Bob",
+                title="title",
+                lang="en",
+            )
+        message.answer.assert_awaited_once_with("report", parse_mode=None)
+        message.answer_photo.assert_not_awaited()
+
+    async def test_chart_failure_tracebacks_are_sampled(self) -> None:
+        with patch(
+            "bot.handlers.build_my_activity_report",
+            new=AsyncMock(return_value="report"),
+        ), patch(
+            "bot.handlers._render_war_activity_chart",
+            new=AsyncMock(side_effect=RuntimeError("no data")),
+        ), patch("bot.handlers.CHART_ERROR_TRACEBACK_EVERY", 2), patch(
+            "bot.handlers._CHART_ERROR_COUNTER", itertools.count()
+        ), self.assertLogs("bot.handlers", level="WARNING") as logs:
+            for _ in range(3):
+                await h._send_report_and_chart(
+                    self._message(),
+                    clan_tag="#CLAN",
+                    player_tag="#AAA",
+                    player_name="Bob",
+                    title="title",
+                    lang="en",
+                )
+        self.assertEqual(
+            [True, False, True],
+            [bool(record.exc_info) for record in logs.records],
+        )
+
+
+class RenderWarActivityChartTests(unittest.IsolatedAsyncioTestCase):
+    async def test_chart_is_rendered_off_the_event_loop(self) -> None:
+        render_threads: list[int] = []
+
+        def fake_render(**kwargs) -> bytes:
+            render_threads.append(threading.get_ident())
+            return b"png"
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        with patch(
+            "bot.handlers._get_chart_executor", return_value=executor
+        ), patch("charts.render_my_activity_decks_chart", new=fake_render), patch(
+            "db.get_last_completed_weeks_from_db",
+            new=AsyncMock(return_value=[(5, 1), (5, 0)]),
+        ), patch(
+            "db.get_player_weekly_activity",
+            new=AsyncMock(return_value=[(5, 0, 4, 800)]),
+        ), patch(
+            "db.get_current_member_tags", new=AsyncMock(return_value=set())
+        ):
+            png_bytes = await h._render_war_activity_chart(
+                clan_tag="#CLAN", player_tag="#AAA", title="title", lang="en"
+            )
+        self.assertEqual(b"png", png_bytes)
+        self.assertEqual(1, len(render_threads))
+        self.assertNotEqual(threading.get_ident(), render_threads[0])
+
+
+    def _patch_chart_data(self):
+        return (
+            patch(
+                "db.get_last_completed_weeks_from_db",
+                new=AsyncMock(return_value=[(5, 1), (5, 0)]),
+            ),
+            patch(
+                "db.get_player_weekly_activity",
+                new=AsyncMock(return_value=[(5, 0, 4, 800)]),
+            ),
+            patch("db.get_current_member_tags", new=AsyncMock(return_value=set())),
+        )
+
+    async def test_render_call_survives_pickling(self) -> None:
+        class PicklingExecutor(Executor):
+            def submit(self, fn, /, *args, **kwargs):
+                restored = pickle.loads(pickle.dumps(fn))
+                future: Future = Future()
+                future.set_result(restored.func.__qualname__)
+                return future
+
+        weeks, activity, members = self._patch_chart_data()
+        with patch(
+            "bot.handlers._get_chart_executor", return_value=PicklingExecutor()
+        ), weeks, activity, members:
+            result = await h._render_war_activity_chart(
+                clan_tag="#CLAN", player_tag="#AAA", title="title", lang="en"
+            )
+        self.assertEqual("render_my_activity_decks_chart", result)
+
+    async def test_broken_pool_is_replaced_and_retried(self) -> None:
+        class BrokenExecutor(Executor):
+            def submit(self, fn, /, *args, **kwargs):
+                raise BrokenProcessPool("worker died")
+
+        broken = BrokenExecutor()
+        replacement = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(replacement.shutdown)
+        weeks, activity, members = self._patch_chart_data()
+        with patch("bot.handlers._CHART_EXECUTOR", broken), patch(
+            "bot.handlers.ProcessPoolExecutor", return_value=replacement
+        ), patch(
+            "charts.render_my_activity_decks_chart", new=lambda **kwargs: b"png"
+        ), weeks, activity, members, self.assertLogs(
+            "bot.handlers", level="ERROR"
+        ):
+            png_bytes = await h._render_war_activity_chart(
+                clan_tag="#CLAN", player_tag="#AAA", title="title", lang="en"
+            )
+            self.assertIs(replacement, h._CHART_EXECUTOR)
+        self.assertEqual(b"png", png_bytes)
+
+
+class LinkSelectTests(unittest.IsolatedAsyncioTestCase):
+    async def test_success_without_message_uses_target_language(self) -> None:
+        bot = FakeBot()
+        query = SimpleNamespace(
+            data="link_select:7:aaa",
+            from_user=FakeUser(id=7),
+            message=None,
+            bot=bot,
+            answer=AsyncMock(),
+        )
+        request = {"status": "awaiting_choice", "origin_chat_id": None}
+        with patch(
+            "bot.handlers._get_lang_for_query", new=AsyncMock(return_value="en")
+        ), patch(
+            "bot.handlers.get_user_link_request", new=AsyncMock(return_value=request)
+        ), patch("bot.handlers._require_clan_tag", return_value="#CLAN"), patch(
+            "bot.handlers.get_player_name_for_tag", new=AsyncMock(return_value="Bob")
+        ), patch(
+            "bot.handlers.link_user_and_clear_request", new=AsyncMock()
+        ) as link_user, patch(
+            "bot.handlers._resolve_admin_grant_chats", new=AsyncMock(return_value=[])
+        ), patch(
+            "bot.handlers._get_user_language_cached", new=AsyncMock(return_value="ru")
+        ):
+            await h.handle_link_select(query)
+        link_user.assert_awaited_once_with(
+            telegram_user_id=7, player_tag="#AAA", player_name="Bob", source="self"
+        )
+        bot.send_message.assert_awaited_once_with(
+            7, h.t("link_success", "ru", name="Bob", tag="#AAA"), parse_mode=None
+        )
+
+
+class HelpCommandTests(unittest.IsolatedAsyncioTestCase):
+    async def test_admin_sections_only_for_admins(self) -> None:
+        member_text = h._build_help_text("en", False)
+        admin_text = h._build_help_text("en", True)
+        self.assertTrue(admin_text.startswith(member_text.rsplit("\n", 3)[0]))
+        self.assertNotIn(h.t("help_admin_header", "en"), member_text)
+        self.assertIn(h.t("help_admin_header", "en"), admin_text)
+        self.assertIs(member_text, h._build_help_text("en", False))
+
+    async def test_private_chat_gets_member_help(self) -> None:
+        message = FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=7, type=ChatType.PRIVATE),
+            from_user=FakeUser(id=7),
+            text="/help",
+        )
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ):
+            await h.cmd_help(message)
+        message.answer.assert_awaited_once_with(
+            h._build_help_text("en", False), parse_mode=None
+        )
+
+
+class PingCommandTests(unittest.IsolatedAsyncioTestCase):
+    def _message(self) -> FakeMessage:
+        return FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=7, type=ChatType.PRIVATE),
+            from_user=FakeUser(id=7),
+            text="/ping",
+        )
+
+    async def test_api_check_overlaps_language_lookup(self) -> None:
+        api_started = asyncio.Event()
+
+        async def get_lang(message) -> str:
+            await asyncio.wait_for(api_started.wait(), timeout=1)
+            return "en"
+
+        async def get_clan(tag: str) -> dict:
+            api_started.set()
+            return {"name": "Royals"}
+
+        api_client = SimpleNamespace(get_clan=get_clan)
+        message = self._message()
+        with patch("bot.handlers._get_lang_for_message", new=get_lang), patch(
+            "bot.handlers._require_clan_tag", return_value="#CLAN"
+        ), patch("bot.handlers.get_api_client", new=AsyncMock(return_value=api_client)):
+            await h.cmd_ping(message)
+        self.assertIn("Royals", message.answer.await_args.args[0])
+
+    async def test_api_error_is_reported(self) -> None:
+        api_client = SimpleNamespace(
+            get_clan=AsyncMock(side_effect=h.ClashRoyaleAPIError(503, "down"))
+        )
+        message = self._message()
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._require_clan_tag", return_value="#CLAN"), patch(
+            "bot.handlers.get_api_client", new=AsyncMock(return_value=api_client)
+        ):
+            await h.cmd_ping(message)
+        self.assertIn(
+            h.t("ping_api_error", "en", error="down"), message.answer.await_args.args[0]
+        )
+
+
+class LinkCandidatesTests(unittest.IsolatedAsyncioTestCase):
+    async def test_multiple_candidates_get_buttons_and_lines(self) -> None:
+        message = FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=7, type=ChatType.PRIVATE),
+            from_user=FakeUser(id=7),
+            text="Bob",
+        )
+        candidates = [
+            {"player_tag": "aaa", "player_name": "Bob", "in_clan": True},
+            {"player_tag": "#BBB", "player_name": "Bobby", "in_clan": False},
+        ]
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._require_clan_tag", return_value="#CLAN"), patch(
+            "bot.handlers.search_player_candidates",
+            new=AsyncMock(return_value=candidates),
+        ), patch(
+            "bot.handlers.upsert_user_link_request", new=AsyncMock()
+        ):
+            await h._handle_link_candidates(
+                message=message,
+                target_user_id=7,
+                nickname="Bob",
+                source="self",
+                origin_chat_id=None,
+            )
+        text = message.answer.await_args.args[0]
+        markup = message.answer.await_args.kwargs["reply_markup"]
+        self.assertIn(
+            h.t(
+                "link_candidate_line",
+                "en",
+                index=2,
+                name="Bobby",
+                tag="#BBB",
+                status=h.t("status_not_in_clan", "en"),
+            ),
+            text,
+        )
+        self.assertEqual(
+            ["link_select:7:AAA", "link_select:7:BBB"],
+            [row[0].callback_data for row in markup.inline_keyboard],
+        )
+
+
+class ListForKickTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._REPORT_CACHE.clear()
+
+    async def test_single_week_lookup_feeds_report(self) -> None:
+        message = FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=-100300, type=ChatType.SUPERGROUP),
+            from_user=FakeUser(id=42),
+            text="/list_for_kick 7",
+        )
+        weeks = [(120, 3), (120, 2)]
+        build = AsyncMock(return_value="report")
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._require_clan_tag", return_value="#CLAN"), patch(
+            "bot.handlers.get_last_completed_weeks",
+            new=AsyncMock(return_value=weeks),
+        ) as get_weeks, patch(
+            "bot.handlers.get_last_completed_week", new=AsyncMock()
+        ) as get_week, patch(
+            "bot.handlers.build_kick_shortlist_report", new=build
+        ):
+            await h.cmd_list_for_kick(message)
+        get_weeks.assert_awaited_once_with(8, "#CLAN")
+        get_week.assert_not_awaited()
+        build.assert_awaited_once_with(
+            weeks, (120, 3), "#CLAN", lang="en", short_limit=7
+        )
+
+
+class WarAllCommandTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._REPORT_CACHE.clear()
+
+    async def test_reports_are_batched_into_one_message(self) -> None:
+        message = FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=-100300, type=ChatType.SUPERGROUP),
+            from_user=FakeUser(id=42),
+            text="/war_all",
+        )
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch(
+            "bot.handlers._ensure_clan_tag", new=AsyncMock(return_value="#CLAN")
+        ), patch(
+            "bot.handlers.get_last_completed_weeks",
+            new=AsyncMock(return_value=[(120, 3), (120, 2)]),
+        ), patch(
+            "bot.handlers.build_weekly_report", new=AsyncMock(return_value="weekly")
+        ), patch(
+            "bot.handlers.build_rolling_report",
+            new=AsyncMock(return_value="rolling"),
+        ), patch(
+            "bot.handlers.build_kick_shortlist_report",
+            new=AsyncMock(return_value="kick"),
+        ):
+            await h.cmd_war_all(message)
+        message.answer.assert_awaited_once_with(
+            "weekly\n\nrolling\n\nkick", parse_mode=None
+        )
+
+
+class AppCommandTests(unittest.IsolatedAsyncioTestCase):
+    async def _run(self, text: str) -> FakeMessage:
+        message = FakeMessage(
+            bot=FakeBot(),
+            chat=FakeChat(id=42, type=ChatType.PRIVATE),
+            from_user=FakeUser(id=42),
+            text=text,
+        )
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._is_debug_admin", return_value=True), patch(
+            "bot.handlers.get_application_by_id", new=AsyncMock(return_value=None)
+        ) as get_app:
+            await h.cmd_app(message)
+        self.get_app = get_app
+        return message
+
+    async def test_missing_id_shows_usage(self) -> None:
+        message = await self._run("/app   ")
+        message.answer.assert_awaited_once_with(
+            h.t("usage_app", "en"), parse_mode=None
+        )
+        self.get_app.assert_not_awaited()
+
+    async def test_id_on_next_line_is_parsed(self) -> None:
+        await self._run("/app\n17")
+        self.get_app.assert_awaited_once_with(17)
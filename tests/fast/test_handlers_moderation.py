@@ -1,9 +1,13 @@
+import asyncio
+import logging
 import unittest
 from datetime import datetime, timezone
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, patch
 
 try:
-    from aiogram.enums import ChatType, MessageEntityType
+    from aiogram.enums import ChatMemberStatus, ChatType, MessageEntityType
+    from aiogram.exceptions import TelegramNetworkError
 except Exception:
     raise unittest.SkipTest("aiogram not available")
 
@@ -12,7 +16,14 @@ try:
 except Exception:
     raise unittest.SkipTest("bot.handlers dependencies not available")
 
-from tests._fakes_aiogram import FakeBot, FakeChat, FakeEntity, FakeMessage, FakeUser
+from tests._fakes_aiogram import (
+    FakeBot,
+    FakeCallbackQuery,
+    FakeChat,
+    FakeEntity,
+    FakeMessage,
+    FakeUser,
+)
 
 _UNSET = object()
 
@@ -30,6 +41,7 @@ def _default_settings() -> dict[str, int | bool]:
 class EvaluateModerationTests(unittest.IsolatedAsyncioTestCase):
     def setUp(self) -> None:
         h._FLOOD_RATE_CACHE.clear()
+        h._MODERATION_ENABLED_CACHE.clear()
         self.bot = FakeBot()
         self.chat = FakeChat(id=-100100, type=ChatType.SUPERGROUP)
         self.user = FakeUser(id=42, username="tester")
@@ -74,6 +86,15 @@ class EvaluateModerationTests(unittest.IsolatedAsyncioTestCase):
         self.assertFalse(result["should_check"])
         self.assertEqual("disabled_by_command", result["reason"])
 
+    async def test_command_state_is_cached(self) -> None:
+        message = self._message()
+        get_state = AsyncMock(return_value={"enabled": False})
+        with patch("bot.handlers.get_app_state", new=get_state):
+            await h.evaluate_moderation(message)
+            result = await h.evaluate_moderation(message)
+        get_state.assert_awaited_once()
+        self.assertEqual("disabled_by_command", result["reason"])
+
     async def test_no_settings_bypass(self) -> None:
         message = self._message()
         with patch("bot.handlers.get_app_state", new=AsyncMock(return_value=None)), patch(
@@ -216,6 +237,7 @@ class EvaluateModerationTests(unittest.IsolatedAsyncioTestCase):
 class ApplyModerationDecisionTests(unittest.IsolatedAsyncioTestCase):
     def setUp(self) -> None:
         h._FLOOD_RATE_CACHE.clear()
+        h._MODERATION_ENABLED_CACHE.clear()
         self.bot = FakeBot()
         self.chat = FakeChat(id=-100101, type=ChatType.SUPERGROUP)
         self.user = FakeUser(id=99, username="warned")
@@ -431,3 +453,385 @@ class ApplyModerationDecisionTests(unittest.IsolatedAsyncioTestCase):
                 now=self.now,
             )
         message.answer.assert_not_awaited()
+
+
+class ModerationFilterTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.bot = FakeBot()
+        self.chat = FakeChat(id=-100100, type=ChatType.SUPERGROUP)
+        self.user = FakeUser(id=42)
+
+    async def test_non_command_filter(self) -> None:
+        flt = h.NonCommandFilter()
+        cases = [
+            ("hello", None, True),
+            ("/help", None, False),
+            (None, "/help", False),
+            (None, "photo", True),
+            (None, None, True),
+            ("", None, True),
+        ]
+        for text, caption, expected in cases:
+            message = FakeMessage(
+                bot=self.bot,
+                chat=self.chat,
+                from_user=self.user,
+                text=text,
+                caption=caption,
+            )
+            self.assertEqual(expected, await flt(message), (text, caption))
+
+    async def test_command_message_filter_is_inverse(self) -> None:
+        command_filter = h.CommandMessageFilter()
+        non_command_filter = h.NonCommandFilter()
+        for text, caption in [
+            ("hello", None),
+            ("/help", None),
+            (None, "/help"),
+            (None, None),
+            ("", None),
+        ]:
+            message = FakeMessage(
+                bot=self.bot,
+                chat=self.chat,
+                from_user=self.user,
+                text=text,
+                caption=caption,
+            )
+            self.assertNotEqual(
+                await non_command_filter(message),
+                await command_filter(message),
+                (text, caption),
+            )
+
+    async def test_private_text_filter(self) -> None:
+        flt = h.PrivateTextFilter()
+        private_chat = FakeChat(id=42, type=ChatType.PRIVATE)
+        cases = [
+            (private_chat, "hello", True),
+            (private_chat, None, False),
+            (self.chat, "hello", False),
+        ]
+        for chat, text, expected in cases:
+            message = FakeMessage(
+                bot=self.bot, chat=chat, from_user=self.user, text=text
+            )
+            self.assertEqual(expected, await flt(message), (chat.type, text))
+
+    async def test_captcha_callback_filter(self) -> None:
+        flt = h.CaptchaCallbackFilter()
+
+        def query(data: str) -> FakeCallbackQuery:
+            return FakeCallbackQuery(bot=self.bot, from_user=self.user, data=data)
+
+        self.assertEqual({"captcha_choice": (15, 2)}, await flt(query("cap:15:2")))
+        self.assertEqual({"captcha_choice": None}, await flt(query("cap:x:2")))
+        self.assertFalse(await flt(query("lang_select:1:en")))
+
+
+class ModlogBatchingTests(unittest.IsolatedAsyncioTestCase):
+    async def test_direct_send_without_flusher(self) -> None:
+        bot = FakeBot()
+        with patch("bot.handlers.MODLOG_CHAT_ID", -500):
+            await h.send_modlog(bot, "entry")
+        bot.send_message.assert_awaited_once()
+        self.assertEqual("entry", bot.send_message.await_args.args[1])
+
+    async def test_flusher_coalesces_entries(self) -> None:
+        bot = FakeBot()
+        with patch("bot.handlers.MODLOG_CHAT_ID", -500):
+            task = asyncio.create_task(h.modlog_flush_task())
+            await asyncio.sleep(0)
+            await h.send_modlog(bot, "first")
+            await h.send_modlog(bot, "second")
+            bot.send_message.assert_not_awaited()
+            await asyncio.sleep(h.MODLOG_FLUSH_INTERVAL_SECONDS * 2)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        bot.send_message.assert_awaited_once()
+        self.assertEqual("first\n\nsecond", bot.send_message.await_args.args[1])
+        self.assertIsNone(h._MODLOG_QUEUE)
+
+    async def test_cancel_mid_flush_does_not_resend_delivered(self) -> None:
+        bot = FakeBot()
+        blocked = asyncio.Event()
+        calls = 0
+
+        async def send_message(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            if calls == 2:
+                blocked.set()
+                await asyncio.Event().wait()
+
+        bot.send_message.side_effect = send_message
+        with patch("bot.handlers.MODLOG_CHAT_ID", -500):
+            task = asyncio.create_task(h.modlog_flush_task())
+            await asyncio.sleep(0)
+            await h.send_modlog(bot, "a" * 3000)
+            await h.send_modlog(bot, "b" * 3000)
+            await blocked.wait()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        sent = [call.args[1] for call in bot.send_message.await_args_list]
+        self.assertEqual(["a" * 3000, "b" * 3000, "b" * 3000], sent)
+
+    async def test_batch_respects_message_limit(self) -> None:
+        texts = ["a" * 3000, "b" * 3000, "c"]
+        chunks = h._join_message_batch(texts)
+        self.assertEqual(["a" * 3000, "b" * 3000 + "\n\nc"], chunks)
+
+
+class MemberJoinTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        h._ADMIN_STATUS_CACHE.clear()
+        self.bot = FakeBot()
+        self.chat = FakeChat(id=-100100, type=ChatType.SUPERGROUP)
+        self.user = FakeUser(id=42, username="newbie")
+
+    def _event(self) -> SimpleNamespace:
+        return SimpleNamespace(
+            bot=self.bot,
+            chat=self.chat,
+            old_chat_member=SimpleNamespace(
+                status=ChatMemberStatus.LEFT, user=self.user
+            ),
+            new_chat_member=SimpleNamespace(
+                status=ChatMemberStatus.MEMBER, user=self.user
+            ),
+        )
+
+    async def test_restrict_failure_is_logged_and_stops(self) -> None:
+        self.bot.restrict_chat_member.side_effect = RuntimeError("no rights")
+        send_captcha = AsyncMock()
+        send_modlog = AsyncMock()
+        with patch("bot.handlers.ENABLE_CAPTCHA", True), patch(
+            "bot.handlers._is_admin_user", new=AsyncMock(return_value=False)
+        ), patch(
+            "bot.handlers.is_user_verified", new=AsyncMock(return_value=False)
+        ), patch(
+            "bot.handlers.get_or_create_pending_challenge",
+            new=AsyncMock(return_value=({"id": 1, "status": "pending"}, None)),
+        ), patch("bot.handlers._send_captcha_message", new=send_captcha), patch(
+            "bot.handlers.send_modlog", new=send_modlog
+        ):
+            await h.handle_member_join(self._event())
+        send_captcha.assert_not_awaited()
+        send_modlog.assert_awaited_once()
+        self.assertIn("no rights", send_modlog.await_args.args[1])
+
+    async def test_non_join_update_skips_admin_lookup(self) -> None:
+        event = self._event()
+        event.old_chat_member.status = ChatMemberStatus.MEMBER
+        event.new_chat_member.status = ChatMemberStatus.ADMINISTRATOR
+        is_admin = AsyncMock(return_value=False)
+        with patch("bot.handlers.ENABLE_CAPTCHA", True), patch(
+            "bot.handlers._is_admin_user", new=is_admin
+        ):
+            await h.handle_member_join(event)
+        is_admin.assert_not_awaited()
+        self.bot.restrict_chat_member.assert_not_awaited()
+
+    def test_join_transitions(self) -> None:
+        S = ChatMemberStatus
+        self.assertIn((S.LEFT, S.MEMBER, None, None), h._JOIN_TRANSITIONS)
+        self.assertIn((S.KICKED, S.RESTRICTED, None, True), h._JOIN_TRANSITIONS)
+        self.assertIn((S.RESTRICTED, S.RESTRICTED, False, True), h._JOIN_TRANSITIONS)
+        self.assertNotIn((S.RESTRICTED, S.RESTRICTED, True, True), h._JOIN_TRANSITIONS)
+        self.assertNotIn((S.MEMBER, S.LEFT, None, None), h._JOIN_TRANSITIONS)
+
+
+class CaptchaCallbackTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.bot = FakeBot()
+        self.user = FakeUser(id=42)
+        self.challenge = {
+            "id": 11,
+            "chat_id": -100100,
+            "user_id": 42,
+            "question_id": 3,
+            "status": "pending",
+            "expires_at": None,
+        }
+        self.question = {"id": 3, "correct_option": 1}
+
+    async def test_attempts_exhausted_issues_new_challenge(self) -> None:
+        captcha_message = FakeMessage(
+            bot=self.bot,
+            chat=FakeChat(id=-100100, type=ChatType.SUPERGROUP),
+            from_user=None,
+        )
+        query = FakeCallbackQuery(
+            bot=self.bot, from_user=self.user, data="cap:11:0", message=captcha_message
+        )
+        mark_failed = AsyncMock()
+        new_challenge = {"id": 12, "chat_id": -100100, "user_id": 42}
+        send_captcha = AsyncMock(return_value=555)
+        update_message = AsyncMock()
+        with patch(
+            "bot.handlers.get_challenge_by_id",
+            new=AsyncMock(return_value=self.challenge),
+        ), patch(
+            "bot.handlers._get_captcha_question_cached",
+            new=AsyncMock(return_value=self.question),
+        ), patch(
+            "bot.handlers.increment_challenge_attempts",
+            new=AsyncMock(return_value=3),
+        ), patch("bot.handlers.CAPTCHA_MAX_ATTEMPTS", 3), patch(
+            "bot.handlers.mark_challenge_failed", new=mark_failed
+        ), patch(
+            "bot.handlers.create_fresh_captcha_challenge",
+            new=AsyncMock(return_value=(new_challenge, self.question)),
+        ), patch(
+            "bot.handlers._send_captcha_message", new=send_captcha
+        ), patch(
+            "bot.handlers.update_challenge_message_and_reminded", new=update_message
+        ), patch(
+            "bot.handlers.send_modlog", new=AsyncMock()
+        ):
+            await h.handle_captcha_callback(query, captcha_choice=(11, 0))
+        mark_failed.assert_awaited_once()
+        self.assertEqual(11, mark_failed.await_args.args[0])
+        query.answer.assert_awaited_once_with(
+            h.t("captcha_wrong_short", h.DEFAULT_LANG), show_alert=False
+        )
+        self.assertEqual(12, send_captcha.await_args.kwargs["challenge_id"])
+        self.assertEqual((12, 555), update_message.await_args.args[:2])
+        captcha_message.answer.assert_awaited_once()
+
+    async def test_stale_query_still_sends_new_challenge(self) -> None:
+        captcha_message = FakeMessage(
+            bot=self.bot,
+            chat=FakeChat(id=-100100, type=ChatType.SUPERGROUP),
+            from_user=None,
+        )
+        query = FakeCallbackQuery(
+            bot=self.bot, from_user=self.user, data="cap:11:0", message=captcha_message
+        )
+        query.answer.side_effect = RuntimeError("query is too old")
+        new_challenge = {"id": 12, "chat_id": -100100, "user_id": 42}
+        send_captcha = AsyncMock(return_value=555)
+        update_message = AsyncMock()
+        modlog = AsyncMock()
+        with patch(
+            "bot.handlers.get_challenge_by_id",
+            new=AsyncMock(return_value=self.challenge),
+        ), patch(
+            "bot.handlers._get_captcha_question_cached",
+            new=AsyncMock(return_value=self.question),
+        ), patch(
+            "bot.handlers.increment_challenge_attempts",
+            new=AsyncMock(return_value=3),
+        ), patch("bot.handlers.CAPTCHA_MAX_ATTEMPTS", 3), patch(
+            "bot.handlers.mark_challenge_failed",
+            new=AsyncMock(side_effect=RuntimeError("db down")),
+        ), patch(
+            "bot.handlers.create_fresh_captcha_challenge",
+            new=AsyncMock(return_value=(new_challenge, self.question)),
+        ), patch(
+            "bot.handlers._send_captcha_message", new=send_captcha
+        ), patch(
+            "bot.handlers.update_challenge_message_and_reminded", new=update_message
+        ), patch(
+            "bot.handlers.send_modlog", new=modlog
+        ):
+            await h.handle_captcha_callback(query, captcha_choice=(11, 0))
+        self.assertEqual(12, send_captcha.await_args.kwargs["challenge_id"])
+        self.assertEqual((12, 555), update_message.await_args.args[:2])
+        modlog.assert_awaited_once()
+
+    async def test_correct_answer_unrestricts_even_if_greeting_fails(self) -> None:
+        captcha_message = FakeMessage(
+            bot=self.bot,
+            chat=FakeChat(id=-100100, type=ChatType.SUPERGROUP),
+            from_user=None,
+        )
+        query = FakeCallbackQuery(
+            bot=self.bot, from_user=self.user, data="cap:11:1", message=captcha_message
+        )
+        with patch(
+            "bot.handlers.get_challenge_by_id",
+            new=AsyncMock(return_value=self.challenge),
+        ), patch(
+            "bot.handlers._get_captcha_question_cached",
+            new=AsyncMock(return_value=self.question),
+        ), patch(
+            "bot.handlers.mark_challenge_passed_and_verify", new=AsyncMock()
+        ) as mark_passed, patch(
+            "bot.handlers._send_welcome_message",
+            new=AsyncMock(side_effect=RuntimeError("chat closed")),
+        ), patch(
+            "bot.handlers.send_modlog", new=AsyncMock()
+        ):
+            await h.handle_captcha_callback(query, captcha_choice=(11, 1))
+        mark_passed.assert_awaited_once_with(11, -100100, 42)
+        self.bot.restrict_chat_member.assert_awaited_once()
+        captcha_message._delete_mock.assert_awaited_once()
+        query.answer.assert_awaited_once_with(
+            h.t("captcha_verified", h.DEFAULT_LANG), show_alert=False
+        )
+
+
+class CaptchaResetTests(unittest.IsolatedAsyncioTestCase):
+    async def test_cleanup_failure_does_not_block_restriction(self) -> None:
+        bot = FakeBot()
+        chat = FakeChat(id=-100100, type=ChatType.SUPERGROUP)
+        target = FakeUser(id=77)
+        message = FakeMessage(
+            bot=bot,
+            chat=chat,
+            from_user=FakeUser(id=1),
+            text="/captcha_reset",
+            reply_to_message=FakeMessage(bot=bot, chat=chat, from_user=target),
+        )
+        challenge = {"id": 5, "question_id": 3}
+        question = {"id": 3, "correct_option": 1}
+        delete_verified = AsyncMock()
+        with patch(
+            "bot.handlers._get_lang_for_message", new=AsyncMock(return_value="en")
+        ), patch("bot.handlers._is_debug_admin", return_value=True), patch(
+            "bot.handlers.send_modlog", new=AsyncMock()
+        ), patch(
+            "bot.handlers.expire_active_challenges",
+            new=AsyncMock(side_effect=RuntimeError("db down")),
+        ), patch(
+            "bot.handlers.delete_verified_user", new=delete_verified
+        ), patch(
+            "bot.handlers.get_or_create_pending_challenge",
+            new=AsyncMock(return_value=(challenge, question)),
+        ), patch(
+            "bot.handlers._send_captcha_message", new=AsyncMock(return_value=9)
+        ), patch(
+            "bot.handlers.update_challenge_message_id", new=AsyncMock()
+        ):
+            await h.cmd_captcha_reset(message)
+        delete_verified.assert_awaited_once_with(chat.id, target.id)
+        bot.restrict_chat_member.assert_awaited_once()
+        message.answer.assert_awaited_once_with(
+            h.t("captcha_reset_sent", "en"), parse_mode=None
+        )
+
+
+class CaptchaSendErrorLoggingTests(unittest.IsolatedAsyncioTestCase):
+    async def _send_with_error(self, error: Exception) -> logging.LogRecord:
+        bot = FakeBot()
+        bot.send_message.side_effect = error
+        question = {"id": 3, "question_text": "2+2?", "option_a": "4"}
+        with self.assertLogs("bot.handlers", level="WARNING") as logs:
+            result = await h._send_captcha_message(
+                bot, -100100, challenge_id=11, question=question
+            )
+        self.assertIsNone(result)
+        return logs.records[0]
+
+    async def test_network_error_is_logged_without_traceback(self) -> None:
+        record = await self._send_with_error(
+            TelegramNetworkError(method=None, message="timeout")
+        )
+        self.assertFalse(record.exc_info)
+
+    async def test_unexpected_error_keeps_traceback(self) -> None:
+        record = await self._send_with_error(RuntimeError("boom"))
+        self.assertTrue(record.exc_info)
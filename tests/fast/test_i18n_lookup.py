@@ -0,0 +1,29 @@
+import unittest
+
+import i18n
+
+
+class I18nLookupTests(unittest.TestCase):
+    def test_language_value_wins(self) -> None:
+        self.assertEqual(i18n.TEXT["en"]["modlog_none"], i18n.t("modlog_none", "en"))
+
+    def test_unknown_language_falls_back_to_default(self) -> None:
+        self.assertEqual(
+            i18n.TEXT[i18n.DEFAULT_LANG]["modlog_none"], i18n.t("modlog_none", "xx")
+        )
+
+    def test_missing_key_marker(self) -> None:
+        key = "no.such.key"
+        self.assertEqual(f"[MISSING:{key}]", i18n.t(key, "en"))
+
+    def test_format_error_returns_template(self) -> None:
+        template = i18n.get_template("modlog_line", "en")
+        self.assertEqual(template, i18n.t("modlog_line", "en"))
+
+    def test_formatter_matches_t(self) -> None:
+        line = i18n.get_formatter("inactive_days_ago", "en")
+        self.assertEqual(i18n.t("inactive_days_ago", "en", days=3), line(days=3))
+
+    def test_formatter_error_returns_template(self) -> None:
+        template = i18n.get_template("modlog_line", "en")
+        self.assertEqual(template, i18n.get_formatter("modlog_line", "en")())
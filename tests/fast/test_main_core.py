@@ -223,3 +223,44 @@ class MainReminderTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(2, bot.send_message.await_count)
         set_state_mock.assert_awaited_once()
 
+
+
+class BotSessionTests(unittest.IsolatedAsyncioTestCase):
+    async def test_connector_uses_configured_keepalive(self) -> None:
+        with patch("main.TELEGRAM_HTTP_POOL_LIMIT", 7), patch(
+            "main.TELEGRAM_HTTP_KEEPALIVE_SECONDS", 42
+        ), patch("main.TCPConnector") as connector_cls, patch(
+            "main.ClientSession"
+        ) as client_cls:
+            client_cls.return_value.closed = False
+            session = main._build_bot_session()
+            client = await session.create_session()
+            self.assertIs(client, await session.create_session())
+        client_cls.assert_called_once()
+        kwargs = connector_cls.call_args.kwargs
+        self.assertEqual(7, kwargs["limit"])
+        self.assertEqual(42, kwargs["keepalive_timeout"])
+
+    async def test_session_is_closed_after_lifespan_shutdown(self) -> None:
+        events: list[str] = []
+        session = SimpleNamespace(
+            close=AsyncMock(side_effect=lambda: events.append("session_closed"))
+        )
+        dispatcher = SimpleNamespace(include_router=lambda router: None)
+        dispatcher.start_polling = AsyncMock()
+
+        @asynccontextmanager
+        async def fake_lifespan(dp):
+            yield
+            events.append("lifespan_exit")
+
+        with patch("main._ensure_required_config", return_value="token"), patch(
+            "main.Bot", return_value=SimpleNamespace(session=session)
+        ), patch("main.Dispatcher", return_value=dispatcher), patch(
+            "main.lifespan", new=fake_lifespan
+        ), patch("main.BOT", None):
+            await main.main()
+        self.assertFalse(
+            dispatcher.start_polling.await_args.kwargs["close_bot_session"]
+        )
+        self.assertEqual(["lifespan_exit", "session_closed"], events)
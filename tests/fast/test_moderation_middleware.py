@@ -73,6 +73,23 @@ class ModerationMiddlewareTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual("ok", result)
         handler.assert_awaited_once()
 
+    async def test_bypass_for_caption_command(self) -> None:
+        handler = AsyncMock(return_value="ok")
+        event = FakeMessage(
+            bot=self.bot,
+            chat=self.group_chat,
+            from_user=self.user,
+            caption="/start",
+        )
+        with patch("moderation_middleware.MODERATION_MW_ENABLED", True), patch.object(
+            mm, "Message", FakeMessage
+        ), patch.object(
+            handlers_module, "evaluate_moderation", new=AsyncMock()
+        ) as evaluate_mock:
+            result = await self.middleware(handler, event, {})
+        self.assertEqual("ok", result)
+        evaluate_mock.assert_not_awaited()
+
     async def test_bypass_for_missing_user(self) -> None:
         handler = AsyncMock(return_value="ok")
         event = self._message(from_user=None)